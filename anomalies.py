@@ -0,0 +1,232 @@
+import math
+import threading
+import time
+from collections import Counter, deque
+
+SPIKE = 'spike'
+DROP = 'drop'
+SILENCE = 'silence'
+
+
+class RateSeries:
+    """Records per interval for one (source, component, level), with an EWMA baseline"""
+
+    __slots__ = ('source_name', 'count', 'mean', 'var', 'samples', 'quiet', 'alerting')
+
+    def __init__(self, source_name):
+        self.source_name = source_name
+        self.count = 0      # records in the open interval
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0    # closed intervals folded into the baseline
+        self.quiet = 0      # consecutive empty intervals
+        self.alerting = None
+
+    def std(self):
+        # Never below the Poisson noise of the mean, so steady series do not
+        # alert on a handful of records
+        return max(math.sqrt(self.var), math.sqrt(self.mean), 1.0)
+
+    def z_score(self, count):
+        return (count - self.mean) / self.std()
+
+    def close(self, alpha):
+        """Fold the open interval into the baseline and start a new one"""
+        count, self.count = self.count, 0
+        diff = count - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + diff * increment)
+        self.samples += 1
+        self.quiet = self.quiet + 1 if count == 0 else 0
+        return count
+
+
+class AnomalyDetector:
+    """Flags spikes, drops and silent sources from per-interval record rates.
+
+    Every (source, component, level) and every source as a whole keeps one
+    RateSeries. Records only bump the open interval's counter; every
+    ``interval`` seconds each series is compared with its EWMA baseline and
+    folded into it, so state is one series per combination seen and updates
+    are constant time. Spikes are also checked as records arrive, so they
+    fire before their interval closes. Alerts go to every client as an
+    ``anomaly`` Socket.IO event and are kept for /api/insights, or, when
+    ``on_alert`` is set, are handed to it instead (an ingest worker sends
+    them over the bus and web workers pass them to ``add_alert``).
+    """
+
+    def __init__(self, socketio, interval=10, alpha=0.1, threshold=4.0, min_samples=12,
+                 min_count=10, drop_min_rate=20, silence_intervals=3, silence_min_rate=0.5, max_alerts=100):
+        self.socketio = socketio
+        self.interval = interval
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_samples = min_samples            # intervals before a series can alert
+        self.min_count = min_count                # records in an interval for a spike
+        self.drop_min_rate = drop_min_rate        # baseline needed to report a drop
+        self.silence_intervals = silence_intervals  # empty intervals before a source counts as silent
+        self.silence_min_rate = silence_min_rate    # baseline it needs while going quiet
+        self.lock = threading.Lock()
+        self.series = {}  # (source_id, component, level) -> RateSeries; (source_id, None, None) for a source
+        self.alerts = deque(maxlen=max_alerts)
+        self.last_close = None
+        self.started = False
+        self.on_alert = None
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.last_close = time.time()
+        self.socketio.start_background_task(self._run)
+
+    def add_records(self, source_id, records):
+        """Count a batch of ingested records towards the open interval"""
+        if not records:
+            return
+        self.start()
+        source_name = records[0].get('source_name') or source_id
+        batch = Counter((record.get('component') or 'Unknown', record['level']) for record in records)
+        batch[(None, None)] = len(records)
+        fired = []
+        with self.lock:
+            total = self.series.get((source_id, None, None))
+            # On a source with history, a combination never seen before has a baseline of zero
+            established = total is not None and self._ready(total)
+            for (component, level), count in batch.items():
+                key = (source_id, component, level)
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = RateSeries(source_name)
+                    if established:
+                        series.samples = self.min_samples
+                series.count += count
+                if component is None or series.alerting is not None or not self._ready(series):
+                    continue
+                if series.count >= self.min_count:
+                    z_score = series.z_score(series.count)
+                    if z_score >= self.threshold:
+                        fired.append(self._alert(SPIKE, key, series, series.count, series.mean, z_score))
+        self._emit(fired)
+
+    def remove_source(self, source_id):
+        """Forget a source's series, e.g. when it is stopped or paused on purpose"""
+        with self.lock:
+            for key in [key for key in self.series if key[0] == source_id]:
+                del self.series[key]
+
+    def _ready(self, series):
+        return series.samples >= self.min_samples
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error detecting anomalies: {str(e)}")
+
+    def tick(self, now=None):
+        """Close every series' interval (and any missed ones) and check it"""
+        now = time.time() if now is None else now
+        fired = []
+        with self.lock:
+            if self.last_close is None:
+                self.last_close = now
+            elapsed = int((now - self.last_close) // self.interval)
+            if elapsed < 1:
+                return []
+            self.last_close += elapsed * self.interval
+            # Intervals missed while the process stalled count as empty, up to a few
+            for _ in range(min(elapsed, self.silence_intervals + 1)):
+                for key, series in list(self.series.items()):
+                    alert = self._check(key, series)
+                    if alert:
+                        fired.append(alert)
+                    if series.mean < 0.05 and series.samples >= self.min_samples and not series.count:
+                        del self.series[key]  # gone quiet for good; keep state O(active series)
+        self._emit(fired)
+        return fired
+
+    def _check(self, key, series):
+        """Compare the interval being closed with the baseline; caller holds the lock"""
+        ready = self._ready(series)
+        count, expected = series.count, series.mean
+        z_score = series.z_score(count) if ready else 0.0
+        series.close(self.alpha)
+
+        kind = None
+        if ready:
+            if key[1] is None:
+                # Source totals: only silence, the per-component series cover the rest
+                if series.quiet >= self.silence_intervals and series.mean >= self.silence_min_rate:
+                    kind = SILENCE
+            elif z_score >= self.threshold and count >= self.min_count:
+                kind = SPIKE
+            elif z_score <= -self.threshold and series.mean >= self.drop_min_rate:
+                kind = DROP
+
+        if kind is None:
+            if abs(z_score) < self.threshold and not (key[1] is None and series.quiet):
+                series.alerting = None
+            return None
+        if series.alerting == kind:
+            return None
+        return self._alert(kind, key, series, count, expected, z_score)
+
+    def _alert(self, kind, key, series, count, expected, z_score):
+        source_id, component, level = key
+        series.alerting = kind
+        expected = round(expected, 1)
+        if kind == SILENCE:
+            message = (f"Source '{series.source_name}' stopped logging "
+                       f"({series.quiet * self.interval}s without records, ~{expected} expected per {self.interval}s)")
+            severity = 'high'
+        else:
+            what = f"{level} logs from '{component}' on '{series.source_name}'"
+            if kind == SPIKE:
+                message = f"Spike in {what}: {count} in {self.interval}s, ~{expected} expected"
+                severity = 'high' if level in ('ERROR', 'WARN') else 'medium'
+            else:
+                message = f"Drop in {what}: {count} in {self.interval}s, ~{expected} expected"
+                severity = 'medium'
+        alert = {
+            'type': f'rate_{kind}',
+            'message': message,
+            'severity': severity,
+            'source_id': source_id,
+            'component': component,
+            'level': level,
+            'count': count,
+            'expected': expected,
+            'z_score': round(z_score, 2),
+            'time': time.time()
+        }
+        self.alerts.append(alert)
+        return alert
+
+    def _emit(self, alerts):
+        for alert in alerts:
+            if self.on_alert:
+                self.on_alert(alert)
+            else:
+                self.socketio.emit('anomaly', alert)
+
+    def add_alert(self, alert):
+        """Keep and push an alert raised elsewhere"""
+        with self.lock:
+            self.alerts.append(alert)
+        self.socketio.emit('anomaly', alert)
+
+    def recent(self, seconds=900, limit=10):
+        """Newest alerts from the last ``seconds``"""
+        cutoff = time.time() - seconds
+        with self.lock:
+            alerts = [alert for alert in self.alerts if alert['time'] >= cutoff]
+        return alerts[::-1][:limit]
+
+    def stats(self):
+        with self.lock:
+            return {'series': len(self.series), 'alerts': len(self.alerts)}
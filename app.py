@@ -1,13 +1,35 @@
-from flask import Flask, render_template, jsonify, request, make_response, send_file
+from flask import Flask, Response, g, render_template, jsonify, request
 from flask_socketio import SocketIO
 import paramiko
+import atexit
+import os
+import signal
+import sys
 import threading
-import re
 import time
 import uuid
 from datetime import datetime
 from collections import deque
-import io
+from ssh_pool import SSHConnectionPool
+from log_tailer import COMPRESSION_MODES, FileCursor, IncrementalTailer, SSHFileTransport
+from log_parser import get_parser, timestamp_decoder
+from log_index import find_record, read_lines_around
+from downloads import CHUNK_SIZE, RangeNotSatisfiable, parse_range, prepend, stream_response
+from log_store import LogStore
+from insights import WINDOWS, InsightAggregator, LevelCounts, build_insights
+from fanout import LogFanout
+from search_index import SearchIndex, join_cursors, merge_pages, split_cursors
+from timeseries import TimeSeriesStore, per_bucket
+from log_templates import TemplateMiner, merge_top
+from anomalies import AnomalyDetector
+from parse_pool import ParsePool, RecordBatch
+from ingest_filter import IngestFilter
+from history import history_start, memory_page, parse_cursor, read_before
+from metrics import Registry
+from profiler import SamplingProfiler
+from ingest_engine import PAUSED, RUNNING, STOPPED, IngestEngine
+from checkpoint import Checkpointer, pack, unpack
+from bus import ACTION_STATES, BusClient
 
 app = Flask(__name__)
 socketio = SocketIO(app)
@@ -15,159 +37,516 @@ socketio = SocketIO(app)
 # Dictionary to store active log sources
 log_sources = {}
 
+# Shared SSH sessions, one authenticated transport per (host, username)
+ssh_pool = SSHConnectionPool()
+atexit.register(ssh_pool.close_all)
+
+# Batches records per source and delivers them to subscribed clients
+log_fanout = LogFanout(socketio)
+
+# Polls every source from one event loop with a bounded worker pool
+ingest_engine = IngestEngine(max_workers=int(os.environ.get('INGEST_WORKERS', 8)))
+
+# Running insight aggregates across every source
+insight_aggregator = InsightAggregator()
+
+# Per-source retention caps for the in-memory record store
+LOG_STORE_MAX_RECORDS = int(os.environ.get('LOG_STORE_MAX_RECORDS', 50000))
+LOG_STORE_MAX_BYTES = int(os.environ.get('LOG_STORE_MAX_BYTES', 16 * 1024 * 1024))
+
+def fetch_record(source_id, seq):
+    source = log_sources.get(source_id)
+    return source.logs.get(seq) if source else None
+
+def first_live_seq(source_id):
+    source = log_sources.get(source_id)
+    return source.logs.first_seq if source else None
+
+# Full-text index over every source's stored records
+search_index = SearchIndex(fetch_record, first_live_seq,
+                           max_bytes=int(os.environ.get('SEARCH_INDEX_MAX_BYTES', 256 * 1024 * 1024)))
+
+# Per-second/minute/hour record counts behind the activity chart
+timeseries_store = TimeSeriesStore()
+
+# Groups messages into templates for the patterns insight
+template_miner = TemplateMiner(max_templates=int(os.environ.get('MAX_LOG_TEMPLATES', 5000)))
+
+# Spikes, drops and silence in per-component rates, pushed as 'anomaly' events
+anomaly_detector = AnomalyDetector(socketio)
+
+# Worker processes that parse raw chunks when PARSE_WORKERS is set; 0 parses in this process
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0))
+parse_pool = ParsePool(PARSE_WORKERS) if PARSE_WORKERS > 0 else None
+
+# Sources and their ingestion state are checkpointed here every CHECKPOINT_INTERVAL
+# seconds and restored at startup; an empty CHECKPOINT_PATH turns this off
+CHECKPOINT_PATH = os.environ.get('CHECKPOINT_PATH', 'checkpoints.db')
+CHECKPOINT_INTERVAL = float(os.environ.get('CHECKPOINT_INTERVAL', 30))
+checkpointer = None  # opened by restore_log_sources() or run_ingest_worker()
+
+# 'standalone' polls sources and serves the UI in one process. Under cluster.py,
+# 'ingest' workers poll the sources the broker assigns them and publish what they
+# ingest on the bus at BUS_PATH, and 'web' workers serve the API and Socket.IO
+# clients from replicas fed by the bus
+APP_ROLE = os.environ.get('APP_ROLE', 'standalone')
+BUS_PATH = os.environ.get('BUS_PATH', 'log-analyzer.sock')
+bus = None  # BusClient of an ingest or web worker
+# Web workers: batches of a source that arrived before its snapshot did
+replica_backlog = {}
+
+# Prometheus metrics served on /metrics; counters are bumped once per poll, not per line
+metrics = Registry()
+SOURCE_LABELS = ('source_id', 'source')
+lines_read = metrics.counter('log_analyzer_lines_read_total', 'Log lines read', SOURCE_LABELS)
+bytes_read = metrics.counter('log_analyzer_bytes_read_total', 'Log bytes turned into records', SOURCE_LABELS)
+records_parsed = metrics.counter('log_analyzer_records_parsed_total', 'Records parsed', SOURCE_LABELS)
+unparsed_lines = metrics.counter('log_analyzer_unparsed_lines_total',
+                                 'Lines read that belong to no record', SOURCE_LABELS)
+parse_errors = metrics.counter('log_analyzer_parse_errors_total', 'Records that failed processing', SOURCE_LABELS)
+dedup_checks = metrics.counter('log_analyzer_dedup_checks_total', 'Records checked for duplicates', SOURCE_LABELS)
+dedup_hits = metrics.counter('log_analyzer_dedup_hits_total', 'Records dropped as duplicates', SOURCE_LABELS)
+filtered_records = metrics.counter('log_analyzer_filtered_records_total',
+                                   'Records dropped by the ingest filter, on the host or here', SOURCE_LABELS)
+context_lookups = metrics.counter('log_analyzer_context_lookups_total',
+                                  'Context line lookups, by whether the sparse index found the record', ('result',))
+stage_seconds = metrics.histogram('log_analyzer_ingest_stage_seconds',
+                                  'Time per poll spent in each ingest stage', ('stage',))
+request_seconds = metrics.histogram('log_analyzer_http_request_seconds',
+                                    'Time to produce a response, per route', ('method', 'route', 'status'))
+
+# The rest is read from state the app already keeps, at scrape time
+def collect_ingest_lag():
+    now = datetime.now()
+    for source in list(log_sources.values()):
+        if source.last_log_time:
+            yield (source.id, source.name), (now - source.last_log_time).total_seconds()
+
+def collect_poll_errors():
+    for job in list(ingest_engine.jobs.values()):
+        yield (job.key, job.name), job.errors
+
+def collect_wire_bytes():
+    for source in list(log_sources.values()):
+        yield (source.id, source.name), source.tailer.transport.stats.wire_bytes
+
+metrics.gauge('log_analyzer_ingest_lag_seconds', 'Seconds since the newest record seen from a source',
+              SOURCE_LABELS, collect=collect_ingest_lag)
+metrics.counter('log_analyzer_wire_bytes_total', 'Bytes received over SSH', SOURCE_LABELS,
+                collect=collect_wire_bytes)
+metrics.counter('log_analyzer_poll_errors_total', 'Polls that failed', SOURCE_LABELS,
+                collect=collect_poll_errors)
+metrics.gauge('log_analyzer_emit_queue_depth', 'Socket.IO frames waiting to be sent',
+              collect=lambda: [((), log_fanout.queue_depth())])
+metrics.gauge('log_analyzer_ingest_in_flight', 'Polls running on the ingest workers',
+              collect=lambda: [((), ingest_engine.stats()['in_flight'])])
+
+def collect_ssh_pool(field):
+    return lambda: [((target,), values[field]) for target, values in ssh_pool.stats().items()]
+
+metrics.gauge('log_analyzer_ssh_sessions', 'Pooled SSH sessions per user@host', ('target',),
+              collect=collect_ssh_pool('sessions'))
+metrics.gauge('log_analyzer_ssh_channels', 'Channels open on the pooled SSH sessions', ('target',),
+              collect=collect_ssh_pool('channels'))
+metrics.gauge('log_analyzer_ssh_session_received_bytes', 'Bytes received by the open pooled SSH sessions',
+              ('target',), collect=collect_ssh_pool('bytes_received'))
+
+# Stacks of the ingest workers, sampled while switched on through /api/profiler
+ingest_profiler = SamplingProfiler(thread_prefixes=('ingest_',))
+
 class LogSource:
-    def __init__(self, name, host, username, password, log_path):
-        self.id = str(uuid.uuid4())
+    def __init__(self, name, host, username, password, log_path, log_format='log4j', pattern=None,
+                 timestamp_format=None, transport=None, compression='none', ingest_filter=None, source_id=None):
+        self.id = source_id or str(uuid.uuid4())
         self.name = name
         self.host = host
         self.username = username
         self.password = password
         self.log_path = log_path
+        self.log_format = log_format or 'log4j'
+        self.pattern = pattern
+        self.timestamp_format = timestamp_format
+        self.parser = get_parser(self.log_format, pattern, timestamp_format)
+        self.compression = compression or 'none'
+        if self.compression not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown compression '{self.compression}'. Use one of: {', '.join(COMPRESSION_MODES)}")
         self.active = True
-        self.connection = None
-        self.thread = None
-        self.last_check = time.time()
+        self.tailer = IncrementalTailer(transport or SSHFileTransport(self, self.compression), log_path)
+        self.set_filter(ingest_filter)
+        self.records_ingested = 0
+        self.started_at = time.time()
         self.processed_logs = deque(maxlen=1000)  # Keep track of last 1000 processed logs
+        self.processed_hashes = set()  # the same hashes, for O(1) lookups
         self.last_log_time = None
-        self.logs = []  # Store logs for AI insights
+        # Bounded columnar store of recent logs for AI insights
+        self.logs = LogStore(max_records=LOG_STORE_MAX_RECORDS, max_bytes=LOG_STORE_MAX_BYTES,
+                             defaults={'source_id': self.id, 'source_name': self.name})
+        self.insights = InsightAggregator()
+        # Held while a poll moves records, dedup state and read offsets together
+        self.lock = threading.Lock()
+        self.batches = 0  # batches published on the bus, so replicas can skip ones they have
+        self.remote_state = None  # state reported by the owning ingest worker, in web workers
+
+    @property
+    def state(self):
+        if self.remote_state is not None:
+            return self.remote_state
+        return ingest_engine.state(self.id)
 
-    def start_monitoring(self):
-        if self.thread is None or not self.thread.is_alive():
+    def start_monitoring(self, paused=False):
+        if paused:
+            # Restored as paused: registered, but not polled until resumed
+            ingest_engine.add(self.id, lambda: poll_log_file(self.id), self.name, PAUSED)
+        elif self.state != RUNNING:
             self.active = True
-            self.thread = threading.Thread(target=tail_log_file, args=(self.id,))
-            self.thread.daemon = True
-            self.thread.start()
+            if self.state == PAUSED:
+                ingest_engine.resume(self.id)
+            else:
+                ingest_engine.add(self.id, lambda: poll_log_file(self.id), self.name)
+
+    def exec_command(self, command, timeout=None):
+        """Run a command on this source's host over a pooled channel"""
+        return ssh_pool.exec_command(self.host, self.username, self.password, command, timeout=timeout,
+                                     compress=self.compression == 'ssh')
 
     def stop_monitoring(self):
+        """Stop polling; a later start follows the files from their end again"""
         self.active = False
-        if self.connection:
-            try:
-                self.connection.close()
-            except:
-                pass
-            self.connection = None
+        # A poll may still be reading; forget positions only once it returned
+        ingest_engine.remove(self.id, then=self.tailer.reset)
+        anomaly_detector.remove_source(self.id)
+
+    def pause_monitoring(self):
+        """Stop polling but keep file positions, so resuming catches up"""
+        ingest_engine.pause(self.id)
+        anomaly_detector.remove_source(self.id)  # quiet on purpose, not silent
+
+    def record_logs(self, batch):
+        """Keep a RecordBatch of newly ingested records and fold its counts into the aggregates"""
+        records = batch.records
+        seqs = [self.logs.append(record) for record in records]
+        search_index.add(self.id, records, seqs)
+        template_miner.add_records(records)
+        anomaly_detector.add_records(self.id, records)
+        self.record_counts(len(records), batch.levels, batch.series)
+
+    def record_counts(self, count, levels, series):
+        """Fold a batch's counts into the aggregates; all a web worker keeps of the records"""
+        self.records_ingested += count
+        timeseries_store.add_grouped(self.id, series)
+        self.insights.add_grouped(levels)
+        insight_aggregator.add_grouped(levels)
+
+    def forget(self, handed_over=False):
+        """Drop this source's contribution to the global insights and live streams.
+
+        A source handed over to another ingest worker keeps its checkpoint.
+        """
+        insight_aggregator.subtract(self.insights)
+        timeseries_store.remove_source(self.id)
+        metrics.forget(self.id)
+        log_fanout.remove_source(self.id)
+        if checkpointer and not handed_over:
+            checkpointer.delete(self.id)
+        # The last source on a host lets its pooled SSH sessions go
+        if not any(other.host == self.host and other.username == self.username
+                   for other in list(log_sources.values()) if other is not self):
+            ssh_pool.close(self.host, self.username)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'host': self.host,
+            'log_path': self.log_path,
+            'log_format': self.log_format,
+            'compression': self.compression,
+            'filter': self.ingest_filter.to_dict() if self.ingest_filter else None,
+            'state': self.state
+        }
+
+    def ingest_stats(self):
+        """Throughput and bytes on the wire vs. decoded, to compare transport modes"""
+        stats = self.tailer.transport.stats.to_dict()
+        elapsed = time.time() - self.started_at
+        stats['records'] = self.records_ingested
+        stats['records_per_second'] = round(self.records_ingested / elapsed, 2) if elapsed > 0 else 0
+        return stats
+
+    def set_filter(self, ingest_filter):
+        """Apply an IngestFilter (or None) from the next poll on; earlier records stay"""
+        self.ingest_filter = ingest_filter
+        self.tailer.remote_filter = ingest_filter.remote_script(self.log_format) if ingest_filter else None
+
+    def parse_chunk(self, data, final=False):
+        """The parser's batch API returning a RecordBatch, run on the parse pool when there is one"""
+        if parse_pool:
+            return parse_pool.parse_chunk(self.parser, (self.log_format, self.pattern, self.timestamp_format),
+                                          data, final)
+        records, consumed = self.parser.parse_chunk(data, final)
+        return RecordBatch.from_records(records), consumed
+
+    def checkpoint_config(self):
+        """What it takes to create this source again after a restart"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'host': self.host,
+            'username': self.username,
+            'password': self.password,
+            'log_path': self.log_path,
+            'log_format': self.log_format,
+            'pattern': self.pattern,
+            'timestamp_format': self.timestamp_format,
+            'compression': self.compression,
+            'filter': self.ingest_filter.to_dict() if self.ingest_filter else None,
+            'state': self.state
+        }
+
+    def checkpoint_signature(self):
+        """Changes whenever there is something new to checkpoint"""
+        cursors = tuple((c.path, c.inode, c.offset) for c in list(self.tailer.cursors.values()))
+        return self.records_ingested, cursors, self.tailer.primed, repr(self.checkpoint_config())
+
+    def checkpoint_state(self, records=True):
+        """Read positions, dedup state, stored records and rollups as checkpoint.pack sections.
+
+        Without ``records`` the stored records are left out, as web workers do not keep them.
+        """
+        with self.lock:
+            cursors = list(self.tailer.cursors.values())
+            sections = {
+                'tailer': ({
+                    'primed': self.tailer.primed,
+                    'cursors': [{'path': c.path, 'inode': c.inode, 'offset': c.offset, 'size': c.size,
+                                 'line': c.line} for c in cursors]
+                }, []),
+                'source': ({
+                    'records_ingested': self.records_ingested,
+                    'batches': self.batches,
+                    'last_log_time': self.last_log_time.isoformat() if self.last_log_time else None,
+                    'dedup': list(self.processed_logs),
+                    'insights': self.insights.snapshot().to_dict()
+                }, []),
+                'timeseries': timeseries_store.export_source(self.id)
+            }
+            if records:
+                sections['store'] = self.logs.export()
+            for i, cursor in enumerate(cursors):
+                sections[f'index.{i}'] = cursor.index.export()
+        return sections
+
+    def restore_state(self, sections):
+        """Put back what checkpoint_state saved; polling then resumes at the saved offsets"""
+        tailer, _ = sections['tailer']
+        cursors = {}
+        for i, saved in enumerate(tailer['cursors']):
+            cursor = FileCursor(saved['path'], saved['inode'], saved['offset'])
+            cursor.size = saved['size']
+            cursor.line = saved['line']
+            cursor.index.load(*sections[f'index.{i}'])
+            cursors[cursor.path] = cursor
+        self.tailer.cursors = cursors
+        self.tailer.primed = tailer['primed']
+
+        saved, _ = sections['source']
+        self.records_ingested = saved['records_ingested']
+        self.batches = saved.get('batches', 0)
+        if saved['last_log_time']:
+            self.last_log_time = datetime.fromisoformat(saved['last_log_time'])
+        for log_hash in saved['dedup']:
+            self.is_duplicate_log(log_hash)
+        counts = LevelCounts.from_dict(saved['insights'])
+        self.insights.add_counts(counts)
+        insight_aggregator.add_counts(counts)
+
+        # Search postings and templates are rebuilt from the restored records
+        if 'store' in sections:
+            self.logs.load(*sections['store'])
+            records = list(self.logs.iter_records())
+            search_index.add(self.id, records, [record['seq'] for record in records])
+            template_miner.add_records(records)
+        timeseries_store.load_source(self.id, *sections['timeseries'])
+
+    def move_to(self, position):
+        """Continue from the read positions a previous owner last published on the bus.
+
+        Bytes between the restored checkpoint and those positions are read
+        again, to rebuild this worker's records, dedup state and rollups, but
+        not published: the web workers have them already. Files the
+        checkpoint does not follow at the same inode start at the position.
+        """
+        with self.lock:
+            self.batches = max(self.batches, position['batches'])
+            for path, (inode, offset, size, line) in position['cursors'].items():
+                cursor = self.tailer.cursors.get(path)
+                if cursor is not None and cursor.inode == inode:
+                    if cursor.offset < offset:
+                        cursor.replay_until = offset
+                    continue
+                cursor = self.tailer.cursors[path] = FileCursor(path, inode, offset)
+                cursor.size, cursor.line = size, line
+            self.tailer.primed = True
 
     def is_duplicate_log(self, log_hash):
         """Check if this log has been processed recently"""
-        if log_hash in self.processed_logs:
+        if log_hash in self.processed_hashes:
             return True
+        if len(self.processed_logs) == self.processed_logs.maxlen:
+            # The deque only orders the window; it drops the oldest hash on append
+            self.processed_hashes.discard(self.processed_logs[0])
         self.processed_logs.append(log_hash)
+        self.processed_hashes.add(log_hash)
         return False
 
-def parse_log_line(line):
-    try:
-        # Example log format: 2024-01-19T19:41:56,123 INFO [main] com.example.Class - Message
-        pattern = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2},\d{3})\s+(\w+)\s+\[([^\]]+)\]\s+([^\s-]+)\s*-\s*(.+)'
-        match = re.match(pattern, line)
-        
-        if match:
-            timestamp, level, thread, component, message = match.groups()
-            return {
-                'timestamp': timestamp,
-                'level': level,
-                'thread': thread,
-                'component': component,
-                'message': message.strip()
-            }
-    except Exception as e:
-        print(f"Error parsing log line: {str(e)}")
-    return None
-
-def get_log_hash(log):
-    """Create a unique hash for a log entry"""
-    if not log:
-        return None
-    return f"{log['timestamp']}:{log['level']}:{log['component']}:{log['message']}"
+def poll_log_file(source_id: str):
+    """Ingest whatever was appended since the last poll.
 
-def tail_log_file(source_id: str):
+    Returns (records ingested, bytes still pending, backlogged) for the engine.
+    """
     source = log_sources.get(source_id)
-    if not source:
-        return
+    if not source or not source.active:
+        return 0, False, False
 
-    while source.active:
-        try:
-            if not source.connection:
-                source.connection = paramiko.SSHClient()
-                source.connection.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                source.connection.connect(source.host, username=source.username, password=source.password)
-            
-            # Get new logs since last check
-            current_time = time.time()
-            time_diff = int(current_time - source.last_check + 1)
-            cmd = f"find {source.log_path} -newermt '-{time_diff} seconds' -exec tail -n +1 {{}} \\;"
-            stdin, stdout, stderr = source.connection.exec_command(cmd)
-            
-            current_log = ''
-            for line in stdout:
-                if not source.active:
-                    break
-                    
+    total = 0
+    ingest_filter = source.ingest_filter
+    labels = (source_id, source.name)
+    transfer = source.tailer.transport.stats
+    read_seconds = transfer.seconds
+    tailer_seconds = dedup_seconds = emit_seconds = 0.0
+    started = time.perf_counter()
+    # Only bytes appended since the last poll come over the wire; errors
+    # propagate to the engine, which backs off and retries this source.
+    # Batches carry dedup hashes and counts, worked out on the parse workers
+    # when there are any
+    for cursor, batch, consumed in source.tailer.poll_records(source.parse_chunk, source.parser.parse_chunk):
+        if not source.active:
+            break
+        dedup_started = time.perf_counter()
+        tailer_seconds += dedup_started - started
+
+        records = batch.records
+        pending_lines, filtered_lines = cursor.pending_lines, cursor.filtered_lines
+        filtered = cursor.filtered_records
+        rejected = 0
+
+        newest = 0
+        new_logs = []
+        duplicates = errors = 0
+        # Dedup state, stored records and the cursor move together, as checkpoints see them
+        with source.lock:
+            for parsed_log, log_hash in zip(records, batch.hashes):
                 try:
-                    line = line.strip()
-                    if not line:
+                    # Authoritative re-check; a remote filter may let extra records through
+                    if ingest_filter and not ingest_filter.matches(parsed_log):
+                        rejected += 1
+                        batch.discard(parsed_log)
+                        continue
+                    # Check if this is a new log entry
+                    if source.is_duplicate_log(log_hash):
+                        duplicates += 1
+                        batch.discard(parsed_log)
                         continue
-                        
-                    if re.match(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2},\d{3}', line):
-                        if current_log:
-                            parsed_log = parse_log_line(current_log)
-                            if parsed_log:
-                                # Check if this is a new log entry
-                                log_hash = get_log_hash(parsed_log)
-                                if log_hash and not source.is_duplicate_log(log_hash):
-                                    # Check if log is newer than last processed log
-                                    log_time = datetime.strptime(parsed_log['timestamp'], '%Y-%m-%dT%H:%M:%S,%f')
-                                    if not source.last_log_time or log_time > source.last_log_time:
-                                        source.last_log_time = log_time
-                                        parsed_log['source_id'] = source_id
-                                        parsed_log['source_name'] = source.name
-                                        socketio.emit('log_update', parsed_log)
-                                        source.logs.append(parsed_log)
-                        current_log = line
-                    else:
-                        current_log += '\n' + line
+                    newest = max(newest, parsed_log['epoch_ms'])
+                    parsed_log['source_id'] = source_id
+                    parsed_log['source_name'] = source.name
+                    new_logs.append(parsed_log)
                 except Exception as e:
+                    errors += 1
+                    batch.discard(parsed_log)
                     print(f"Error processing line from {source.name}: {str(e)}")
                     continue
-            
-            # Process the last log entry if exists
-            if current_log:
-                parsed_log = parse_log_line(current_log)
-                if parsed_log:
-                    log_hash = get_log_hash(parsed_log)
-                    if log_hash and not source.is_duplicate_log(log_hash):
-                        log_time = datetime.strptime(parsed_log['timestamp'], '%Y-%m-%dT%H:%M:%S,%f')
-                        if not source.last_log_time or log_time > source.last_log_time:
-                            source.last_log_time = log_time
-                            parsed_log['source_id'] = source_id
-                            parsed_log['source_name'] = source.name
-                            socketio.emit('log_update', parsed_log)
-                            source.logs.append(parsed_log)
-            
-            source.last_check = current_time
-            time.sleep(1)  # Wait 1 second before checking for new logs
-                    
-        except Exception as e:
-            print(f"SSH connection error for {source.name}: {str(e)}")
-            time.sleep(5)
-        finally:
-            if source.connection:
-                source.connection.close()
-                source.connection = None
+
+            emit_started = time.perf_counter()
+            dedup_seconds += emit_started - dedup_started
+            source.record_logs(RecordBatch(new_logs, None, batch.levels, batch.series))
+            # Taken over from a crashed owner: records up to its last batch only rebuild local state
+            replayed = cursor.replaying
+            samples = cursor.index.samples_from(cursor.offset) if bus else None
+            cursor.advance(consumed)
+            if replayed:
+                new_logs = []
+                if not cursor.replaying:
+                    cursor.replay_until = None
+            elif bus:
+                # Sent under the lock, so batches leave in order and snapshots line up with them
+                source.batches += 1
+                # Counts go along so web workers keep their aggregates without going over the records
+                bus.send({'type': 'batch', 'source_id': source_id, 'batch': source.batches, 'records': new_logs,
+                          'newest': newest,
+                          'levels': [[level, component, count] for (level, component), count in batch.levels.items()],
+                          'series': [list(key) + [count] for key, count in per_bucket(batch.series).items()],
+                          'cursor': [cursor.path, cursor.inode, cursor.offset, cursor.size, cursor.line],
+                          'samples': samples})
+        log_fanout.publish(source_id, new_logs)
+        started = time.perf_counter()
+        emit_seconds += started - emit_started
+
+        total += len(new_logs)
+        log_time = datetime.fromtimestamp(newest / 1000) if newest else None
+        if log_time and (not source.last_log_time or log_time > source.last_log_time):
+            source.last_log_time = log_time
+
+        record_lines = len(records) + sum(record['message'].count('\n') for record in records)
+        lines_read.inc(labels, pending_lines)
+        unparsed_lines.inc(labels, max(0, pending_lines - record_lines - filtered_lines))
+        bytes_read.inc(labels, consumed)
+        records_parsed.inc(labels, len(records))
+        dedup_checks.inc(labels, len(records) - rejected)
+        if filtered + rejected:
+            filtered_records.inc(labels, filtered + rejected)
+        if duplicates:
+            dedup_hits.inc(labels, duplicates)
+        if errors:
+            parse_errors.inc(labels, errors)
+    tailer_seconds += time.perf_counter() - started
+
+    # Reads happen inside the tailer; whatever else it spent is framing and parsing
+    read_seconds = transfer.seconds - read_seconds
+    stage_seconds.observe(('read',), read_seconds)
+    if tailer_seconds > read_seconds or total:
+        stage_seconds.observe(('parse',), max(0.0, tailer_seconds - read_seconds))
+        stage_seconds.observe(('dedup',), dedup_seconds)
+        stage_seconds.observe(('emit',), emit_seconds)
+
+    # Keep reading without a pause while a large backlog drains
+    return total, source.tailer.pending, source.tailer.backlogged
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_seconds.observe((request.method, route, response.status_code), time.perf_counter() - started)
+    return response
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Start streaming log_batch frames for the given sources to this client"""
+    source_ids = [source_id for source_id in (data or {}).get('source_ids', []) if source_id in log_sources]
+    log_fanout.subscribe(request.sid, source_ids)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    log_fanout.unsubscribe(request.sid, (data or {}).get('source_ids', []))
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    log_fanout.disconnect(request.sid)
+
 @app.route('/api/log-sources', methods=['GET'])
 def get_log_sources():
     sources = []
     for source_id, source in log_sources.items():
-        sources.append({
-            'id': source.id,
-            'name': source.name,
-            'host': source.host,
-            'log_path': source.log_path
-        })
+        sources.append(source.to_dict())
     return jsonify(sources)
 
 @app.route('/api/log-sources', methods=['POST'])
@@ -179,35 +558,115 @@ def add_log_source():
             host=data['host'],
             username=data['username'],
             password=data['password'],
-            log_path=data['log_path']
+            log_path=data['log_path'],
+            log_format=data.get('log_format', 'log4j'),
+            pattern=data.get('pattern'),
+            timestamp_format=data.get('timestamp_format'),
+            compression=data.get('compression', 'none'),
+            ingest_filter=IngestFilter.from_dict(data.get('filter'))
         )
         
         # Stop and remove any existing source with the same host and path
         for existing_id, existing_source in list(log_sources.items()):
             if existing_source.host == source.host and existing_source.log_path == source.log_path:
-                existing_source.stop_monitoring()
-                del log_sources[existing_id]
+                drop_log_source(existing_source)
         
         log_sources[source.id] = source
-        source.start_monitoring()
+        if bus:
+            # A web worker: the broker hands the source to an ingest worker
+            source.remote_state = RUNNING
+            replica_backlog[source.id] = []
+            bus.send({'type': 'add', 'config': source.checkpoint_config()})
+        else:
+            source.start_monitoring()
         
-        return jsonify({
-            'id': source.id,
-            'name': source.name,
-            'host': source.host,
-            'log_path': source.log_path
-        })
+        return jsonify(source.to_dict())
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/log-sources/<source_id>/stats', methods=['GET'])
+def get_log_source_stats(source_id):
+    source = log_sources.get(source_id)
+    if not source:
+        return jsonify({'error': 'Source not found'}), 404
+    stats = source.ingest_stats()
+    stats['compression'] = source.compression
+    return jsonify(stats)
+
+@app.route('/api/log-sources/<source_id>', methods=['PATCH'])
+def update_log_source(source_id):
+    source = log_sources.get(source_id)
+    if not source:
+        return jsonify({'error': 'Source not found'}), 404
+
+    data = request.json or {}
+    action = data.get('action')
+    if action not in ('start', 'resume', 'stop', 'pause') and not (action is None and 'filter' in data):
+        return jsonify({'error': "Action must be one of: start, stop, pause, resume"}), 400
+    if 'filter' in data:
+        # Takes effect on the next poll, without restarting the source
+        try:
+            source.set_filter(IngestFilter.from_dict(data['filter']))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+
+    if bus:
+        # A web worker: the owning ingest worker applies the change and reports the new state
+        command = {'type': 'command', 'source_id': source_id, 'action': action}
+        if 'filter' in data:
+            command['filter'] = data['filter']
+        bus.send(command)
+        source.remote_state = ACTION_STATES.get(action, source.remote_state)
+    else:
+        control_log_source(source, action)
+    return jsonify(source.to_dict())
+
 @app.route('/api/log-sources/<source_id>', methods=['DELETE'])
 def remove_log_source(source_id):
     source = log_sources.get(source_id)
     if source:
-        source.stop_monitoring()
-        del log_sources[source_id]
+        drop_log_source(source)
         return '', 204
     return jsonify({'error': 'Source not found'}), 404
+
+def control_log_source(source, action):
+    if action in ('start', 'resume'):
+        source.start_monitoring()
+    elif action == 'stop':
+        source.stop_monitoring()
+    elif action == 'pause':
+        source.pause_monitoring()
+
+def drop_log_source(source):
+    """Stop and forget a source, on its ingest worker too when this is a web worker"""
+    source.stop_monitoring()
+    source.forget()
+    log_sources.pop(source.id, None)
+    replica_backlog.pop(source.id, None)
+    if bus:
+        bus.send({'type': 'remove', 'source_id': source.id})
+def read_indexed_context(source, timestamp, direction, lines):
+    """Context lines via the sparse index: b'' if not found, None if a scan is needed"""
+    try:
+        epoch_ms = timestamp_decoder.decode_iso(timestamp)
+    except (ValueError, IndexError):
+        return None
+    cursor = source.tailer.cursor_for(epoch_ms)
+    if cursor is None:
+        context_lookups.inc(('scan',))
+        return None
+    transport = source.tailer.transport
+    found = find_record(transport, cursor, source.parser.parse_chunk, epoch_ms)
+    if found is None:
+        context_lookups.inc(('scan',))
+        return None
+    offset, line = found
+    if offset is None:
+        context_lookups.inc(('not_found',))
+        return b''
+    context_lookups.inc(('hit',))
+    return read_lines_around(transport, cursor, offset, direction, lines)
+
 # Updated route handlers for downloading logs
 # Replace these two route handlers with the following combined handler
 @app.route('/api/logs/<source_id>/<direction>', methods=['POST'])
@@ -222,27 +681,29 @@ def get_log_lines(source_id, direction):
             return jsonify({'error': 'No request data provided'}), 400
             
         timestamp = data.get('timestamp')
-        lines = data.get('lines', 1000)
-        
+        try:
+            # Goes into the index read size and the grep fallback's shell command
+            lines = min(max(1, int(data.get('lines', 1000))), 10000)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'lines must be an integer'}), 400
+
         if not timestamp:
             return jsonify({'error': 'Timestamp is required'}), 400
         
         print(f"Processing {direction} logs request for source {source_id} at timestamp {timestamp}")
-        
-        # Establish SSH connection with timeout
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            source.host,
-            username=source.username,
-            password=source.password,
-            timeout=10
-        )
-        
-        # Find the line with the timestamp
+        filename = f'{direction}_logs_{timestamp.replace(":", "-")}.txt'
+        accept_encoding = request.headers.get('Accept-Encoding')
+
+        log_content = read_indexed_context(source, timestamp, direction, lines)
+        if log_content is not None:
+            if not log_content:
+                return jsonify({'error': 'Timestamp not found in log file'}), 404
+            return stream_response(iter([log_content]), filename, accept_encoding)
+
+        # Not indexed yet: find the line with the timestamp
         find_cmd = f"grep -n '{timestamp}' {source.log_path} | head -n 1 | cut -d ':' -f 1"
-        stdin, stdout, stderr = ssh.exec_command(find_cmd)
-        line_number = stdout.read().decode().strip()
+        with source.exec_command(find_cmd, timeout=10) as find:
+            line_number = find.stdout.read().decode().strip()
         
         if not line_number:
             return jsonify({'error': 'Timestamp not found in log file'}), 404
@@ -263,30 +724,19 @@ def get_log_lines(source_id, direction):
         else:
             cmd = f"tail -n +{line_number} {source.log_path} | head -n {lines}"
             
-        stdin, stdout, stderr = ssh.exec_command(cmd)
-        
-        # Read log content with timeout
-        log_content = stdout.read()
-        error_content = stderr.read()
-        
-        if error_content:
-            print(f"Error from command: {error_content.decode()}")
-            return jsonify({'error': 'Error reading log file'}), 500
-            
-        if not log_content:
+        read = source.exec_command(cmd, timeout=10)
+        # Stream the output; only the first chunk is read up front to catch errors
+        chunks = read.iter_stdout(CHUNK_SIZE)
+        first = next(chunks, b'')
+        if not first:
+            error_content = read.stderr.read()
+            read.close()
+            if error_content:
+                print(f"Error from command: {error_content.decode()}")
+                return jsonify({'error': 'Error reading log file'}), 500
             return jsonify({'error': 'No logs found in the specified range'}), 404
-        
-        # Create file-like object
-        log_file = io.BytesIO(log_content)
-        
-        # Return file download response
-        return send_file(
-            log_file,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=f'{direction}_logs_{timestamp.replace(":", "-")}.txt',
-            max_age=0
-        )
+
+        return stream_response(prepend(first, chunks), filename, accept_encoding)
         
     except paramiko.SSHException as e:
         print(f"SSH error: {str(e)}")
@@ -294,12 +744,6 @@ def get_log_lines(source_id, direction):
     except Exception as e:
         print(f"Error processing {direction} logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'ssh' in locals():
-            try:
-                ssh.close()
-            except:
-                pass
 @app.route('/api/logs/<source_id>/download', methods=['GET'])
 def download_full_logs(source_id):
     source = log_sources.get(source_id)
@@ -307,236 +751,536 @@ def download_full_logs(source_id):
         return jsonify({'error': 'Source not found'}), 404
     
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(source.host, username=source.username, password=source.password)
-        
-        # Use cat instead of reading the file directly to handle large files
-        stdin, stdout, stderr = ssh.exec_command(f'cat {source.log_path}')
-        
-        # Read the output in chunks
-        log_content = stdout.read()
-        
-        if not log_content:
+        # Sizes first, so the response can carry a length and serve byte ranges
+        transport = source.tailer.transport
+        files = [(path, size) for path, _, size in transport.stat(source.log_path)]
+        size = sum(file_size for _, file_size in files)
+        if not size:
             return jsonify({'error': 'Log file is empty or unreadable'}), 400
-            
-        # Create response with appropriate headers
-        response = make_response(log_content)
-        response.headers['Content-Type'] = 'text/plain'
-        response.headers['Content-Disposition'] = f'attachment; filename=logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-        return response
-        
+
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            return jsonify({'error': 'Requested range not satisfiable'}), 416, {'Content-Range': f'bytes */{size}'}
+        start, end = byte_range or (0, size - 1)
+
+        # Streamed in fixed-size chunks; nothing is buffered beyond one chunk
+        chunks = transport.stream(files, start, end - start + 1, CHUNK_SIZE)
+        filename = f'logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
+        return stream_response(chunks, filename, request.headers.get('Accept-Encoding'), size, byte_range)
+
     except Exception as e:
         print(f"Error downloading full logs: {str(e)}")  # Server-side logging
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'ssh' in locals():
-            ssh.close()
 
 @app.route('/api/logs/<source_id>', methods=['GET'])
 def get_initial_logs(source_id):
+    """Newest-first pages of a source's history.
+
+    Served from the in-memory store; only once a page reaches past its
+    oldest record is the rest read from the log file, backwards from there.
+    """
     source = log_sources.get(source_id)
     if not source:
         return jsonify({'error': 'Source not found'}), 404
-    
+
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(source.host, username=source.username, password=source.password)
-        
-        # Get last 100 lines of logs
-        cmd = f"tail -n 100 {source.log_path}"
-        stdin, stdout, stderr = ssh.exec_command(cmd)
-        
-        logs = []
-        current_log = ''
-        
-        for line in stdout:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if re.match(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2},\d{3}', line):
-                if current_log:
-                    parsed_log = parse_log_line(current_log)
-                    if parsed_log:
-                        log_hash = get_log_hash(parsed_log)
-                        if log_hash and not source.is_duplicate_log(log_hash):
-                            parsed_log['source_id'] = source_id
-                            parsed_log['source_name'] = source.name
-                            logs.append(parsed_log)
-                current_log = line
-            else:
-                current_log += '\n' + line
-        
-        # Process the last log entry
-        if current_log:
-            parsed_log = parse_log_line(current_log)
-            if parsed_log:
-                log_hash = get_log_hash(parsed_log)
-                if log_hash and not source.is_duplicate_log(log_hash):
-                    parsed_log['source_id'] = source_id
-                    parsed_log['source_name'] = source.name
-                    logs.append(parsed_log)
-        
-        # Sort logs by timestamp
-        logs.sort(key=lambda x: x['timestamp'], reverse=True)
-        return jsonify(logs)
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        ssh.close()
+        limit = min(max(1, int(request.args.get('limit', 100))), 1000)
+        cursor = request.args.get('cursor')
+        position = parse_cursor(cursor) if cursor else ('memory', None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if bus:
+        # A web worker: the ingest worker that owns the source keeps its records
+        try:
+            page = next(iter(query_ingest('logs', source_id=source_id, cursor=cursor, limit=limit).values()), None)
+        except IngestQueryError as e:
+            return jsonify({'error': e.message}), e.status
+        if page is None:
+            return jsonify({'error': 'Source is not assigned to an ingest worker yet'}), 503
+        etag = page['etag']
+    else:
+        etag = logs_etag(source, position, limit, cursor)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    if bus:
+        logs, next_cursor = page['logs'], page['next_cursor']
+    else:
+        try:
+            logs, next_cursor = read_logs_page(source, position, limit)
+        except Exception as e:
+            print(f"Error reading history for {source.name}: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    response = jsonify({'logs': logs, 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    return response
+
+def logs_etag(source, position, limit, cursor):
+    store = source.logs
+    if position[0] == 'memory':
+        # A page changes only when records are added or evicted
+        return f"{store.first_seq}-{store.next_seq}-{limit}-{cursor or ''}"
+    # Bytes before a file offset never change; a rotated file has a new inode
+    return f"{limit}-{cursor}"
+
+def read_logs_page(source, position, limit):
+    """(records newest first, next cursor) of one page of a source's history"""
+    logs, next_cursor = [], None
+    if position[0] == 'memory':
+        logs, next_cursor = memory_page(source.logs, position[1], limit)
+        start = history_start(source) if next_cursor is None else None
+        if start:
+            file_cursor, offset = start
+            next_cursor = f"f.{file_cursor.inode}.{offset}"
+            position = ('file', file_cursor.inode, offset)
+
+    if position[0] == 'file' and len(logs) < limit:
+        _, inode, offset = position
+        file_cursor = next((c for c in list(source.tailer.cursors.values()) if c.inode == inode), None)
+        next_cursor = None
+        if file_cursor and offset > 0:
+            records, offset = read_before(source.tailer.transport, file_cursor.path, offset, source.parser,
+                                          limit - len(logs))
+            if source.ingest_filter:
+                records = [record for record in records if source.ingest_filter.matches(record)]
+            for record in records:
+                record['source_id'] = source.id
+                record['source_name'] = source.name
+            logs.extend(records)
+            next_cursor = f"f.{inode}.{offset}" if offset else None
+    return logs, next_cursor
 
 @app.route('/api/insights', methods=['GET'])
 def get_insights():
     try:
-        # Collect logs from all sources
-        all_logs = []
-        for source_id, source in log_sources.items():
-            logs = []
-            for log in source.logs:
-                log_entry = {
-                    'timestamp': log['timestamp'],
-                    'level': log['level'],
-                    'component': log.get('component', 'Unknown'),
-                    'message': log['message']
-                }
-                logs.append(log_entry)
-            all_logs.extend(logs)
-        
-        # Sort logs by timestamp
-        all_logs.sort(key=lambda x: x['timestamp'])
-        
-        insights = {
-            'anomalies': [],
-            'patterns': [],
-            'summary': {},
-            'recommendations': []
-        }
-        
-        # Analyze error patterns
-        error_logs = [log for log in all_logs if log['level'] == 'ERROR']
-        if error_logs:
-            error_components = {}
-            for log in error_logs:
-                component = log['component']
-                error_components[component] = error_components.get(component, 0) + 1
-            
-            # Find most problematic components
-            problem_components = sorted(error_components.items(), key=lambda x: x[1], reverse=True)
-            if problem_components:
-                insights['anomalies'].append({
-                    'type': 'error_hotspot',
-                    'message': f"Component '{problem_components[0][0]}' has the highest error count ({problem_components[0][1]} errors)",
-                    'severity': 'high'
-                })
-        
-        # Analyze warning patterns
-        warning_logs = [log for log in all_logs if log['level'] == 'WARN']
-        if warning_logs:
-            warning_components = {}
-            for log in warning_logs:
-                component = log['component']
-                warning_components[component] = warning_components.get(component, 0) + 1
-            
-            # Find components with many warnings
-            warning_hotspots = sorted(warning_components.items(), key=lambda x: x[1], reverse=True)
-            if warning_hotspots:
-                insights['patterns'].append({
-                    'type': 'warning_pattern',
-                    'message': f"Component '{warning_hotspots[0][0]}' shows repeated warnings ({warning_hotspots[0][1]} warnings)",
-                    'severity': 'medium'
-                })
-        
-        # Generate summary
-        total_logs = len(all_logs)
-        error_rate = len(error_logs) / total_logs if total_logs > 0 else 0
-        warning_rate = len(warning_logs) / total_logs if total_logs > 0 else 0
-        
-        insights['summary'] = {
-            'total_logs': total_logs,
-            'error_rate': error_rate,
-            'warning_rate': warning_rate,
-            'health_score': calculate_health_score(all_logs)
-        }
-        
-        # Generate recommendations
-        if error_rate > 0.1:
-            insights['recommendations'].append({
-                'type': 'high_error_rate',
-                'message': 'High error rate detected. Consider reviewing error handling in problematic components.',
-                'action': 'Review error handling mechanisms'
-            })
-        
-        if warning_rate > 0.2:
-            insights['recommendations'].append({
-                'type': 'high_warning_rate',
-                'message': 'High warning rate detected. Consider upgrading or optimizing warned components.',
-                'action': 'Optimize warned components'
-            })
-        
-        # Add default insights if no issues found
-        if not insights['anomalies']:
-            insights['anomalies'].append({
-                'type': 'system_healthy',
-                'message': 'No anomalies detected. System is running smoothly.',
-                'severity': 'low'
-            })
-        
-        if not insights['patterns']:
-            insights['patterns'].append({
-                'type': 'normal_operation',
-                'message': 'Log patterns are within normal ranges.',
-                'severity': 'low'
-            })
-        
-        if not insights['recommendations']:
-            insights['recommendations'].append({
-                'type': 'maintain_health',
-                'message': 'System is healthy. Continue monitoring for any changes.',
-                'action': 'Maintain current configuration'
-            })
-        
+        # Aggregates are maintained at ingest time, so this is a snapshot read
+        window = request.args.get('window', 'all')
+        if window != 'all' and window not in WINDOWS:
+            return jsonify({'error': f"Unknown window '{window}'. Use 'all' or one of: {', '.join(WINDOWS)}"}), 400
+
+        if bus:
+            # Templates are mined on the ingest workers
+            answers = query_ingest('patterns').values()
+            patterns = [pattern for answer in answers for pattern in answer['patterns']][:5]
+        else:
+            patterns = template_miner.patterns()
+        insights = build_insights(insight_aggregator.snapshot(window), patterns, anomaly_detector.recent())
+        insights['summary']['window'] = window
         return jsonify(insights)
         
     except Exception as e:
         print(f"Error analyzing logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def calculate_health_score(logs):
-    if not logs:
-        return 100
-    
-    # Calculate weights for different log levels
-    weights = {
-        'ERROR': 1.0,
-        'WARN': 0.5,
-        'INFO': 0.1,
-        'DEBUG': 0
-    }
-    
-    # Calculate weighted sum of log levels
-    weighted_sum = 0
-    total_weight = 0
-    
-    for log in logs:
-        level = log['level']
-        weight = weights.get(level, 0)
-        weighted_sum += weight
-        total_weight += 1
-    
-    if total_weight == 0:
-        return 100
-    
-    # Calculate health score (100 is perfect health, 0 is critical)
-    health_score = 100 * (1 - (weighted_sum / (total_weight * weights['ERROR'])))
-    return round(max(0, min(100, health_score)), 2)
+@app.route('/api/templates', methods=['GET'])
+def get_templates():
+    try:
+        limit = min(max(1, int(request.args.get('limit', 50))), 1000)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not bus:
+        return jsonify({'templates': template_miner.top(limit), 'stats': template_miner.stats()})
+    try:
+        answers = list(query_ingest('templates', limit=limit).values())
+    except IngestQueryError as e:
+        return jsonify({'error': e.message}), e.status
+    stats = {key: sum(answer['stats'][key] for answer in answers) for key in ('templates', 'records', 'evictions')}
+    return jsonify({'templates': merge_top([answer['templates'] for answer in answers], limit), 'stats': stats})
 
-# Clear all log sources on startup
-def clear_log_sources():
+def parse_time_param(value):
+    """Epoch milliseconds from an integer or a YYYY-MM-DDTHH:MM:SS[,mmm] timestamp"""
+    if value is None or value == '':
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return timestamp_decoder.decode_iso(value)
+    except (ValueError, IndexError):
+        raise ValueError(f"Invalid time '{value}'")
+
+@app.route('/api/search', methods=['GET'])
+def search_logs():
+    started = time.time()
+    try:
+        source_ids = [source_id for value in request.args.getlist('source_id')
+                      for source_id in value.split(',') if source_id]
+        limit = min(max(1, int(request.args.get('limit', 100))), 1000)
+        query = request.args.get('q', '')
+        start_ms = parse_time_param(request.args.get('from'))
+        end_ms = parse_time_param(request.args.get('to'))
+        cursor = request.args.get('cursor')
+        if bus:
+            records, next_cursor, scanned = search_ingest(query, source_ids, start_ms, end_ms, limit, cursor)
+        else:
+            records, next_cursor, scanned = search_index.search(
+                query, source_ids=source_ids, start_ms=start_ms, end_ms=end_ms, limit=limit, cursor=cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except IngestQueryError as e:
+        return jsonify({'error': e.message}), e.status
+
+    return jsonify({
+        'results': records,
+        'next_cursor': next_cursor,
+        'segments_scanned': scanned,
+        'took_ms': round((time.time() - started) * 1000, 2)
+    })
+
+def search_ingest(query, source_ids, start_ms, end_ms, limit, cursor):
+    """``search_index.search`` across the ingest workers' indexes, for a web worker"""
+    answers = query_ingest('search', q=query, source_ids=source_ids, start_ms=start_ms, end_ms=end_ms,
+                           limit=limit, cursors=split_cursors(cursor) if cursor else None)
+    pages = {worker: (answer['cursor'], answer['records'], answer['cursors'], answer['next_cursor'])
+             for worker, answer in answers.items() if answer['cursor'] is not None}
+    records, cursors = merge_pages(pages, limit)
+    return records, join_cursors(cursors), sum(answer['scanned'] for answer in answers.values())
+
+@app.route('/api/timeseries', methods=['GET'])
+def get_timeseries():
+    try:
+        source_ids = [source_id for value in request.args.getlist('source_id')
+                      for source_id in value.split(',') if source_id]
+        levels = [level for value in request.args.getlist('level') for level in value.split(',') if level]
+        points = min(max(1, int(request.args.get('points', 300))), 2000)
+        span = int(request.args.get('span', 3600))
+        result = timeseries_store.query(
+            start_ms=parse_time_param(request.args.get('from')),
+            end_ms=parse_time_param(request.args.get('to')),
+            points=points,
+            source_ids=source_ids,
+            levels=levels,
+            component=request.args.get('component') or None,
+            group_by=request.args.get('group_by', 'level'),
+            span_ms=span * 1000
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiler', methods=['GET'])
+def get_profile():
+    if request.args.get('format') == 'folded':
+        # Feed to flamegraph.pl or speedscope
+        return Response(ingest_profiler.folded(), mimetype='text/plain')
+    try:
+        limit = min(max(1, int(request.args.get('limit', 20))), 200)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(ingest_profiler.summary(limit))
+
+@app.route('/api/profiler', methods=['POST'])
+def control_profiler():
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action == 'start':
+        try:
+            interval = float(data.get('interval') or ingest_profiler.interval)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'interval must be a number of seconds'}), 400
+        if not 0.001 <= interval <= 1:
+            return jsonify({'error': 'interval must be between 0.001 and 1 seconds'}), 400
+        ingest_profiler.start(interval)
+    elif action == 'stop':
+        ingest_profiler.stop()
+    elif action == 'reset':
+        ingest_profiler.reset()
+    else:
+        return jsonify({'error': "action must be 'start', 'stop' or 'reset'"}), 400
+    return jsonify(ingest_profiler.summary())
+
+def save_checkpoint():
+    """Checkpoint every source whose state changed since the last save"""
+    if not checkpointer:
+        return 0
+    entries = [(source.id, source.checkpoint_config(), source.checkpoint_signature(), source.checkpoint_state)
+               for source in list(log_sources.values())]
+    return checkpointer.save(entries)
+
+def checkpoint_loop():
+    while True:
+        socketio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            save_checkpoint()
+        except Exception as e:
+            print(f"Error saving checkpoint: {str(e)}")
+
+def source_from_config(config):
+    """A LogSource from a saved or broadcast definition (checkpoint_config)"""
+    return LogSource(
+        name=config['name'],
+        host=config['host'],
+        username=config['username'],
+        password=config['password'],
+        log_path=config['log_path'],
+        log_format=config['log_format'],
+        pattern=config['pattern'],
+        timestamp_format=config['timestamp_format'],
+        compression=config['compression'],
+        ingest_filter=IngestFilter.from_dict(config['filter']),
+        source_id=config['id']
+    )
+
+def resume_log_source(source, state):
+    """Poll a restored source again in its saved state"""
+    if state == STOPPED:
+        source.active = False
+        return
+    # Both catch up from the saved offsets; a paused one only once resumed
+    source.start_monitoring(paused=state == PAUSED)
+
+def start_checkpoints():
+    socketio.start_background_task(checkpoint_loop)
+    atexit.register(save_checkpoint)
+
+def restore_log_sources():
+    """Recreate the sources of the last checkpoint and resume them where they stopped reading"""
+    global checkpointer
     log_sources.clear()
+    if not CHECKPOINT_PATH:
+        return
+    checkpointer = Checkpointer(CHECKPOINT_PATH, os.environ.get('CHECKPOINT_KEY'))
+    for config, sections in checkpointer.load():
+        try:
+            source = source_from_config(config)
+            if sections:
+                source.restore_state(sections)
+        except Exception as e:
+            print(f"Error restoring log source {config.get('name')}: {str(e)}")
+            continue
+        log_sources[source.id] = source
+        resume_log_source(source, config['state'])
+    print(f"Restored {len(log_sources)} log sources from {CHECKPOINT_PATH}")
+    start_checkpoints()
+
+def publish_source(source):
+    """Tell the web workers (through the broker) about a source's state or filter"""
+    bus.send({'type': 'source', 'config': source.checkpoint_config()})
+
+def handle_ingest_message(message, blob):
+    """Bus messages for an ingest worker: sources assigned to it and changes to them"""
+    kind = message['type']
+    if kind == 'assign':
+        config = message['config']
+        source = source_from_config(config)
+        # The last checkpoint has the records and rollups; the broker has newer read positions
+        sections = checkpointer.load_source(source.id) if checkpointer else None
+        if sections:
+            source.restore_state(sections)
+        if message.get('position'):
+            source.move_to(message['position'])
+        log_sources[source.id] = source
+        resume_log_source(source, config['state'])
+        publish_source(source)
+        return
+    if kind == 'query':
+        # Off the bus reader, so batches keep flowing while it is answered
+        socketio.start_background_task(answer_query, message)
+        return
+
+    source = log_sources.get(message['source_id'])
+    if not source:
+        if kind == 'remove' and checkpointer:
+            # Removed while it was being handed over from here
+            checkpointer.delete(message['source_id'])
+        return
+    if kind == 'command':
+        if 'filter' in message:
+            source.set_filter(IngestFilter.from_dict(message['filter']))
+        control_log_source(source, message['action'])
+        publish_source(source)
+    elif kind == 'remove':
+        source.stop_monitoring()
+        source.forget()
+        del log_sources[source.id]
+    elif kind == 'snapshot':
+        bus.send({'type': 'snapshot', 'source_id': source.id, 'reply_to': message['reply_to']},
+                 pack(source.checkpoint_state(records=False)))
+    elif kind == 'release':
+        # Moving to a newly started ingest worker: checkpoint it once no poll is in flight
+        source.remote_state = source.state
+        source.active = False
+        ingest_engine.remove(source.id, then=lambda: socketio.start_background_task(release_source, source))
+
+class IngestQueryError(Exception):
+    """A bus query that failed on an ingest worker or went unanswered, with the HTTP status to return"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def query_ingest(name, **args):
+    """{worker name: result} of a bus query to the ingest workers, from a web worker"""
+    try:
+        answers = bus.query(name, **args)
+    except TimeoutError as e:
+        raise IngestQueryError(str(e), 504)
+    for answer in answers:
+        if 'error' in answer['result']:
+            raise IngestQueryError(answer['result']['error'], answer['result']['status'])
+    return {answer['worker']: answer['result'] for answer in answers}
+
+def answer_query(message):
+    """Answer a web worker's bus query from the records, search index and templates kept here"""
+    name = message['name']
+    try:
+        if name == 'logs':
+            source = log_sources.get(message['source_id'])
+            if source:
+                cursor, limit = message['cursor'], message['limit']
+                position = parse_cursor(cursor) if cursor else ('memory', None)
+                etag = logs_etag(source, position, limit, cursor)
+                logs, next_cursor = read_logs_page(source, position, limit)
+                result = {'logs': logs, 'next_cursor': next_cursor, 'etag': etag}
+            else:
+                result = {'error': 'Source not found', 'status': 404}
+        elif name == 'search':
+            # A worker missing from a next-page cursor had nothing more to return
+            cursors = message['cursors']
+            cursor = '' if cursors is None else cursors.get(bus.name)
+            records, after, next_cursor, scanned = [], [], None, 0
+            if cursor is not None:
+                records, after, next_cursor, scanned = search_index.search_page(
+                    message['q'], message['source_ids'], message['start_ms'], message['end_ms'],
+                    message['limit'], cursor or None)
+            result = {'cursor': cursor, 'records': records, 'cursors': after, 'next_cursor': next_cursor,
+                      'scanned': scanned}
+        elif name == 'templates':
+            result = {'templates': template_miner.top(message['limit']), 'stats': template_miner.stats()}
+        elif name == 'patterns':
+            result = {'patterns': template_miner.patterns()}
+        else:
+            raise ValueError(f"Unknown query '{name}'")
+    except ValueError as e:
+        result = {'error': str(e), 'status': 400}
+    except Exception as e:
+        print(f"Error answering {name} query: {str(e)}")
+        result = {'error': str(e), 'status': 500}
+    bus.send({'type': 'answer', 'query_id': message['query_id'], 'reply_to': message['reply_to'], 'result': result})
+
+def release_source(source):
+    """Hand a source over: save its final state for the next owner, then tell the broker"""
+    if log_sources.get(source.id) is not source:
+        return
+    del log_sources[source.id]
+    if checkpointer:
+        checkpointer.hand_over((source.id, source.checkpoint_config(), source.checkpoint_signature(),
+                                source.checkpoint_state))
+    source.forget(handed_over=True)
+    anomaly_detector.remove_source(source.id)
+    bus.send({'type': 'released', 'source_id': source.id})
+
+def apply_batch(source, message):
+    """Apply a batch an ingest worker published to a web worker's replica.
+
+    Only its counts, read position and live stream are kept here; records,
+    search and templates are read from the owner with bus queries.
+    """
+    records = message['records']
+    with source.lock:
+        source.batches = message['batch']
+        source.record_counts(len(records),
+                             {(level, component): count for level, component, count in message['levels']},
+                             {(epoch_ms, level, component): count
+                              for epoch_ms, level, component, count in message['series']})
+        path, inode, offset, size, line = message['cursor']
+        cursor = source.tailer.cursors.get(path)
+        if cursor is None or cursor.inode != inode:
+            cursor = source.tailer.cursors[path] = FileCursor(path, inode, offset)
+        cursor.offset, cursor.size, cursor.line = offset, size, line
+        # Keeps history reads past the stored records working on this worker
+        for epoch_ms, sample_offset, sample_line in message['samples']:
+            cursor.index.add(epoch_ms, sample_offset, sample_line)
+    log_fanout.publish(source.id, records)
+    if message['newest']:
+        log_time = datetime.fromtimestamp(message['newest'] / 1000)
+        if not source.last_log_time or log_time > source.last_log_time:
+            source.last_log_time = log_time
+
+def handle_web_message(message, blob):
+    """Bus messages for a web worker: source definitions, batches and snapshots"""
+    kind = message['type']
+    if kind == 'batch':
+        backlog = replica_backlog.get(message['source_id'])
+        source = log_sources.get(message['source_id'])
+        if backlog is not None:
+            backlog.append(message)
+        elif source and message['batch'] > source.batches:
+            apply_batch(source, message)
+    elif kind == 'source':
+        config = message['config']
+        source = log_sources.get(config['id'])
+        if source is None:
+            source = log_sources[config['id']] = source_from_config(config)
+            replica_backlog[source.id] = []
+        else:
+            source.set_filter(IngestFilter.from_dict(config['filter']))
+        if config['state'] != RUNNING:
+            anomaly_detector.remove_source(source.id)
+        source.remote_state = config['state']
+        if source.id in replica_backlog and config.get('owner'):
+            # Start from the owner's state; batches queue up until it arrives
+            bus.send({'type': 'snapshot', 'source_id': source.id})
+    elif kind == 'snapshot':
+        source = log_sources.get(message['source_id'])
+        backlog = replica_backlog.pop(message['source_id'], None)
+        if source is None or backlog is None:
+            return
+        source.restore_state(unpack(blob))
+        for batch in backlog:
+            if batch['batch'] > source.batches:
+                apply_batch(source, batch)
+    elif kind == 'anomaly':
+        anomaly_detector.add_alert(message['alert'])
+    elif kind == 'removed':
+        source = log_sources.pop(message['source_id'], None)
+        replica_backlog.pop(message['source_id'], None)
+        if source:
+            source.forget()
+
+def bus_lost():
+    print("Lost the connection to the bus; exiting so the cluster restarts this worker")
+    if APP_ROLE == 'ingest':
+        save_checkpoint()
+    os._exit(1)
+
+def run_ingest_worker():
+    global bus, checkpointer
+    if CHECKPOINT_PATH:
+        checkpointer = Checkpointer(CHECKPOINT_PATH, os.environ.get('CHECKPOINT_KEY'))
+        start_checkpoints()
+    # Search cursors name the worker they continue on, so it needs a name to recognise
+    name = os.environ.get('WORKER_NAME') or f'ingest-{os.getpid()}'
+    bus = BusClient(BUS_PATH, 'ingest', name, handle_ingest_message, bus_lost)
+    # Alerts are raised here, where the records are; web workers push them to their clients
+    anomaly_detector.on_alert = lambda alert: bus.send({'type': 'anomaly', 'alert': alert})
+    # cluster.py stops workers with SIGTERM; exit normally so the last checkpoint is saved
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    while True:
+        time.sleep(1)
+
+def run_web_worker():
+    global bus
+    bus = BusClient(BUS_PATH, 'web', os.environ.get('WORKER_NAME'), handle_web_message, bus_lost)
+    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 3011)), allow_unsafe_werkzeug=True)
 
 if __name__ == '__main__':
-    clear_log_sources()  # Clear sources on startup
-    socketio.run(app, host='0.0.0.0', port=3011, debug=True)
+    if APP_ROLE == 'ingest':
+        run_ingest_worker()
+    elif APP_ROLE == 'web':
+        run_web_worker()
+    else:
+        # With debug=True this script also runs in the reloader's watcher process,
+        # which only restarts the server; sources are restored where it serves
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            restore_log_sources()
+        socketio.run(app, host='0.0.0.0', port=3011, debug=True)
@@ -0,0 +1,351 @@
+"""End-to-end ingest benchmark: generator, transport, parser, dedup, stores and routes.
+
+    python benchmarks/bench_e2e.py [--transport file|ssh] [--sources 4] [--seconds 20] [--rate 20000]
+                                   [--clients 4] [--parse-workers 0] [--scaling 1,2,4,8]
+                                   [--json run.json] [--baseline base.json]
+
+Log files are written at ``--rate`` lines per second by loggen.py and
+ingested by real LogSources from app.py, through LocalFileTransport or
+over SSH to an in-process server (local_sshd.py). Meanwhile ``--clients``
+threads request /api/insights and /api/logs/<id>; ``--parse-workers``
+moves parsing to that many processes (app.py's PARSE_WORKERS), and
+``--scaling`` repeats the run for several worker counts and compares their
+throughput. Reports lines per second, per-poll stage latency percentiles
+(read, split, parse, dedup, emit), memory growth and route latency.
+``--json`` saves the run and ``--baseline`` compares it with a saved one,
+exiting 1 on regressions beyond ``--tolerance`` percent.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from log_tailer import LocalFileTransport  # noqa: E402
+from parse_pool import ParsePool  # noqa: E402
+from loggen import DEFAULT_LEVELS, LogGenerator, write_at_rate  # noqa: E402
+from local_sshd import LocalSSHServer  # noqa: E402
+
+STAGES = ('read', 'split', 'parse', 'dedup', 'emit')
+# Unwrapped app functions; every run wraps them with its own StageTimer
+POLL_LOG_FILE = app.poll_log_file
+PUBLISH = app.log_fanout.publish
+
+
+def percentiles(samples):
+    """p50/p90/p99/max in milliseconds of a list of seconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+    return {'count': len(ordered), 'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99),
+            'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except OSError:
+        # Peak rather than current, where /proc is not available
+        scale = 1024 if sys.platform != 'darwin' else 1024 ** 2
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+
+class StageTimer:
+    """Times pipeline stages per poll by wrapping the functions each stage calls.
+
+    Time spent inside the tailer that is neither reading nor parsing is
+    reported as 'split' (framing, cursors, index sampling).
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.samples = {stage: [] for stage in STAGES + ('poll',)}
+
+    def _add(self, stage, seconds):
+        totals = getattr(self.local, 'totals', None)
+        if totals is not None:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(stage, time.perf_counter() - started)
+        return timed
+
+    def wrap_iter(self, stage, func):
+        def timed(*args, **kwargs):
+            iterator = iter(func(*args, **kwargs))
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._add(stage, time.perf_counter() - started)
+                    return
+                self._add(stage, time.perf_counter() - started)
+                yield item
+        return timed
+
+    def wrap_poll(self, poll):
+        def timed(source_id):
+            self.local.totals = {}
+            started = time.perf_counter()
+            try:
+                result = poll(source_id)
+            finally:
+                totals, self.local.totals = self.local.totals, None
+            elapsed = time.perf_counter() - started
+            if result[0]:
+                totals['split'] = max(0.0, totals.get('tailer', 0.0) - totals.get('read', 0.0)
+                                      - totals.get('parse', 0.0))
+                with self.lock:
+                    self.samples['poll'].append(elapsed)
+                    for stage in STAGES:
+                        self.samples[stage].append(totals.get(stage, 0.0))
+            return result
+        return timed
+
+    def report(self):
+        with self.lock:
+            return {stage: percentiles(samples) for stage, samples in self.samples.items()}
+
+
+def instrument(timer, source):
+    transport = source.tailer.transport
+    transport.stat = timer.wrap('read', transport.stat)
+    transport.read_range = timer.wrap('read', transport.read_range)
+    source.parse_chunk = timer.wrap('parse', source.parse_chunk)
+    source.tailer.poll_records = timer.wrap_iter('tailer', source.tailer.poll_records)
+    source.is_duplicate_log = timer.wrap('dedup', source.is_duplicate_log)
+    source.record_logs = timer.wrap('emit', source.record_logs)
+
+
+def load_routes(source_ids, stop, latencies, lock, seed):
+    """Request /api/insights and /api/logs/<id> back to back until ``stop``"""
+    client = app.app.test_client()
+    rng = random.Random(seed)
+    while not stop.is_set():
+        for route, url in (('/api/insights', '/api/insights'),
+                           ('/api/logs/<id>', f'/api/logs/{rng.choice(source_ids)}')):
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.setdefault(route, []).append(elapsed)
+                if response.status_code != 200:
+                    latencies.setdefault(route + ' errors', []).append(elapsed)
+
+
+def flatten(result, prefix=''):
+    flat = {}
+    for key, value in result.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(result, baseline, tolerance):
+    """Print metrics that moved more than ``tolerance`` percent; True if any got worse"""
+    ours, theirs = flatten(result), flatten(baseline)
+    regressed = False
+    rows = []
+    for name, value in sorted(ours.items()):
+        before = theirs.get(name)
+        # Counts depend on how long the run took, not on how fast it was
+        if name.startswith('config.') or name.endswith(('.count', '_written', '_ingested', '.seconds')) \
+                or not before:
+            continue
+        change = (value - before) / before * 100
+        higher_is_better = name.endswith('per_second')
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        if abs(change) > tolerance:
+            rows.append((name, before, value, change, worse))
+            regressed = regressed or worse
+    print(f"\nAgainst baseline (tolerance {tolerance}%):")
+    if not rows:
+        print("  no changes beyond tolerance")
+    for name, before, value, change, worse in rows:
+        print(f"  {'WORSE ' if worse else 'better'} {name:<40} {before:>12,.3f} -> {value:>12,.3f} ({change:+.1f}%)")
+    return regressed
+
+
+def run(args, parse_workers):
+    """One benchmark run with ``parse_workers`` parse processes; returns its results"""
+    workdir = tempfile.mkdtemp(prefix='bench-e2e-')
+    server = LocalSSHServer()
+    app.ssh_pool.port = server.start()
+    timer = StageTimer()
+    app.parse_pool = ParsePool(parse_workers) if parse_workers > 0 else None
+    app.poll_log_file = timer.wrap_poll(POLL_LOG_FILE)
+    app.log_fanout.publish = timer.wrap('emit', PUBLISH)
+
+    try:
+        paths = []
+        for i in range(args.sources):
+            path = os.path.join(workdir, f'app-{i}.log')
+            open(path, 'w').close()
+            source = app.LogSource(f'bench-{i}', '127.0.0.1', 'bench', 'bench', path,
+                                   transport=LocalFileTransport() if args.transport == 'file' else None,
+                                   compression=args.compression)
+            instrument(timer, source)
+            app.log_sources[source.id] = source
+            paths.append(path)
+        for source in app.log_sources.values():
+            source.start_monitoring()
+        time.sleep(app.ingest_engine.min_interval * 2)  # let every source prime its cursor
+
+        rss_start = peak = rss_mb()
+        counters = {}
+        stop = threading.Event()
+        generator = LogGenerator(args.seed, args.levels, args.trace_ratio)
+        writer = threading.Thread(target=write_at_rate,
+                                  args=(paths, generator, args.rate, args.seconds, stop, counters))
+        latencies, latency_lock = {}, threading.Lock()
+        clients = [threading.Thread(target=load_routes, daemon=True,
+                                    args=(list(app.log_sources), stop, latencies, latency_lock, n))
+                   for n in range(args.clients)]
+
+        started = time.time()
+        writer.start()
+        for client in clients:
+            client.start()
+        while writer.is_alive():
+            writer.join(0.5)
+            peak = max(peak, rss_mb())
+        stop.set()
+        for client in clients:
+            client.join()
+
+        # Idle sources back off to max_interval; drain until nothing moves for that long
+        ingested, last_change = 0, time.time()
+        while time.time() - last_change < app.ingest_engine.max_interval * 2:
+            now_ingested = sum(source.records_ingested for source in app.log_sources.values())
+            if now_ingested >= counters['records']:
+                ingested = now_ingested
+                break
+            if now_ingested != ingested:
+                ingested, last_change = now_ingested, time.time()
+            peak = max(peak, rss_mb())
+            time.sleep(0.2)
+        elapsed = (last_change if ingested < counters['records'] else time.time()) - started
+        rss_end = rss_mb()
+
+        lines_ingested = counters['lines'] * ingested / max(1, counters['records'])
+        return {
+            'config': dict(vars(args), parse_workers=parse_workers, python=platform.python_version(),
+                           cpus=os.cpu_count()),
+            'throughput': {
+                'records_written': counters['records'],
+                'records_ingested': ingested,
+                'records_lost': counters['records'] - ingested,
+                'lines_per_second': round(lines_ingested / elapsed, 1),
+                'records_per_second': round(ingested / elapsed, 1),
+                'bytes_per_second': round(counters['bytes'] * ingested / max(1, counters['records']) / elapsed, 1),
+                'seconds': round(elapsed, 2)
+            },
+            'stages': timer.report(),
+            'routes': {route: percentiles(samples) for route, samples in latencies.items()},
+            'memory': {
+                'rss_start_mb': round(rss_start, 1),
+                'rss_peak_mb': round(peak, 1),
+                'rss_end_mb': round(rss_end, 1),
+                'growth_mb': round(rss_end - rss_start, 1)
+            }
+        }
+    finally:
+        for source in list(app.log_sources.values()):
+            source.stop_monitoring()
+        app.log_sources.clear()
+        if app.parse_pool:
+            app.parse_pool.close()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(result):
+    throughput = result['throughput']
+    print(f"Ingested {throughput['records_ingested']:,} of {throughput['records_written']:,} records "
+          f"in {throughput['seconds']}s: {throughput['lines_per_second']:,.0f} lines/s, "
+          f"{throughput['records_per_second']:,.0f} records/s ({result['config']['transport']} transport)")
+    print(f"\n{'per poll':<16} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in list(result['stages'].items()) + list(result['routes'].items()):
+        if stats['count']:
+            print(f"{name:<16} {stats['count']:>7} {stats['p50_ms']:>9.3f} {stats['p90_ms']:>9.3f} "
+                  f"{stats['p99_ms']:>9.3f} {stats['max_ms']:>9.3f}")
+    memory = result['memory']
+    print(f"\nRSS {memory['rss_start_mb']} MB -> {memory['rss_end_mb']} MB "
+          f"(peak {memory['rss_peak_mb']} MB, growth {memory['growth_mb']} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transport', choices=('file', 'ssh'), default='file')
+    parser.add_argument('--compression', default='none', help="SSH transport compression mode")
+    parser.add_argument('--sources', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--rate', type=int, default=20000, help='lines written per second, all files')
+    parser.add_argument('--levels', default=DEFAULT_LEVELS)
+    parser.add_argument('--trace-ratio', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clients', type=int, default=4, help='threads requesting routes during ingest')
+    parser.add_argument('--parse-workers', type=int, default=app.PARSE_WORKERS,
+                        help='worker processes for parsing; 0 parses in-process')
+    parser.add_argument('--scaling', help='comma-separated parse worker counts to run one after another, '
+                                          'e.g. 1,2,4,8; use a --rate one worker cannot keep up with')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.scaling:
+        counts = [int(count) for count in args.scaling.split(',')]
+        runs = {}
+        for count in counts:
+            print(f"--- {count} parse workers")
+            runs[str(count)] = run(args, count)
+            report(runs[str(count)])
+            print()
+        first = runs[str(counts[0])]['throughput']['lines_per_second']
+        print(f"{'workers':>7} {'lines/s':>12} {'records/s':>12} {'lost':>9} {'speedup':>8}")
+        for count in counts:
+            throughput = runs[str(count)]['throughput']
+            print(f"{count:>7} {throughput['lines_per_second']:>12,.0f} {throughput['records_per_second']:>12,.0f} "
+                  f"{throughput['records_lost']:>9,} {throughput['lines_per_second'] / max(1, first):>7.2f}x")
+        result = {'scaling': runs}
+    else:
+        result = run(args, args.parse_workers)
+        report(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
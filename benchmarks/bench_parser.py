@@ -0,0 +1,108 @@
+"""Parser throughput: the original per-line loop vs. the batch parser.
+
+    python benchmarks/bench_parser.py [--records 200000] [--repeat 3]
+"""
+import argparse
+import gc
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_parser import get_parser  # noqa: E402
+from loggen import LogGenerator  # noqa: E402
+
+
+def generate(records, seed=42):
+    return LogGenerator(seed).text(records).encode()
+
+
+def legacy_parse(data):
+    """The tail loop as it was: per-line regexes, string pattern and strptime"""
+    def parse_log_line(line):
+        pattern = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2},\d{3})\s+(\w+)\s+\[([^\]]+)\]\s+([^\s-]+)\s*-\s*(.+)'
+        match = re.match(pattern, line)
+        if match:
+            timestamp, level, thread, component, message = match.groups()
+            return {'timestamp': timestamp, 'level': level, 'thread': thread,
+                    'component': component, 'message': message.strip()}
+        return None
+
+    def finish(current_log, out):
+        parsed_log = parse_log_line(current_log)
+        if parsed_log:
+            datetime.strptime(parsed_log['timestamp'], '%Y-%m-%dT%H:%M:%S,%f')
+            out.append(parsed_log)
+
+    out = []
+    current_log = ''
+    for line in data.decode().split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if re.match(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2},\d{3}', line):
+            if current_log:
+                finish(current_log, out)
+            current_log = line
+        else:
+            current_log += '\n' + line
+    if current_log:
+        finish(current_log, out)
+    return out
+
+
+def batch_parse(data, chunk_size=1024 * 1024):
+    parser = get_parser('log4j')
+    out = []
+    offset = 0
+    while offset < len(data):
+        chunk = data[offset:offset + chunk_size]
+        final = offset + chunk_size >= len(data)
+        records, consumed = parser.parse_chunk(chunk, final)
+        out.extend(records)
+        offset += consumed
+    return out
+
+
+def measure(funcs, data, repeat):
+    """Best time and record count per function, runs interleaved and with GC off like timeit"""
+    best = [float('inf')] * len(funcs)
+    counts = [0] * len(funcs)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for i, func in enumerate(funcs):
+                start = time.perf_counter()
+                counts[i] = len(func(data))
+                best[i] = min(best[i], time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return best, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = generate(args.records)
+    lines = data.count(b'\n')
+    print(f"{args.records} records, {lines} lines, {len(data) / 1e6:.1f} MB")
+
+    (legacy_time, batch_time), (legacy_count, batch_count) = measure(
+        (legacy_parse, batch_parse), data, args.repeat)
+    assert legacy_count == batch_count, (legacy_count, batch_count)
+
+    print(f"legacy: {lines / legacy_time:12,.0f} lines/s")
+    print(f"batch:  {lines / batch_time:12,.0f} lines/s")
+    print(f"speedup: {legacy_time / batch_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
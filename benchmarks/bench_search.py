@@ -0,0 +1,92 @@
+"""Search index: indexing rate, memory and query latency.
+
+    python benchmarks/bench_search.py [--records 2000000] [--sources 20] [--repeat 5]
+
+Records are synthesised from their sequence number, so fetching a hit
+costs what a LogStore lookup would without holding every record in memory.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex  # noqa: E402
+from loggen import DEFAULT_LEVELS, LogGenerator, parse_levels  # noqa: E402
+
+LEVELS = parse_levels(DEFAULT_LEVELS)
+START_MS = 1705689716000
+
+
+def make_record(seq, sources):
+    record = LogGenerator(seed=seq, levels=LEVELS).fields()
+    record.update({
+        'timestamp': '',
+        'epoch_ms': START_MS + seq * 5,
+        'source_id': f'source-{seq % sources}',
+        'seq': seq
+    })
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000000)
+    parser.add_argument('--sources', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-bytes', type=int, default=2 * 1024 ** 3)
+    args = parser.parse_args()
+
+    index = SearchIndex(lambda source_id, seq: make_record(seq, args.sources), lambda source_id: 0,
+                        max_bytes=args.max_bytes)
+
+    started = time.time()
+    batch = 1000
+    for start in range(0, args.records, batch):
+        records = [make_record(seq, args.sources) for seq in range(start, min(start + batch, args.records))]
+        by_source = {}
+        for record in records:
+            by_source.setdefault(record['source_id'], []).append(record)
+        for source_id, group in by_source.items():
+            index.add(source_id, group, [record['seq'] for record in group])
+    elapsed = time.time() - started
+    stats = index.stats()
+    print(f"Indexed {args.records:,} records in {elapsed:.1f}s ({args.records / elapsed:,.0f} records/s, "
+          f"includes generating them)")
+    print(f"Segments: {stats['segments']}, sealed memory: {stats['memory_bytes'] / 1024 ** 2:.0f} MB "
+          f"({stats['memory_bytes'] / max(1, stats['records']):.0f} B/record)")
+
+    middle = START_MS + args.records * 5 // 2
+    queries = [
+        ('common term', 'request', {}),
+        ('rare term', '"user 4242"', {}),
+        ('boolean', '(timeout OR reset) AND level:ERROR', {}),
+        ('negation', 'orders -select', {}),
+        ('phrase', '"connection reset by peer"', {}),
+        ('field + source', 'component:org.hibernate.SQL', {'source_ids': ['source-3']}),
+        ('time range', 'cache miss', {'start_ms': middle, 'end_ms': middle + 60000}),
+        ('no match', 'doesnotexist', {}),
+    ]
+    print(f"\n{'query':<16} {'hits':>5} {'segments':>8} {'best ms':>8}")
+    for name, text, kwargs in queries:
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results, cursor, scanned = index.search(text, limit=100, **kwargs)
+            took = (time.perf_counter() - started) * 1000
+            best = took if best is None else min(best, took)
+        print(f"{name:<16} {len(results):>5} {scanned:>8} {best:>8.2f}")
+
+    # Walk a few pages to show the cursor keeps its cost per page
+    cursor, pages, started = None, 0, time.perf_counter()
+    while pages < 20:
+        results, cursor, _ = index.search('level:WARN', limit=100, cursor=cursor)
+        pages += 1
+        if not cursor:
+            break
+    print(f"\n{pages} pages of level:WARN in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Record storage: memory per record, list of dicts vs. the columnar LogStore.
+
+    python benchmarks/bench_store.py [--records 100000]
+
+Records are generated by loggen.py and parsed by the batch parser. The
+list keeps them as the dicts the app used to append to ``source.logs``;
+the LogStore holds them in columns. Memory is what tracemalloc sees
+retained after each is filled, next to ``LogStore.memory_usage()``.
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_parser import get_parser  # noqa: E402
+from log_store import LogStore  # noqa: E402
+from loggen import LogGenerator  # noqa: E402
+
+CHUNK_RECORDS = 10000
+
+
+def chunks(records):
+    """Text of ``records`` generated records, CHUNK_RECORDS at a time"""
+    generator = LogGenerator()
+    for start in range(0, records, CHUNK_RECORDS):
+        yield generator.text(min(CHUNK_RECORDS, records - start)).encode()
+
+
+def parse(data, parser):
+    records, _ = parser.parse_chunk(data, True)
+    return records
+
+
+def fill_list(records):
+    parser = get_parser('log4j')
+    logs = []
+    for data in chunks(records):
+        for record in parse(data, parser):
+            # The dicts as they used to be stored: parsed fields plus the source
+            del record['epoch_ms']
+            record['source_id'] = 'source-0'
+            record['source_name'] = 'app'
+            logs.append(record)
+    return logs
+
+
+def fill_store(records):
+    parser = get_parser('log4j')
+    store = LogStore(max_records=records, max_bytes=1 << 40,
+                     defaults={'source_id': 'source-0', 'source_name': 'app'})
+    for data in chunks(records):
+        store.extend(parse(data, parser))
+    return store
+
+
+def measure(fill, records):
+    """(what ``fill`` returned, bytes it still holds)"""
+    gc.collect()
+    tracemalloc.start()
+    result = fill(records)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    logs, list_bytes = measure(fill_list, args.records)
+    count = len(logs)
+    del logs
+    store, store_bytes = measure(fill_store, args.records)
+    assert len(store) == count, (len(store), count)
+
+    print(f"{count} records")
+    print(f"list of dicts: {list_bytes / count:8.1f} bytes/record")
+    print(f"LogStore:      {store_bytes / count:8.1f} bytes/record "
+          f"(memory_usage() {store.memory_usage() / count:.1f})")
+    print(f"reduction: {list_bytes / store_bytes:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
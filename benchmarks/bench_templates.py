@@ -0,0 +1,60 @@
+"""Template miner throughput on one core.
+
+    python benchmarks/bench_templates.py [--records 500000] [--templates 1000] [--batch 500]
+
+Messages come from ``--templates`` random token layouts with numeric
+variable slots, plus the fixed messages loggen.py writes.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_templates import TemplateMiner  # noqa: E402
+from loggen import MESSAGES  # noqa: E402
+
+
+def make_layouts(count, rng):
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+             for _ in range(count)]
+    layouts = list(MESSAGES)
+    while len(layouts) < count:
+        layouts.append(' '.join(rng.choice(words) if rng.random() > 0.3 else '{n}'
+                                for _ in range(rng.randint(4, 14))))
+    return layouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=500000)
+    parser.add_argument('--templates', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    layouts = make_layouts(args.templates, rng)
+    records = []
+    for seq in range(args.records):
+        layout = layouts[min(int(rng.expovariate(8 / len(layouts))), len(layouts) - 1)]
+        message = re.sub(r'\{\w*\}', lambda _: str(rng.randint(0, 10 ** 6)), layout)
+        records.append({'message': message, 'level': 'INFO', 'epoch_ms': 1705689716000 + seq})
+
+    miner = TemplateMiner()
+    started = time.perf_counter()
+    for start in range(0, len(records), args.batch):
+        miner.add_records(records[start:start + args.batch])
+    elapsed = time.perf_counter() - started
+
+    print(f"Mined {args.records:,} records in {elapsed:.2f}s ({args.records / elapsed:,.0f} records/s)")
+    print(f"Stats: {miner.stats()}")
+    print("\nMost frequent:")
+    for template in miner.top(5):
+        print(f"  {template['count']:>8,}  {template['template']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""In-process SSH server that runs exec requests with the local shell.
+
+Stands in for a remote log host in benchmarks: any username and password
+are accepted and commands run through ``sh -c`` on this machine, so the
+real SSH pool, transports and routes are exercised over a real socket.
+Not for use outside benchmarks.
+"""
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, owner):
+        self.owner = owner
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        self.owner.commands += 1
+        threading.Thread(target=_run, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+def _run(channel, command):
+    process = subprocess.Popen(['sh', '-c', command], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def copy_stderr():
+        for data in iter(lambda: process.stderr.read(4096), b''):
+            channel.sendall_stderr(data)
+
+    errors = threading.Thread(target=copy_stderr, daemon=True)
+    errors.start()
+    try:
+        for data in iter(lambda: process.stdout.read1(64 * 1024), b''):
+            channel.sendall(data)
+    except Exception:
+        process.kill()  # the client went away
+    errors.join()
+    try:
+        channel.send_exit_status(process.wait())
+        channel.close()
+    except Exception:
+        pass
+
+
+class LocalSSHServer:
+    """``start()`` binds 127.0.0.1 on a free port and returns it"""
+
+    def __init__(self, compression=True):
+        self.compression = compression
+        self.key = paramiko.RSAKey.generate(2048)
+        self.sock = None
+        self.transports = []
+        self.commands = 0
+
+    def start(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(100)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self.sock.getsockname()[1]
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return  # stopped
+            transport = paramiko.Transport(client)
+            transport.use_compression(self.compression)
+            transport.add_server_key(self.key)
+            transport.start_server(server=_Server(self))
+            self.transports.append(transport)
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+        for transport in self.transports:
+            transport.close()
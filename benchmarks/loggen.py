@@ -0,0 +1,144 @@
+"""Deterministic log4j-style log generator.
+
+    python benchmarks/loggen.py app.log [--records 100000] [--rate 0 --seconds 10]
+                                        [--levels INFO=70,DEBUG=15,WARN=10,ERROR=5] [--trace-ratio 0.5]
+
+Writes ``--records`` records at once, or with ``--rate`` appends that many
+lines per second for ``--seconds``. The same seed always gives the same
+records; ERROR records carry a multi-line Java stack trace with
+probability ``--trace-ratio``.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_LEVELS = 'INFO=70,DEBUG=15,WARN=10,ERROR=5'
+COMPONENTS = ['com.example.OrderService', 'com.example.PaymentGateway', 'org.hibernate.SQL',
+              'com.example.http.RequestFilter', 'com.example.cache.RedisCache']
+THREADS = ['main', 'http-nio-8080-exec-1', 'http-nio-8080-exec-7', 'scheduler-2', 'kafka-consumer-0']
+MESSAGES = [
+    'Processed request id={id} in {ms}ms for user {user}',
+    'Cache miss for key order:{id}, loading from database',
+    'Connection reset by peer while calling payment provider (attempt {ms})',
+    'Slow query took {ms}ms: select * from orders where user_id = {user}',
+    'Published event OrderCreated id={id} to topic orders',
+]
+EXCEPTIONS = ['java.lang.IllegalStateException: connection reset',
+              'java.net.SocketTimeoutException: Read timed out',
+              'java.lang.NullPointerException: order was null']
+
+
+def parse_levels(spec):
+    """{'INFO': 70, ...} from 'INFO=70,DEBUG=15,...'"""
+    levels = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if not name.strip() or not weight.strip():
+            raise ValueError(f"Invalid level weight '{part}', expected LEVEL=WEIGHT")
+        levels[name.strip().upper()] = float(weight)
+    return levels
+
+
+class LogGenerator:
+    """Records in the layout Log4jParser expects, one list of lines per record"""
+
+    def __init__(self, seed=42, levels=DEFAULT_LEVELS, trace_ratio=0.5, trace_depth=6,
+                 start=datetime(2024, 1, 19, 19, 41, 56)):
+        self.rng = random.Random(seed)
+        weights = parse_levels(levels) if isinstance(levels, str) else dict(levels)
+        self.levels = list(weights)
+        self.weights = list(weights.values())
+        self.trace_ratio = trace_ratio
+        self.trace_depth = trace_depth
+        self.ts = start
+
+    def fields(self):
+        """Level, thread, component and message of the next record, without text"""
+        rng = self.rng
+        level = rng.choices(self.levels, self.weights)[0]
+        message = rng.choice(MESSAGES).format(id=rng.randint(1, 10 ** 6), ms=rng.randint(1, 900),
+                                              user=rng.randint(1, 5000))
+        return {'level': level, 'thread': rng.choice(THREADS), 'component': rng.choice(COMPONENTS),
+                'message': message}
+
+    def record(self, ts=None):
+        """Lines of the next record; ``ts`` overrides the generated timestamp"""
+        rng = self.rng
+        if ts is None:
+            self.ts += timedelta(milliseconds=rng.randint(0, 40))
+            ts = self.ts
+        fields = self.fields()
+        level = fields['level']
+        lines = [f"{ts:%Y-%m-%dT%H:%M:%S},{ts.microsecond // 1000:03d} {level} [{fields['thread']}] "
+                 f"{fields['component']} - {fields['message']}"]
+        if level == 'ERROR' and rng.random() < self.trace_ratio:
+            lines.append(rng.choice(EXCEPTIONS))
+            lines.extend(f"\tat com.example.Frame{n}.call(Frame{n}.java:{rng.randint(10, 400)})"
+                         for n in range(self.trace_depth))
+        return lines
+
+    def text(self, records):
+        """``records`` records as one block of text"""
+        lines = []
+        for _ in range(records):
+            lines.extend(self.record())
+        return '\n'.join(lines) + '\n'
+
+
+def write_at_rate(paths, generator, rate, seconds, stop=None, counters=None, live_timestamps=True):
+    """Append about ``rate`` lines per second spread over ``paths``, in 100ms ticks.
+
+    ``counters`` (a dict) receives running 'records', 'lines' and 'bytes'
+    totals. With ``live_timestamps`` records are stamped with the current
+    time, as a real application would write them.
+    """
+    counters = counters if counters is not None else {}
+    for key in ('records', 'lines', 'bytes'):
+        counters.setdefault(key, 0)
+    deadline = time.time() + seconds
+    tick = 0
+    while time.time() < deadline and not (stop and stop.is_set()):
+        started = time.time()
+        per_file = {}
+        written = 0
+        while written < max(1, rate // 10):
+            lines = generator.record(datetime.now() if live_timestamps else None)
+            path = paths[tick % len(paths)]
+            tick += 1
+            per_file.setdefault(path, []).append('\n'.join(lines) + '\n')
+            written += len(lines)
+            counters['records'] += 1
+        for path, chunks in per_file.items():
+            data = ''.join(chunks)
+            with open(path, 'a') as f:
+                f.write(data)
+            counters['bytes'] += len(data.encode())
+        counters['lines'] += written
+        time.sleep(max(0, 0.1 - (time.time() - started)))
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--rate', type=int, default=0, help='lines per second; 0 writes --records at once')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--levels', default=DEFAULT_LEVELS)
+    parser.add_argument('--trace-ratio', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    generator = LogGenerator(args.seed, args.levels, args.trace_ratio)
+    if args.rate:
+        counters = write_at_rate([args.path], generator, args.rate, args.seconds)
+        print(f"Wrote {counters['records']} records, {counters['lines']} lines to {args.path}")
+    else:
+        with open(args.path, 'a') as f:
+            f.write(generator.text(args.records))
+        print(f"Wrote {args.records} records to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
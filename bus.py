@@ -0,0 +1,457 @@
+import itertools
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from ingest_engine import PAUSED, RUNNING, STOPPED
+
+# Frame: JSON length, blob length, JSON message, raw blob (e.g. a packed snapshot)
+FRAME_HEADER = struct.Struct('>II')
+# State a source ends up in after each command action
+ACTION_STATES = {'start': RUNNING, 'resume': RUNNING, 'stop': STOPPED, 'pause': PAUSED}
+# Bytes queued for one peer before it counts as stalled and is disconnected
+MAX_QUEUE_BYTES = 64 * 1024 * 1024
+
+
+def encode(message, blob=b''):
+    data = json.dumps(message, separators=(',', ':')).encode()
+    return FRAME_HEADER.pack(len(data), len(blob)) + data + blob
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    """(message, blob, raw frame) of the next frame, or None once the other end closed"""
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    length, blob_length = FRAME_HEADER.unpack(header)
+    body = _recv_exact(sock, length + blob_length)
+    if body is None:
+        return None
+    return json.loads(body[:length]), body[length:], header + body
+
+
+class Peer:
+    """One end of a bus connection.
+
+    A reader thread hands every frame to ``on_message(peer, message, blob,
+    raw)`` in order; frames to send are queued and written by a writer
+    thread, so a slow receiver never blocks the sender. With
+    ``max_queue_bytes`` (the broker's side), a receiver that falls further
+    behind is disconnected instead of buffered for without end; workers exit
+    when they lose the bus, and the restarted one catches up from snapshots.
+    ``on_close(peer)`` runs once when the connection goes away.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, sock, on_message, on_close, max_queue_bytes=None):
+        self.id = next(self._ids)
+        self.sock = sock
+        self.on_message = on_message
+        self.on_close = on_close
+        self.role = None
+        self.name = None
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.max_queue_bytes = max_queue_bytes
+        self.ready = threading.Condition()
+        self.closed = False
+        self.lagging = False
+
+    def start(self):
+        threading.Thread(target=self._read, name=f'bus-read-{self.id}', daemon=True).start()
+        threading.Thread(target=self._write, name=f'bus-write-{self.id}', daemon=True).start()
+
+    def send(self, message, blob=b''):
+        return self.send_raw(encode(message, blob))
+
+    def send_raw(self, frame):
+        with self.ready:
+            if self.closed or self.lagging:
+                return False
+            if self.max_queue_bytes and self.queued_bytes + len(frame) > self.max_queue_bytes:
+                self.lagging = True
+                self.queue.clear()
+                self.queued_bytes = 0
+            else:
+                self.queue.append(frame)
+                self.queued_bytes += len(frame)
+                self.ready.notify()
+                return True
+        # The reader sees the connection end and closes the peer; senders may hold
+        # locks that on_close needs, so it is not called from here
+        print(f"Bus peer {self.name or self.id} is over {self.max_queue_bytes >> 20} MB behind; disconnecting it")
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return False
+
+    def close(self):
+        with self.ready:
+            if self.closed:
+                return
+            self.closed = True
+            self.ready.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.on_close(self)
+
+    def _read(self):
+        try:
+            while True:
+                frame = read_frame(self.sock)
+                if frame is None:
+                    break
+                try:
+                    self.on_message(self, *frame)
+                except Exception as e:
+                    print(f"Error handling bus message {frame[0].get('type')}: {str(e)}")
+        except OSError:
+            pass
+        self.close()
+
+    def _write(self):
+        while True:
+            with self.ready:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if self.closed:
+                    return
+                frames = list(self.queue)
+                self.queue.clear()
+                self.queued_bytes = 0
+            try:
+                self.sock.sendall(b''.join(frames))
+            except OSError:
+                self.close()
+                return
+
+
+class Broker:
+    """Routes messages between ingest workers and web workers over a Unix socket.
+
+    Each source is owned by one ingest worker, which polls it and publishes
+    its batches, state changes and snapshots; web workers receive all of it
+    and send source changes made through the API back to the owner. Records,
+    search results and templates stay on the owners; web workers ask for
+    them with queries, whose answers the broker gathers. The
+    broker keeps every source's definition and the read positions of its
+    latest batch, so when an ingest worker disconnects its sources are handed
+    to the least loaded remaining one. It restores the last checkpoint and
+    reads again up to those positions, without publishing, before it picks
+    up where the previous owner stopped. When an ingest worker (re)starts,
+    sources are moved to it from the busiest ones until the load is even:
+    the old owner stops polling, checkpoints and confirms, and only then is
+    the source assigned again, with the positions of its final batch.
+    """
+
+    def __init__(self, path, sources=()):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sources = {config['id']: config for config in sources}  # id -> definition and state
+        self.owners = {}     # source id -> ingest Peer
+        self.positions = {}  # source id -> {'batches': n, 'cursors': {path: [inode, offset, size, line]}}
+        self.releasing = {}  # source id -> (old owner, new owner) while it moves between ingest workers
+        self.queries = {}    # (web peer id, query id) -> (web Peer, ids of ingest peers yet to answer, answers)
+        self.peers = {}      # peer id -> Peer
+        self.stopping = False
+        self.server = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Source definitions cross the bus with their passwords: owner only
+        umask = os.umask(0o177)
+        try:
+            self.server.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.server.listen(64)
+        threading.Thread(target=self._accept, name='bus-broker', daemon=True).start()
+
+    def stop(self):
+        """Stop handing out sources, e.g. while the workers shut down"""
+        with self.lock:
+            self.stopping = True
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            Peer(sock, self._on_message, self._on_close, MAX_QUEUE_BYTES).start()
+
+    def _peers(self, role):
+        return [peer for peer in self.peers.values() if peer.role == role]
+
+    def _announce(self, source_id, peers=None):
+        """Send a source's definition to the web workers; caller holds ``lock``"""
+        config = dict(self.sources[source_id])
+        owner = self.owners.get(source_id)
+        config['owner'] = owner.name if owner else None
+        frame = encode({'type': 'source', 'config': config})
+        for peer in peers or self._peers('web'):
+            peer.send_raw(frame)
+
+    def _assign(self, source_ids):
+        """Give unowned sources to the least loaded ingest workers; caller holds ``lock``"""
+        workers = self._peers('ingest')
+        if self.stopping or not workers:
+            return
+        load = {peer.id: 0 for peer in workers}
+        for owner in self.owners.values():
+            if owner.id in load:
+                load[owner.id] += 1
+        for source_id in source_ids:
+            if source_id not in self.sources or source_id in self.owners or source_id in self.releasing:
+                continue
+            worker = min(workers, key=lambda peer: load[peer.id])
+            load[worker.id] += 1
+            self._give(source_id, worker)
+
+    def _give(self, source_id, worker):
+        self.owners[source_id] = worker
+        worker.send({'type': 'assign', 'config': self.sources[source_id],
+                     'position': self.positions.get(source_id)})
+        self._announce(source_id)
+
+    def _rebalance(self, worker):
+        """Move sources from the busiest ingest workers to ``worker`` until the load is even;
+        caller holds ``lock``"""
+        if self.stopping:
+            return
+        owned = {}
+        for source_id, owner in self.owners.items():
+            owned.setdefault(owner.id, []).append(source_id)
+        load = len(owned.get(worker.id, [])) + sum(1 for _, new in self.releasing.values() if new is worker)
+        moved = 0
+        while owned:
+            busiest = max(owned, key=lambda peer_id: len(owned[peer_id]))
+            if len(owned[busiest]) - load - moved <= 1:
+                break
+            source_id = owned[busiest].pop()
+            old = self.owners.pop(source_id)
+            self.releasing[source_id] = (old, worker)
+            moved += 1
+            old.send({'type': 'release', 'source_id': source_id})
+        if moved:
+            print(f"Ingest worker {worker.name} joined; moving {moved} sources to it")
+
+    def _on_message(self, peer, message, blob, raw):
+        kind = message['type']
+        with self.lock:
+            if kind == 'batch':
+                source_id = message['source_id']
+                owner = self.owners.get(source_id) or self.releasing.get(source_id, (None,))[0]
+                if owner is not peer:
+                    return  # from an owner the source was taken from
+                position = self.positions.setdefault(source_id, {'batches': 0, 'cursors': {}})
+                position['batches'] = message['batch']
+                cursor = message['cursor']
+                position['cursors'][cursor[0]] = cursor[1:]
+                for web in self._peers('web'):
+                    web.send_raw(raw)
+            elif kind == 'hello':
+                peer.role = message['role']
+                peer.name = message.get('name') or f'{peer.role}-{peer.id}'
+                self.peers[peer.id] = peer
+                if peer.role == 'ingest':
+                    self._assign(list(self.sources))
+                    self._rebalance(peer)
+                else:
+                    for source_id in self.sources:
+                        self._announce(source_id, [peer])
+            elif kind == 'source':
+                # State or filter changed on the owning ingest worker
+                config = message['config']
+                if config['id'] in self.sources and self.owners.get(config['id']) is peer:
+                    self.sources[config['id']] = config
+                    self._announce(config['id'])
+            elif kind == 'released':
+                # The old owner's final batch arrived before this, so the positions are current
+                source_id = message['source_id']
+                old, new = self.releasing.get(source_id, (None, None))
+                if old is not peer:
+                    return
+                del self.releasing[source_id]
+                if self.peers.get(new.id) is new and not self.stopping:
+                    self._give(source_id, new)
+                else:
+                    self._assign([source_id])
+            elif kind == 'query':
+                self._query(peer, message)
+            elif kind == 'answer':
+                key = (message['reply_to'], message['query_id'])
+                query = self.queries.get(key)
+                if query and peer.id in query[1]:
+                    query[1].discard(peer.id)
+                    query[2].append({'worker': peer.name, 'result': message['result']})
+                    self._answer(key)
+            elif kind == 'anomaly':
+                for web in self._peers('web'):
+                    web.send_raw(raw)
+            elif kind == 'snapshot' and peer.role == 'ingest':
+                target = self.peers.get(message['reply_to'])
+                if target:
+                    target.send_raw(raw)
+            elif kind == 'snapshot':
+                owner = self.owners.get(message['source_id'])
+                if owner:
+                    owner.send({'type': 'snapshot', 'source_id': message['source_id'], 'reply_to': peer.id})
+            elif kind == 'add':
+                config = message['config']
+                self.sources[config['id']] = config
+                self._announce(config['id'])
+                self._assign([config['id']])
+            elif kind == 'command':
+                owner = self.owners.get(message['source_id'])
+                if owner:
+                    owner.send_raw(raw)
+                elif message['source_id'] in self.sources:
+                    # No ingest worker to apply it yet; the one it is assigned to will
+                    config = self.sources[message['source_id']]
+                    config['state'] = ACTION_STATES.get(message['action'], config['state'])
+                    if 'filter' in message:
+                        config['filter'] = message['filter']
+                    self._announce(message['source_id'])
+            elif kind == 'remove':
+                source_id = message['source_id']
+                self.sources.pop(source_id, None)
+                self.positions.pop(source_id, None)
+                owner = self.owners.pop(source_id, None) or self.releasing.pop(source_id, (None,))[0]
+                if owner:
+                    owner.send_raw(raw)
+                frame = encode({'type': 'removed', 'source_id': source_id})
+                for web in self._peers('web'):
+                    web.send_raw(frame)
+
+    def _query(self, peer, message):
+        """Ask the owner of ``source_id``, or every ingest worker, on behalf of a web worker;
+        caller holds ``lock``"""
+        if 'source_id' in message:
+            owner = self.owners.get(message['source_id'])
+            targets = [owner] if owner else []
+        else:
+            targets = self._peers('ingest')
+        key = (peer.id, message['query_id'])
+        self.queries[key] = (peer, {target.id for target in targets}, [])
+        frame = encode(dict(message, reply_to=peer.id))
+        for target in targets:
+            target.send_raw(frame)
+        self._answer(key)
+
+    def _answer(self, key):
+        """Send the answers of a query once every asked worker replied or left; caller holds ``lock``"""
+        peer, waiting, answers = self.queries[key]
+        if not waiting:
+            del self.queries[key]
+            peer.send({'type': 'answer', 'query_id': key[1], 'answers': answers})
+
+    def _on_close(self, peer):
+        with self.lock:
+            self.peers.pop(peer.id, None)
+            for key, (web, waiting, _) in list(self.queries.items()):
+                if web is peer:
+                    del self.queries[key]
+                elif peer.id in waiting:
+                    waiting.discard(peer.id)
+                    self._answer(key)
+            orphaned = [source_id for source_id, owner in self.owners.items() if owner is peer]
+            for source_id in orphaned:
+                del self.owners[source_id]
+            # Sources it was handing over go to whoever is least loaded now
+            for source_id, (old, new) in list(self.releasing.items()):
+                if old is peer:
+                    del self.releasing[source_id]
+                    orphaned.append(source_id)
+            if orphaned and not self.stopping:
+                print(f"Ingest worker {peer.name} left; moving {len(orphaned)} sources")
+                self._assign(orphaned)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sources': len(self.sources),
+                'unassigned': len(set(self.sources) - set(self.owners) - set(self.releasing)),
+                'moving': len(self.releasing),
+                'workers': {peer.name: peer.role for peer in self.peers.values()}
+            }
+
+
+class BusClient:
+    """A worker's connection to the broker.
+
+    ``on_message(message, blob)`` runs on one reader thread, in the order the
+    broker sent them; ``on_close()`` runs if the broker goes away. A web
+    worker reads state only the ingest workers keep with ``query``.
+    """
+
+    def __init__(self, path, role, name, on_message, on_close, timeout=10):
+        deadline = time.time() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                break
+            except OSError:
+                sock.close()
+                # The broker may still be starting
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+        self.name = name
+        self.on_message = on_message
+        self.query_ids = itertools.count(1)
+        self.pending = {}  # query id -> [Event, answers]
+        self.peer = Peer(sock, self._dispatch, lambda peer: on_close())
+        self.peer.start()
+        self.send({'type': 'hello', 'role': role, 'name': name})
+
+    def send(self, message, blob=b''):
+        return self.peer.send(message, blob)
+
+    def query(self, name, timeout=10, **args):
+        """Ask the owner of ``source_id`` (when given), or every ingest worker, and wait.
+
+        Returns [{'worker': name, 'result': ...}, ...] with one entry per
+        worker that answered; raises TimeoutError if they take too long.
+        """
+        query_id = next(self.query_ids)
+        waiter = self.pending[query_id] = [threading.Event(), None]
+        try:
+            self.send(dict(args, type='query', query_id=query_id, name=name))
+            if not waiter[0].wait(timeout):
+                raise TimeoutError(f"No answer to '{name}' from the ingest workers")
+            return waiter[1]
+        finally:
+            del self.pending[query_id]
+
+    def _dispatch(self, peer, message, blob, raw):
+        if message['type'] == 'answer':
+            waiter = self.pending.get(message['query_id'])
+            if waiter:
+                waiter[1] = message['answers']
+                waiter[0].set()
+            return
+        self.on_message(message, blob)
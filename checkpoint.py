@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+from cryptography.fernet import Fernet, InvalidToken
+
+
+def pack(sections):
+    """Compact binary form of {name: (JSON-able header, [bytes, ...])}.
+
+    A length-prefixed JSON header describing every section, followed by the
+    raw parts back to back, all zlib-compressed. Nothing is unpickled on load.
+    """
+    header = {}
+    body = []
+    for name, (section_header, parts) in sections.items():
+        header[name] = {'header': section_header, 'parts': [len(part) for part in parts]}
+        body.extend(parts)
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    return zlib.compress(struct.pack('>I', len(encoded)) + encoded + b''.join(body), 1)
+
+
+def unpack(blob):
+    data = zlib.decompress(blob)
+    (length,) = struct.unpack_from('>I', data)
+    header = json.loads(data[4:4 + length])
+    position = 4 + length
+    sections = {}
+    for name, section in header.items():
+        parts = []
+        for size in section['parts']:
+            parts.append(data[position:position + size])
+            position += size
+        sections[name] = (section['header'], parts)
+    return sections
+
+
+class Checkpointer:
+    """Saves ingestion state to SQLite and loads it back at startup.
+
+    One row per source: its definition as JSON with the password encrypted
+    (Fernet; the key comes from ``key`` or a key file next to the database,
+    created readable by the owner only), and its state packed by ``pack``.
+    Every save is a single transaction, so a crash mid-save leaves the
+    previous checkpoint in place. Sources whose state did not change since
+    the last save are skipped.
+    """
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.fernet = Fernet(key or self._key_file(path + '.key'))
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS sources '
+                        '(id TEXT PRIMARY KEY, config TEXT NOT NULL, state BLOB, saved_at REAL)')
+        self.db.commit()
+        self.saved = {}  # source id -> signature of the last saved state
+        self.handed_over = set()  # sources another process checkpoints now
+        self.last_save = None
+        self.last_seconds = None
+
+    @staticmethod
+    def _key_file(path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            key = Fernet.generate_key()
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key)
+            return key
+
+    def save(self, entries):
+        """Write every source and drop the rows of sources this checkpointer saved before
+        that are gone, leaving rows other processes write alone.
+
+        ``entries`` are (source id, config dict, signature, state function);
+        the state function returns pack() sections and is only called when
+        the signature differs from the one saved last time.
+        """
+        started = time.time()
+        with self.lock:
+            rows = self._rows([entry for entry in entries if entry[0] not in self.handed_over], started)
+            gone = set(self.saved) - {entry[0] for entry in entries}
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO sources (id, config, state, saved_at) VALUES (?, ?, ?, ?)',
+                                    [row[:4] for row in rows])
+                self.db.executemany('DELETE FROM sources WHERE id = ?', [(source_id,) for source_id in gone])
+            for row in rows:
+                self.saved[row[0]] = row[4]
+            for source_id in gone:
+                del self.saved[source_id]
+            self.last_save = started
+            self.last_seconds = time.time() - started
+        return len(rows)
+
+    def _rows(self, entries, started):
+        rows = []
+        for source_id, config, signature, state in entries:
+            if self.saved.get(source_id) == signature:
+                continue
+            config = dict(config)
+            config['password'] = self.fernet.encrypt(config['password'].encode()).decode()
+            rows.append((source_id, json.dumps(config), pack(state()), started, signature))
+        return rows
+
+    def hand_over(self, entry):
+        """Write one source's final state for the process taking it over and stop saving it.
+
+        Its row is left in place from then on, even though it is no longer
+        among the entries passed to ``save``; ``load_source`` takes it back.
+        """
+        started = time.time()
+        with self.lock:
+            rows = self._rows([entry], started)
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO sources (id, config, state, saved_at) VALUES (?, ?, ?, ?)',
+                                    [row[:4] for row in rows])
+            self.saved.pop(entry[0], None)
+            self.handed_over.add(entry[0])
+
+    def delete(self, source_id):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM sources WHERE id = ?', (source_id,))
+            self.saved.pop(source_id, None)
+            self.handed_over.discard(source_id)
+
+    def _decrypt(self, source_id, config):
+        config = json.loads(config)
+        try:
+            config['password'] = self.fernet.decrypt(config['password'].encode()).decode()
+        except InvalidToken:
+            print(f"Skipping checkpoint of source {config.get('name', source_id)}: wrong checkpoint key")
+            return None
+        return config
+
+    def load(self):
+        """(config with the password decrypted, pack() sections or None) per saved source"""
+        with self.lock:
+            rows = self.db.execute('SELECT id, config, state FROM sources ORDER BY saved_at').fetchall()
+        sources = []
+        for source_id, config, state in rows:
+            config = self._decrypt(source_id, config)
+            if config is None:
+                continue
+            try:
+                sources.append((config, unpack(state) if state else None))
+            except (zlib.error, ValueError) as e:
+                print(f"Skipping checkpoint of source {config['name']}: {str(e)}")
+        return sources
+
+    def configs(self):
+        """Saved source definitions alone, passwords decrypted"""
+        with self.lock:
+            rows = self.db.execute('SELECT id, config FROM sources ORDER BY saved_at').fetchall()
+        configs = [self._decrypt(source_id, config) for source_id, config in rows]
+        return [config for config in configs if config is not None]
+
+    def load_source(self, source_id):
+        """pack() sections saved for one source, or None"""
+        with self.lock:
+            self.handed_over.discard(source_id)
+            row = self.db.execute('SELECT state FROM sources WHERE id = ?', (source_id,)).fetchone()
+        if not row or not row[0]:
+            return None
+        try:
+            return unpack(row[0])
+        except (zlib.error, ValueError) as e:
+            print(f"Skipping checkpoint of source {source_id}: {str(e)}")
+            return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'path': self.path,
+                'sources': len(self.saved),
+                'last_save': self.last_save,
+                'last_save_seconds': round(self.last_seconds, 3) if self.last_seconds is not None else None
+            }
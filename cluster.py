@@ -0,0 +1,85 @@
+"""Run the log analyzer as ingest workers and web workers joined by a local bus.
+
+    python cluster.py [--ingest-workers 2] [--web-workers 2] [--port 3011]
+
+The broker runs in this process on a Unix socket. Ingest workers (app.py with
+APP_ROLE=ingest) poll the sources the broker assigns them; web workers
+(APP_ROLE=web) serve the UI and API on --port, --port + 1, ... Workers that
+exit are started again, and the sources of an ingest worker that exits are
+moved to the others right away. Ctrl-C or SIGTERM stops everything after the
+ingest workers saved a last checkpoint.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from bus import Broker
+from checkpoint import Checkpointer
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def spawn(role, index, args, port=None):
+    env = dict(os.environ, APP_ROLE=role, BUS_PATH=args.bus, WORKER_NAME=f'{role}-{index}')
+    if port:
+        env['PORT'] = str(port)
+    return subprocess.Popen([sys.executable, APP], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ingest-workers', type=int, default=2)
+    parser.add_argument('--web-workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=3011, help='port of the first web worker')
+    parser.add_argument('--bus', default=os.environ.get('BUS_PATH', 'log-analyzer.sock'),
+                        help='Unix socket the broker listens on')
+    args = parser.parse_args()
+
+    # Sources of the last run, from the checkpoints the ingest workers wrote
+    sources = []
+    path = os.environ.get('CHECKPOINT_PATH', 'checkpoints.db')
+    if path:
+        sources = Checkpointer(path, os.environ.get('CHECKPOINT_KEY')).configs()
+    broker = Broker(args.bus, sources)
+    broker.start()
+    print(f"Bus on {args.bus} with {len(sources)} sources from the last run")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)  # also when started in the background, where it is ignored
+
+    workers = {}
+    for i in range(args.ingest_workers):
+        workers[('ingest', i)] = spawn('ingest', i, args)
+    for i in range(args.web_workers):
+        workers[('web', i)] = spawn('web', i, args, args.port + i)
+        print(f"Web worker {i} on port {args.port + i}")
+
+    try:
+        while True:
+            time.sleep(1)
+            for (role, i), process in list(workers.items()):
+                if process.poll() is not None:
+                    print(f"{role} worker {i} exited with status {process.returncode}; starting it again")
+                    workers[(role, i)] = spawn(role, i, args, args.port + i if role == 'web' else None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Keep sources where they are while the workers save and exit
+        broker.stop()
+        for process in workers.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in workers.values():
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == '__main__':
+    main()
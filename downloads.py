@@ -0,0 +1,156 @@
+import zlib
+
+from flask import Response
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+# Bytes held per download between the SSH channel and the client
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def choose_encoding(accept_encoding):
+    """zstd or gzip if the Accept-Encoding header allows it, else None for identity"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ('zstd', 'gzip'):
+        if encoding == 'zstd' and zstandard is None:
+            continue
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class ClosingChunks:
+    """Iterates ``generator`` and closes the ``chunks`` it reads from on close().
+
+    A generator that was never started skips its ``finally`` when closed,
+    which would leave e.g. a pooled SSH channel open; this closes both.
+    """
+
+    def __init__(self, generator, chunks):
+        self.generator = generator
+        self.chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.generator)
+
+    def close(self):
+        self.generator.close()
+        close_chunks(self.chunks)
+
+
+def close_chunks(chunks):
+    """Release whatever feeds a chunk iterator (e.g. a pooled SSH channel)"""
+    close = getattr(chunks, 'close', None)
+    if close:
+        close()
+
+
+def encode_chunks(chunks, encoding):
+    """Compress a stream of byte chunks on the fly"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress():
+        try:
+            for chunk in chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            close_chunks(chunks)
+    return ClosingChunks(compress(), chunks)
+
+
+def prepend(first, chunks):
+    """Put back a chunk that was read ahead to check for empty output"""
+    def joined():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            close_chunks(chunks)
+    return ClosingChunks(joined(), chunks)
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' Range header, or None to send everything.
+
+    Multiple ranges and malformed headers are ignored, as RFC 9110 allows.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(0, size - suffix), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def stream_response(chunks, filename, accept_encoding=None, size=None, byte_range=None):
+    """Chunked text/plain attachment, compressed when the client accepts it.
+
+    With ``size`` the response advertises byte ranges; a ``byte_range`` from
+    parse_range is sent uncompressed as 206 Partial Content so resumed
+    downloads line up byte for byte.
+    """
+    headers = {
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding'
+    }
+    status = 200
+    if size is not None:
+        headers['Accept-Ranges'] = 'bytes'
+
+    encoding = None if byte_range else choose_encoding(accept_encoding)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        chunks = encode_chunks(chunks, encoding)
+    elif byte_range:
+        start, end = byte_range
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+    elif size is not None:
+        headers['Content-Length'] = str(size)
+
+    return Response(chunks, status=status, mimetype='text/plain', headers=headers,
+                    direct_passthrough=True)
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import Counter, deque
+
+
+class ClientQueue:
+    """Frames waiting for one Socket.IO client, with at most a few unacknowledged"""
+
+    def __init__(self, sid, max_backlog, max_inflight):
+        self.sid = sid
+        self.sources = set()
+        self.backlog = deque()
+        self.max_backlog = max_backlog
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.last_sent = 0
+        self.dropped = {}  # source_id -> Counter of levels
+
+    def drop_oldest(self):
+        frame = self.backlog.popleft()
+        levels = self.dropped.setdefault(frame['source_id'], Counter())
+        levels.update(record['level'] for record in frame['records'])
+
+
+class LogFanout:
+    """Coalesces ingested records into per-source ``log_batch`` frames.
+
+    Records are buffered per source and flushed every ``flush_interval``
+    seconds, or as soon as a source has ``batch_size`` pending. Clients
+    subscribe to the sources they view and only receive those; frames go to
+    each client's own sid, not a shared room, since every client is paced by
+    its own acknowledgements. Each client may have ``max_inflight`` frames awaiting acknowledgement;
+    beyond that frames queue up to ``max_backlog``, after which the oldest
+    are dropped and summarised in a ``log_dropped`` event (counts per level)
+    so a slow browser degrades instead of backing up the server.
+    """
+
+    def __init__(self, socketio, batch_size=500, flush_interval=0.1,
+                 max_backlog=20, max_inflight=2, ack_timeout=30):
+        self.socketio = socketio
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+        self.lock = threading.Lock()
+        # Held across take-and-emit so frames leave in the order they were queued
+        self.send_lock = threading.Lock()
+        self.pending = {}      # source_id -> [records]
+        self.subscribers = {}  # source_id -> {sid}
+        self.clients = {}      # sid -> ClientQueue
+        self.wakeup = threading.Event()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        self.socketio.start_background_task(self._run)
+
+    def publish(self, source_id, records):
+        """Queue newly ingested records of one source for delivery"""
+        if not records:
+            return
+        with self.lock:
+            if not self.subscribers.get(source_id):
+                return
+            pending = self.pending.setdefault(source_id, [])
+            pending.extend(records)
+            full = len(pending) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def subscribe(self, sid, source_ids):
+        self.start()
+        with self.lock:
+            client = self.clients.get(sid)
+            if client is None:
+                client = self.clients[sid] = ClientQueue(sid, self.max_backlog, self.max_inflight)
+            for source_id in source_ids:
+                client.sources.add(source_id)
+                self.subscribers.setdefault(source_id, set()).add(sid)
+
+    def unsubscribe(self, sid, source_ids):
+        with self.lock:
+            client = self.clients.get(sid)
+            for source_id in source_ids:
+                if client:
+                    client.sources.discard(source_id)
+                self.subscribers.get(source_id, set()).discard(sid)
+
+    def disconnect(self, sid):
+        with self.lock:
+            client = self.clients.pop(sid, None)
+            if client:
+                for source_id in client.sources:
+                    self.subscribers.get(source_id, set()).discard(sid)
+
+    def remove_source(self, source_id):
+        with self.lock:
+            self.pending.pop(source_id, None)
+            for sid in self.subscribers.pop(source_id, set()):
+                client = self.clients.get(sid)
+                if client:
+                    client.sources.discard(source_id)
+
+    def queue_depth(self):
+        """Frames waiting across all clients"""
+        with self.lock:
+            return sum(len(client.backlog) for client in self.clients.values())
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error fanning out logs: {str(e)}")
+
+    def flush(self):
+        with self.send_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                ready = []
+                for source_id, records in pending.items():
+                    sids = self.subscribers.get(source_id)
+                    if not sids:
+                        continue
+                    for start in range(0, len(records), self.batch_size):
+                        frame = {
+                            'source_id': source_id,
+                            'records': records[start:start + self.batch_size]
+                        }
+                        for sid in sids:
+                            client = self.clients.get(sid)
+                            if client is None:
+                                continue
+                            client.backlog.append(frame)
+                            while len(client.backlog) > client.max_backlog:
+                                client.drop_oldest()
+
+                now = time.time()
+                for client in self.clients.values():
+                    if client.inflight and now - client.last_sent > self.ack_timeout:
+                        # Acks never came back; assume they were lost
+                        client.inflight = 0
+                    ready.extend(self._take(client, now))
+
+            for sid, event, payload, callback in ready:
+                self.socketio.emit(event, payload, to=sid, callback=callback)
+
+    def _take(self, client, now):
+        """Pop what ``client`` may receive right now; caller holds ``lock``"""
+        messages = []
+        if client.dropped and client.inflight < client.max_inflight:
+            for source_id, levels in client.dropped.items():
+                messages.append((client.sid, 'log_dropped', {
+                    'source_id': source_id,
+                    'count': sum(levels.values()),
+                    'levels': dict(levels)
+                }, None))
+            client.dropped = {}
+        while client.backlog and client.inflight < client.max_inflight:
+            frame = client.backlog.popleft()
+            client.inflight += 1
+            client.last_sent = now
+            messages.append((client.sid, 'log_batch', frame, self._ack_callback(client.sid)))
+        return messages
+
+    def _ack_callback(self, sid):
+        def ack(*args):
+            with self.send_lock:
+                with self.lock:
+                    client = self.clients.get(sid)
+                    if client is None:
+                        return
+                    client.inflight = max(0, client.inflight - 1)
+                    ready = self._take(client, time.time())
+                for target, event, payload, callback in ready:
+                    self.socketio.emit(event, payload, to=target, callback=callback)
+        return ack
@@ -0,0 +1,92 @@
+from log_index import find_record
+
+
+def parse_cursor(cursor):
+    """('memory', seq) or ('file', inode, offset) from a history page cursor"""
+    try:
+        kind, *parts = cursor.split('.')
+        if kind == 'm' and len(parts) == 1:
+            return 'memory', int(parts[0])
+        if kind == 'f' and len(parts) == 2:
+            return 'file', int(parts[0]), int(parts[1])
+    except ValueError:
+        pass
+    raise ValueError("Invalid cursor")
+
+
+def memory_page(store, before_seq, limit):
+    """Up to ``limit`` records older than ``before_seq`` (newest first when None).
+
+    Returns (records newest first, cursor of the next page, or None when
+    the page came up short because the store holds nothing older).
+    """
+    start = None if before_seq is None else before_seq - 1
+    records = []
+    for record in store.iter_records(start_seq=start, reverse=True):
+        records.append(record)
+        if len(records) == limit:
+            return records, f"m.{record['seq']}"
+    return records, None
+
+
+def history_start(source):
+    """(file cursor, offset) where the history older than the in-memory records ends.
+
+    None when that is the start of the file or cannot be told, e.g. when
+    the sparse index does not reach back to the oldest stored record.
+    """
+    store = source.logs
+    oldest = store.get(store.first_seq) if len(store) else None
+    if oldest is None:
+        # Nothing ingested yet: everything before the read position is history
+        cursors = [cursor for cursor in list(source.tailer.cursors.values()) if cursor.offset > 0]
+        if not cursors:
+            return None
+        cursor = max(cursors, key=lambda c: c.offset)
+        return cursor, cursor.offset
+    cursor = source.tailer.cursor_for(oldest['epoch_ms'])
+    if cursor is None:
+        return None
+    found = find_record(source.tailer.transport, cursor, source.parser.parse_chunk, oldest['epoch_ms'])
+    if found is None and cursor.index.first_epoch == oldest['epoch_ms']:
+        # The oldest stored record is the first one indexed, where following began
+        found = cursor.index.first_offset, None
+    if not found or not found[0]:
+        return None
+    return cursor, found[0]
+
+
+def record_starts(parser, data, from_line_start):
+    """Offsets of the lines in ``data`` that start a record"""
+    starts = []
+    lines = data.count(b'\n') + 1
+    position = parser.next_record_start(data, 0 if from_line_start else 1, max_lines=lines)
+    while position is not None:
+        starts.append(position)
+        position = parser.next_record_start(data, position + 1, max_lines=lines)
+    return starts
+
+
+def read_before(transport, path, end, parser, limit, block_size=64 * 1024, max_bytes=4 * 1024 * 1024):
+    """Up to ``limit`` records that end before byte ``end`` of ``path``.
+
+    Reads backwards in growing blocks until ``limit`` records are found, the
+    start of the file is reached or ``max_bytes`` were read. Returns
+    (records newest first, offset of the oldest one, or None at the start
+    of the file).
+    """
+    size = block_size
+    while True:
+        start = max(0, end - size)
+        data = transport.read_range(path, start, end - start)
+        # Past the first block boundary the first line may be cut
+        starts = record_starts(parser, data, start == 0)
+        if len(starts) > limit or start == 0 or size >= max_bytes:
+            break
+        size *= 4
+    if not starts:
+        return [], None
+    first = starts[max(0, len(starts) - limit)]
+    records, _ = parser.parse_chunk(data[first:], True)
+    offset = start + first
+    return records[::-1], offset if offset > 0 else None
@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+RUNNING = 'running'
+PAUSED = 'paused'
+STOPPED = 'stopped'
+
+
+class IngestJob:
+    """Scheduling state of one source inside the engine"""
+
+    def __init__(self, key, poll, name, interval, state=RUNNING):
+        self.key = key
+        self.poll = poll
+        self.name = name or key
+        self.state = state
+        self.interval = interval
+        self.generation = 0  # bumped on every state change to void queued runs
+        self.polls = 0
+        self.records = 0
+        self.errors = 0
+        self.last_poll = None
+
+
+class IngestEngine:
+    """Polls every source from one asyncio loop with a fixed worker budget.
+
+    Sources are kept in a heap ordered by when they are next due. At most
+    ``max_workers`` polls run at once, on a thread pool because the SSH and
+    file transports block. A source's ``poll()`` returns ``(records, pending,
+    backlogged)``: sources that produced records or hold back a partial one
+    are polled again after ``min_interval``, idle ones back off by doubling
+    up to ``max_interval``, and backlogged ones are rescheduled immediately.
+    Failing sources wait ``error_interval``. A key never has two polls in
+    flight: a source stopped and started again mid-poll waits for the running
+    poll to finish before its new job is scheduled.
+    """
+
+    def __init__(self, max_workers=8, min_interval=0.5, max_interval=5.0, error_interval=5.0):
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.error_interval = error_interval
+        self.jobs = {}
+        self.heap = []  # (due, sequence, generation, key)
+        self.sequence = 0
+        self.in_flight = 0
+        self.polling = {}  # key -> callbacks to run once its in-flight poll returns
+        self.loop = None
+        self.wakeup = None
+        self.executor = None
+        self.started = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                               thread_name_prefix='ingest')
+        thread = threading.Thread(target=self._run, name='ingest-engine', daemon=True)
+        thread.start()
+        self.started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.started.set()
+        self.loop.run_until_complete(self._schedule())
+
+    def _call(self, func, *args):
+        """Run ``func`` on the engine loop and wait; job state is only touched there"""
+        self.start()
+        future = Future()
+
+        def apply():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(apply)
+        return future.result()
+
+    def add(self, key, poll, name=None, state=RUNNING):
+        """Start polling a source (or only register it, as PAUSED); replaces any job already using ``key``"""
+        self._call(self._add, key, poll, name, state)
+
+    def remove(self, key, then=None):
+        """Stop polling ``key``; ``then()`` runs on the engine loop once no poll of it is in flight"""
+        self._call(self._remove, key, then)
+
+    def pause(self, key):
+        self._call(self._set_state, key, PAUSED)
+
+    def resume(self, key):
+        self._call(self._set_state, key, RUNNING)
+
+    def state(self, key):
+        job = self.jobs.get(key)
+        return job.state if job else STOPPED
+
+    def stats(self):
+        jobs = list(self.jobs.values())
+        return {
+            'sources': len(jobs),
+            'running': sum(1 for job in jobs if job.state == RUNNING),
+            'paused': sum(1 for job in jobs if job.state == PAUSED),
+            'in_flight': self.in_flight,
+            'workers': self.max_workers,
+            'polls': sum(job.polls for job in jobs),
+            'errors': sum(job.errors for job in jobs)
+        }
+
+    def _add(self, key, poll, name, state):
+        old = self.jobs.get(key)
+        if old:
+            old.generation += 1
+        job = self.jobs[key] = IngestJob(key, poll, name, self.min_interval, state)
+        if state == RUNNING and key not in self.polling:
+            self._push(job, 0)
+
+    def _remove(self, key, then):
+        job = self.jobs.pop(key, None)
+        if job:
+            job.state = STOPPED
+            job.generation += 1
+        if then is None:
+            return
+        if key in self.polling:
+            self.polling[key].append(then)
+        else:
+            self._run_callback(then)
+
+    @staticmethod
+    def _run_callback(callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error after stopping a source: {str(e)}")
+
+    def _set_state(self, key, state):
+        job = self.jobs.get(key)
+        if job is None or job.state == state:
+            return
+        job.state = state
+        job.generation += 1
+        if state == RUNNING:
+            job.interval = self.min_interval
+            if key not in self.polling:
+                self._push(job, 0)
+
+    def _push(self, job, delay):
+        self.sequence += 1
+        heapq.heappush(self.heap, (self.loop.time() + delay, self.sequence, job.generation, job.key))
+        self.wakeup.set()
+
+    async def _schedule(self):
+        while True:
+            now = self.loop.time()
+            while self.heap and self.heap[0][0] <= now and self.in_flight < self.max_workers:
+                _, _, generation, key = heapq.heappop(self.heap)
+                job = self.jobs.get(key)
+                if job is None or job.generation != generation or job.state != RUNNING or key in self.polling:
+                    continue
+                self.polling[key] = []
+                self.in_flight += 1
+                self.loop.create_task(self._poll(job))
+
+            timeout = None
+            if self.heap and self.in_flight < self.max_workers:
+                timeout = max(0, self.heap[0][0] - now)
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job):
+        generation = job.generation
+        delay = self.error_interval
+        try:
+            records, pending, backlogged = await self.loop.run_in_executor(self.executor, job.poll)
+            job.records += records
+            if backlogged:
+                delay = 0
+            elif records or pending:
+                job.interval = self.min_interval
+                delay = job.interval
+            else:
+                job.interval = min(job.interval * 2, self.max_interval)
+                delay = job.interval
+        except Exception as e:
+            job.errors += 1
+            print(f"Error polling {job.name}: {str(e)}")
+        finally:
+            job.polls += 1
+            job.last_poll = time.time()
+            self.in_flight -= 1
+            for callback in self.polling.pop(job.key, ()):
+                self._run_callback(callback)
+            current = self.jobs.get(job.key)
+            if current is job and job.state == RUNNING:
+                # Resumed while this poll ran: go again straight away
+                if job.generation == generation:
+                    self._push(job, delay)
+                else:
+                    self._push(job, 0)
+            elif current is not None and current.state == RUNNING:
+                # Stopped and started again while this poll ran
+                self._push(current, 0)
+            self.wakeup.set()
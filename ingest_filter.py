@@ -0,0 +1,160 @@
+import re
+
+from log_parser import LEVEL_ALIASES
+
+# Severity order for min_level; levels outside it always pass
+LEVELS = ('DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL')
+LEVEL_RANKS = {level: rank for rank, level in enumerate(LEVELS)}
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+# Runs on the log host over the bytes of one ranged read (plus a closing
+# newline), grouping lines into records like Log4jParser does: a line that
+# starts with a date opens a record, other lines continue it. Kept records are
+# printed unchanged. The last record is held back unless final=1, as its stack
+# trace may still be growing. A trailer line reports the bytes and lines
+# covered and the records and lines dropped.
+# LC_ALL=C makes length() count bytes.
+LOG4J_SCRIPT = r'''
+function keep(    i, ok) {
+    if (level in drop) return 0
+    if (ninclude) {
+        ok = 0
+        for (i = 1; i <= ninclude; i++) if (index(component, include[i]) == 1) ok = 1
+        if (!ok) return 0
+    }
+    for (i = 1; i <= nexclude; i++) if (index(component, exclude[i]) == 1) return 0
+    if (literal != "" && index(record, literal) == 0) return 0
+    return 1
+}
+function flush() {
+    if (!open) return
+    if (keep()) printf "%%s", record
+    else { dropped++; dropped_lines += record_lines }
+    open = 0
+}
+function add(text, bytes, newline,    rest) {
+    if (text ~ /^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T/) {
+        flush()
+        open = 1; start = pos; start_lines = lines
+        record = text "\n"; record_lines = 1
+        split(text, fields, /[ \t]+/); level = fields[2]
+        rest = substr(text, index(text, "]") + 1)
+        sub(/^[ \t]+/, "", rest); sub(/[ \t-].*$/, "", rest); component = rest
+    } else if (open) {
+        record = record text "\n"; record_lines++
+    }
+    pos += bytes; lines += newline
+}
+BEGIN { %(setup)s }
+NR > 1 { add(last, length(last) + 1, 1) }
+{ last = $0 }
+END {
+    if (final) {
+        if (last != "") add(last, length(last), 0)
+        flush(); consumed = pos; consumed_lines = lines
+    } else if (open) {
+        consumed = start; consumed_lines = start_lines
+    } else {
+        consumed = pos; consumed_lines = lines
+    }
+    printf "\036%%d %%d %%d %%d\n", consumed, consumed_lines, dropped, dropped_lines
+}
+'''
+
+
+def _awk_string(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _names(value):
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = value.split(',')
+    names = tuple(str(name).strip() for name in value if str(name).strip())
+    if any('\n' in name for name in names):
+        raise ValueError('Component names cannot contain newlines')
+    return names
+
+
+class IngestFilter:
+    """Which records a LogSource ingests: a minimum level, component prefixes
+    to include or exclude and a regex the message must contain.
+
+    ``matches`` is the authoritative check and runs on every parsed record.
+    For log4j sources ``remote_script`` also compiles the filter into an awk
+    program that drops records on the log host before they cross the wire.
+    It may let extra records through (a regex message filter is only pushed
+    down when it is a plain string), but never drops one ``matches`` keeps.
+    """
+
+    def __init__(self, min_level=None, include_components=(), exclude_components=(), message_regex=None):
+        if min_level:
+            min_level = str(min_level).upper()
+            min_level = LEVEL_ALIASES.get(min_level, min_level)
+            if min_level not in LEVEL_RANKS:
+                raise ValueError(f"Unknown min_level '{min_level}'. Use one of: {', '.join(LEVELS)}")
+        self.min_level = min_level or None
+        self.include_components = _names(include_components)
+        self.exclude_components = _names(exclude_components)
+        self.message_regex = message_regex or None
+        try:
+            self.message = re.compile(message_regex) if message_regex else None
+        except re.error as e:
+            raise ValueError(f"Invalid message_regex: {e}")
+        if self.message_regex and '\n' in self.message_regex:
+            raise ValueError('message_regex cannot contain newlines')
+
+    @classmethod
+    def from_dict(cls, data):
+        """The filter described by a request body, or None for an empty one"""
+        if not data:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError('filter must be an object')
+        unknown = set(data) - {'min_level', 'include_components', 'exclude_components', 'message_regex'}
+        if unknown:
+            raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+        ingest_filter = cls(**data)
+        return ingest_filter if ingest_filter.active else None
+
+    @property
+    def active(self):
+        return bool(self.min_level or self.include_components or self.exclude_components or self.message)
+
+    def to_dict(self):
+        return {
+            'min_level': self.min_level,
+            'include_components': list(self.include_components),
+            'exclude_components': list(self.exclude_components),
+            'message_regex': self.message_regex
+        }
+
+    def matches(self, record):
+        if self.min_level and LEVEL_RANKS.get(record['level'], len(LEVELS)) < LEVEL_RANKS[self.min_level]:
+            return False
+        component = record['component']
+        if self.include_components and not component.startswith(self.include_components):
+            return False
+        if self.exclude_components and component.startswith(self.exclude_components):
+            return False
+        return not self.message or self.message.search(record['message']) is not None
+
+    def remote_script(self, log_format):
+        """awk program for the log host, or None when the format cannot be filtered there"""
+        if log_format != 'log4j':
+            return None
+        setup = []
+        if self.min_level:
+            rank = LEVEL_RANKS[self.min_level]
+            # Raw level names, as the parser only maps the aliases it knows
+            for name in list(LEVELS) + list(LEVEL_ALIASES):
+                if LEVEL_RANKS.get(LEVEL_ALIASES.get(name, name), rank) < rank:
+                    setup.append(f'drop[{_awk_string(name)}] = 1')
+        for array, names in (('include', self.include_components), ('exclude', self.exclude_components)):
+            for i, name in enumerate(names, 1):
+                setup.append(f'{array}[{i}] = {_awk_string(name)}')
+            setup.append(f'n{array} = {len(names)}')
+        if self.message_regex and not REGEX_CHARS.intersection(self.message_regex):
+            setup.append(f'literal = {_awk_string(self.message_regex)}')
+        return LOG4J_SCRIPT % {'setup': '; '.join(setup)}
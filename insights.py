@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import Counter, deque
+
+# Sliding windows served by /api/insights?window=..., in seconds
+WINDOWS = {'1m': 60, '15m': 900, '1h': 3600}
+
+# Health score weight per level, in tenths so running sums stay exact
+HEALTH_WEIGHTS = {'ERROR': 10, 'WARN': 5, 'INFO': 1, 'DEBUG': 0}
+
+
+class LevelCounts:
+    """Record counts by level and by (level, component), plus the health numerator"""
+
+    __slots__ = ('total', 'weighted', 'levels', 'components')
+
+    def __init__(self):
+        self.total = 0
+        self.weighted = 0
+        self.levels = {}
+        self.components = {}  # level -> {component: count}
+
+    def add(self, level, component, count=1):
+        self.total += count
+        self.weighted += HEALTH_WEIGHTS.get(level, 0) * count
+        self.levels[level] = self.levels.get(level, 0) + count
+        by_component = self.components.get(level)
+        if by_component is None:
+            by_component = self.components[level] = {}
+        by_component[component] = by_component.get(component, 0) + count
+
+    def merge(self, other, sign=1):
+        """Add (or with sign=-1 remove) another set of counts"""
+        self.total += sign * other.total
+        self.weighted += sign * other.weighted
+        for level, count in other.levels.items():
+            remaining = self.levels.get(level, 0) + sign * count
+            if remaining > 0:
+                self.levels[level] = remaining
+            else:
+                self.levels.pop(level, None)
+        for level, by_component in other.components.items():
+            ours = self.components.setdefault(level, {})
+            for component, count in by_component.items():
+                remaining = ours.get(component, 0) + sign * count
+                if remaining > 0:
+                    ours[component] = remaining
+                else:
+                    ours.pop(component, None)
+            if not ours:
+                del self.components[level]
+
+    def to_dict(self):
+        return {'total': self.total, 'weighted': self.weighted, 'levels': self.levels,
+                'components': self.components}
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = cls()
+        counts.total = data['total']
+        counts.weighted = data['weighted']
+        counts.levels = dict(data['levels'])
+        counts.components = {level: dict(by_component) for level, by_component in data['components'].items()}
+        return counts
+
+    def hotspot(self, level):
+        """(component, count) with the most records at ``level``, or None"""
+        by_component = self.components.get(level)
+        if not by_component:
+            return None
+        return max(by_component.items(), key=lambda item: item[1])
+
+    def health_score(self):
+        if self.total == 0:
+            return 100
+        # 100 is perfect health, 0 is critical
+        score = 100 * (1 - self.weighted / (self.total * HEALTH_WEIGHTS['ERROR']))
+        return round(max(0, min(100, score)), 2)
+
+
+class SlidingWindow:
+    """Counts over the last ``span`` seconds kept as a ring of time buckets.
+
+    Each bucket holds its own counts; when it ages out they are subtracted
+    from the running totals, so adding and reading are both independent of
+    how many records the window covers.
+    """
+
+    def __init__(self, span, buckets=60):
+        self.span = span
+        self.bucket_count = buckets
+        self.width = span / buckets
+        self.buckets = deque()  # (bucket_id, LevelCounts)
+        self.totals = LevelCounts()
+
+    def _bucket(self, now):
+        bucket_id = int(now // self.width)
+        if not self.buckets or self.buckets[-1][0] != bucket_id:
+            self.buckets.append((bucket_id, LevelCounts()))
+        return self.buckets[-1][1]
+
+    def add(self, now, level, component, count=1):
+        self.expire(now)
+        self._bucket(now).add(level, component, count)
+        self.totals.add(level, component, count)
+
+    def expire(self, now):
+        oldest = int(now // self.width) - self.bucket_count + 1
+        while self.buckets and self.buckets[0][0] < oldest:
+            _, counts = self.buckets.popleft()
+            self.totals.merge(counts, -1)
+
+    def subtract(self, other):
+        """Remove another window's buckets (same span) from this one"""
+        ours = dict(self.buckets)
+        for bucket_id, counts in other.buckets:
+            bucket = ours.get(bucket_id)
+            if bucket is not None:
+                bucket.merge(counts, -1)
+                self.totals.merge(counts, -1)
+
+
+class InsightAggregator:
+    """Running insight aggregates, updated as records are ingested.
+
+    Keeps cumulative counts plus one SlidingWindow per entry in WINDOWS, so
+    /api/insights reads a snapshot instead of rescanning stored records.
+    Windows are measured in arrival time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cumulative = LevelCounts()
+        self.windows = {name: SlidingWindow(span) for name, span in WINDOWS.items()}
+
+    def add_records(self, records, now=None):
+        """Fold a batch of parsed records into every aggregate"""
+        # Collapse the batch first: a handful of distinct (level, component) pairs
+        batch = Counter((record['level'], record.get('component') or 'Unknown') for record in records)
+        self.add_grouped(batch, now)
+
+    def add_grouped(self, counts, now=None):
+        """Fold a batch already counted as {(level, component): count}, e.g. by a parse worker"""
+        if not counts:
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            for (level, component), count in counts.items():
+                self.cumulative.add(level, component, count)
+                for window in self.windows.values():
+                    window.add(now, level, component, count)
+
+    def add_counts(self, counts):
+        """Fold saved cumulative counts back in (a restored source); windows start empty"""
+        with self.lock:
+            self.cumulative.merge(counts)
+
+    def subtract(self, other):
+        """Forget everything another aggregator contributed (a removed source)"""
+        with self.lock, other.lock:
+            self.cumulative.merge(other.cumulative, -1)
+            for name, window in self.windows.items():
+                window.subtract(other.windows[name])
+
+    def snapshot(self, window='all', now=None):
+        """A copy of the counts for 'all' or one of WINDOWS"""
+        now = time.time() if now is None else now
+        copy = LevelCounts()
+        with self.lock:
+            if window == 'all':
+                copy.merge(self.cumulative)
+            else:
+                sliding = self.windows[window]
+                sliding.expire(now)
+                copy.merge(sliding.totals)
+        return copy
+
+
+def build_insights(counts, patterns=(), anomalies=()):
+    """Anomalies, patterns, summary and recommendations from a LevelCounts.
+
+    ``patterns`` and ``anomalies`` are extra entries for those sections, such
+    as bursting log templates or rate alerts.
+    """
+    insights = {
+        'anomalies': [],
+        'patterns': [],
+        'summary': {},
+        'recommendations': []
+    }
+
+    insights['anomalies'].extend(anomalies)
+
+    # Find most problematic components
+    error_hotspot = counts.hotspot('ERROR')
+    if error_hotspot:
+        insights['anomalies'].append({
+            'type': 'error_hotspot',
+            'message': f"Component '{error_hotspot[0]}' has the highest error count ({error_hotspot[1]} errors)",
+            'severity': 'high'
+        })
+
+    # Find components with many warnings
+    warning_hotspot = counts.hotspot('WARN')
+    if warning_hotspot:
+        insights['patterns'].append({
+            'type': 'warning_pattern',
+            'message': f"Component '{warning_hotspot[0]}' shows repeated warnings ({warning_hotspot[1]} warnings)",
+            'severity': 'medium'
+        })
+    insights['patterns'].extend(patterns)
+
+    # Generate summary
+    total_logs = counts.total
+    error_rate = counts.levels.get('ERROR', 0) / total_logs if total_logs > 0 else 0
+    warning_rate = counts.levels.get('WARN', 0) / total_logs if total_logs > 0 else 0
+
+    insights['summary'] = {
+        'total_logs': total_logs,
+        'error_rate': error_rate,
+        'warning_rate': warning_rate,
+        'health_score': counts.health_score()
+    }
+
+    # Generate recommendations
+    if error_rate > 0.1:
+        insights['recommendations'].append({
+            'type': 'high_error_rate',
+            'message': 'High error rate detected. Consider reviewing error handling in problematic components.',
+            'action': 'Review error handling mechanisms'
+        })
+
+    if warning_rate > 0.2:
+        insights['recommendations'].append({
+            'type': 'high_warning_rate',
+            'message': 'High warning rate detected. Consider upgrading or optimizing warned components.',
+            'action': 'Optimize warned components'
+        })
+
+    # Add default insights if no issues found
+    if not insights['anomalies']:
+        insights['anomalies'].append({
+            'type': 'system_healthy',
+            'message': 'No anomalies detected. System is running smoothly.',
+            'severity': 'low'
+        })
+
+    if not insights['patterns']:
+        insights['patterns'].append({
+            'type': 'normal_operation',
+            'message': 'Log patterns are within normal ranges.',
+            'severity': 'low'
+        })
+
+    if not insights['recommendations']:
+        insights['recommendations'].append({
+            'type': 'maintain_health',
+            'message': 'System is healthy. Continue monitoring for any changes.',
+            'action': 'Maintain current configuration'
+        })
+
+    return insights
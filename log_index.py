@@ -0,0 +1,201 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class SparseIndex:
+    """Timestamp samples of one file: (epoch_ms, byte offset, line number).
+
+    Filled during ingestion with one record start roughly every ``interval``
+    bytes, so a lookup binary-searches the samples and reads a single small
+    range instead of scanning the file. Epochs are stored as a running
+    maximum to keep them sorted even when a log writes slightly out of order.
+    Line numbers are -1 for files followed from their end, whose earlier
+    line count was never seen. Past ``max_samples`` every other sample is
+    dropped and the interval doubles.
+    """
+
+    def __init__(self, interval=64 * 1024, max_samples=65536):
+        self.interval = interval
+        self.max_samples = max_samples
+        self.epochs = array('q')
+        self.offsets = array('q')
+        self.lines = array('q')
+        self.next_offset = 0  # next file offset worth sampling
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def add_chunk(self, data, offset, line, parse_chunk):
+        """Sample records in ``data``, which starts at file ``offset`` on a record boundary.
+
+        ``line`` is the line number at ``offset`` (None if unknown) and
+        ``parse_chunk`` the source parser's batch API, used on single lines.
+        """
+        position = max(0, self.next_offset - offset)
+        counted, newlines = 0, 0
+        while position < len(data):
+            start = data.find(b'\n', position - 1) + 1 if position else 0
+            if position and not start:
+                break
+            found = None
+            for _ in range(64):  # give up on this stretch after a long stack trace
+                if start >= len(data):
+                    break
+                end = data.find(b'\n', start)
+                end = len(data) if end < 0 else end + 1
+                records, _ = parse_chunk(data[start:end], True)
+                if records and records[0].get('epoch_ms'):
+                    found = records[0]['epoch_ms']
+                    break
+                start = end
+            if found is None:
+                position = start
+                continue
+
+            newlines += data.count(b'\n', counted, start)
+            counted = start
+            self.add(found, offset + start, line + newlines if line is not None else -1)
+            position = start + self.interval
+        self.next_offset = max(self.next_offset, offset + position)
+
+    def add(self, epoch_ms, offset, line=-1):
+        with self.lock:
+            if self.offsets and offset <= self.offsets[-1]:
+                return
+            if self.epochs:
+                epoch_ms = max(epoch_ms, self.epochs[-1])
+            self.epochs.append(epoch_ms)
+            self.offsets.append(offset)
+            self.lines.append(line)
+            if len(self.epochs) > self.max_samples:
+                self.epochs = self.epochs[::2]
+                self.offsets = self.offsets[::2]
+                self.lines = self.lines[::2]
+                self.interval *= 2
+
+    def export(self):
+        """(header, [column bytes]) for a checkpoint"""
+        with self.lock:
+            header = {'interval': self.interval, 'next_offset': self.next_offset}
+            return header, [self.epochs.tobytes(), self.offsets.tobytes(), self.lines.tobytes()]
+
+    def load(self, header, parts):
+        with self.lock:
+            self.interval = header['interval']
+            self.next_offset = header['next_offset']
+            self.epochs, self.offsets, self.lines = (array('q', part) for part in parts)
+
+    def samples_from(self, offset):
+        """[epoch_ms, offset, line] of every sample at or past ``offset``, for replicas"""
+        with self.lock:
+            start = bisect_left(self.offsets, offset)
+            return [list(sample) for sample in zip(self.epochs[start:], self.offsets[start:], self.lines[start:])]
+
+    @property
+    def first_epoch(self):
+        return self.epochs[0] if self.epochs else None
+
+    @property
+    def first_offset(self):
+        return self.offsets[0] if self.offsets else None
+
+    def locate(self, epoch_ms):
+        """Byte range that must hold the record at ``epoch_ms``.
+
+        Returns (start offset, start line, end offset or None when the record
+        may be anywhere after the last sample), or None if the record could be
+        before the first sample, in a region the index has not seen.
+        """
+        with self.lock:
+            if not self.epochs or epoch_ms < self.epochs[0]:
+                return None
+            first = bisect_left(self.epochs, epoch_ms)
+            if first == 0:
+                # Equal to the first sample; earlier records may share the millisecond
+                if self.offsets[0] > 0:
+                    return None
+                first = 1
+            after = bisect_right(self.epochs, epoch_ms)
+            end = self.offsets[after] if after < len(self.offsets) else None
+            return self.offsets[first - 1], self.lines[first - 1], end
+
+    def bytes_per_line(self, default=256):
+        """Average line length between the first and last sample with line numbers"""
+        with self.lock:
+            known = [i for i in (0, len(self.lines) - 1) if i >= 0 and self.lines[i] >= 0]
+            if len(known) == 2 and self.lines[known[1]] > self.lines[known[0]]:
+                return max(1, (self.offsets[known[1]] - self.offsets[known[0]])
+                           // (self.lines[known[1]] - self.lines[known[0]]))
+        return default
+
+
+def find_record(transport, cursor, parse_chunk, epoch_ms, block_size=64 * 1024):
+    """Offset and line number of the first record at ``epoch_ms`` in ``cursor``'s file.
+
+    Returns (offset, line) with line None when unknown, (None, None) when the
+    indexed region holds no such record, or None when the index cannot tell
+    and the caller has to scan.
+    """
+    span = cursor.index.locate(epoch_ms)
+    if span is None:
+        return None
+    start, line, end = span
+    limit = end if end is not None else cursor.size
+
+    position = start
+    while position < limit:
+        data = transport.read_range(cursor.path, position, max(limit - position, block_size)
+                                   if end is not None else block_size)
+        if not data:
+            break
+        # Only whole lines; the remainder is read again with the next block
+        usable = data.rfind(b'\n') + 1 or len(data)
+        line_start = 0
+        while line_start < usable:
+            line_end = data.find(b'\n', line_start, usable)
+            line_end = usable if line_end < 0 else line_end + 1
+            records, _ = parse_chunk(data[line_start:line_end], True)
+            if records and records[0].get('epoch_ms') is not None:
+                if records[0]['epoch_ms'] == epoch_ms:
+                    if line is not None and line >= 0:
+                        line += data.count(b'\n', 0, line_start)
+                    else:
+                        line = None
+                    return position + line_start, line
+                if records[0]['epoch_ms'] > epoch_ms and end is None:
+                    return None, None
+            line_start = line_end
+        if line is not None and line >= 0:
+            line += data.count(b'\n', 0, usable)
+        position += usable
+    return None, None
+
+
+def read_lines_around(transport, cursor, offset, direction, lines):
+    """``lines`` lines ending at (previous) or starting at (next) the line at ``offset``"""
+    guess = max(4096, lines * cursor.index.bytes_per_line() * 5 // 4)
+    if direction == 'previous':
+        first = transport.read_range(cursor.path, offset, guess)
+        newline = first.find(b'\n')
+        end = offset + (newline + 1 if newline >= 0 else len(first))
+        while True:
+            start = max(0, end - guess)
+            data = transport.read_range(cursor.path, start, end - start)
+            if start > 0:
+                # Drop the partial line at the front of the window
+                data = data[data.find(b'\n') + 1:]
+            if data.count(b'\n') >= lines or start == 0:
+                break
+            guess *= 2
+        kept = data.rstrip(b'\n').split(b'\n')[-lines:]
+        return b'\n'.join(kept) + b'\n'
+
+    while True:
+        data = transport.read_range(cursor.path, offset, guess)
+        if data.count(b'\n') >= lines or len(data) < guess:
+            break
+        guess *= 2
+    kept = data.split(b'\n')[:lines]
+    return b'\n'.join(kept) + (b'\n' if len(kept) == lines else b'')
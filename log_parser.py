@@ -0,0 +1,439 @@
+import json
+import re
+import sys
+import time
+from datetime import datetime
+
+# Every parser emits records with these keys; 'timestamp' is always rendered
+# in the log4j layout the dashboard expects (2024-01-19T19:41:56,123).
+RECORD_FIELDS = ('timestamp', 'level', 'thread', 'component', 'message')
+
+SYSLOG_SEVERITIES = ('FATAL', 'FATAL', 'FATAL', 'ERROR', 'WARN', 'INFO', 'INFO', 'DEBUG')
+MONTHS = {m.encode(): i + 1 for i, m in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))}
+MILLIS = {f"{n:03d}": n for n in range(1000)}
+LEVEL_ALIASES = {'WARNING': 'WARN', 'ERR': 'ERROR', 'CRITICAL': 'FATAL', 'TRACE': 'DEBUG'}
+
+
+class TimestampDecoder:
+    """Fixed-width timestamp decoding with a per-minute epoch cache.
+
+    Log timestamps within a minute share everything but the seconds and
+    milliseconds, so the expensive local-time conversion runs once a minute
+    and each record costs two small int() calls.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._minutes = {}
+        self._seconds = {}
+        self.seconds_iso = {}  # 'YYYY-MM-DDTHH:MM:SS' -> epoch ms, see decode_second
+
+    def minute_epoch(self, year, month, day, hour, minute):
+        key = (year, month, day, hour, minute)
+        base = self._minutes.get(key)
+        if base is None:
+            if len(self._minutes) >= self.max_entries:
+                self._minutes.clear()
+            base = int(time.mktime((year, month, day, hour, minute, 0, 0, 0, -1))) * 1000
+            self._minutes[key] = base
+        return base
+
+    def decode_iso(self, ts):
+        """Decode b'YYYY-MM-DDTHH:MM:SS,mmm' (or '.mmm') to epoch milliseconds"""
+        key = ts[:16]
+        base = self._minutes.get(key)
+        if base is None:
+            if len(self._minutes) >= self.max_entries:
+                self._minutes.clear()
+            base = int(time.mktime((int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                                    int(ts[11:13]), int(ts[14:16]), 0, 0, 0, -1))) * 1000
+            self._minutes[key] = base
+        millis = int(ts[20:23]) if len(ts) >= 23 else 0
+        return base + int(ts[17:19]) * 1000 + millis
+
+    def decode_second(self, key):
+        """Epoch milliseconds of a 'YYYY-MM-DDTHH:MM:SS' prefix, cached in ``seconds_iso``.
+
+        Batch parsers look ``seconds_iso`` up inline and only call this on a
+        miss; consecutive records mostly share their second.
+        """
+        if len(self.seconds_iso) >= self.max_entries:
+            self.seconds_iso.clear()
+        base = self.seconds_iso[key] = self.decode_iso(key)
+        return base
+
+    def format(self, epoch_ms):
+        """Render epoch milliseconds in the canonical log4j layout"""
+        seconds, millis = divmod(epoch_ms, 1000)
+        prefix = self._seconds.get(seconds)
+        if prefix is None:
+            if len(self._seconds) >= self.max_entries:
+                self._seconds.clear()
+            prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(seconds))
+            self._seconds[seconds] = prefix
+        return f"{prefix},{millis:03d}"
+
+
+timestamp_decoder = TimestampDecoder()
+
+
+class LogParser:
+    """Base class for per-format parsers.
+
+    ``parse_chunk`` turns a chunk of raw bytes into record dicts in one pass
+    and reports how many bytes it consumed; the last record is held back
+    unless ``final``, since its continuation lines may still be coming.
+    Line-oriented formats only implement ``parse_line``; lines it rejects are
+    treated as continuations of the previous record.
+    """
+
+    name = None
+    multiline = True
+
+    def __init__(self):
+        self.decoder = timestamp_decoder
+        self._strings = {}
+
+    def _str(self, raw):
+        """Decode and intern short repeated fields (levels, threads, loggers)"""
+        value = self._strings.get(raw)
+        if value is None:
+            if len(self._strings) >= 65536:
+                self._strings.clear()
+            value = self._strings[raw] = raw.decode('utf-8', errors='replace')
+        return value
+
+    def _level(self, raw):
+        level = self._str(raw.upper()) if raw else 'INFO'
+        return LEVEL_ALIASES.get(level, level)
+
+    def parse(self, text):
+        """Parse a single (possibly multi-line) record"""
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        records, _ = self.parse_chunk(text, final=True)
+        return records[0] if records else None
+
+    def parse_line(self, line):
+        raise NotImplementedError
+
+    def next_record_start(self, data, position, max_lines=1000):
+        """Offset of the first line at or after ``position`` that starts a record.
+
+        Used to cut a chunk into pieces that parse independently; None when
+        no record starts within ``max_lines`` lines.
+        """
+        start = data.find(b'\n', position - 1) + 1 if position else 0
+        if position and not start:
+            return None
+        for _ in range(max_lines):
+            end = data.find(b'\n', start)
+            if end < 0:
+                return None
+            if not self.multiline or self.parse_line(data[start:end].rstrip(b'\r')) is not None:
+                return start
+            start = end + 1
+        return None
+
+    def parse_chunk(self, data, final=False):
+        end = data.rfind(b'\n') + 1
+        if final and end < len(data):
+            end = len(data)
+
+        records = []
+        starts = []
+        position = 0
+        for line in data[:end].split(b'\n'):
+            line_start = position
+            position += len(line) + 1
+            line = line.rstrip(b'\r')
+            if not line:
+                continue
+            record = self.parse_line(line)
+            if record is not None:
+                records.append(record)
+                starts.append(line_start)
+            elif records:
+                records[-1]['message'] += '\n' + line.decode('utf-8', errors='replace')
+
+        if final or not records or not self.multiline:
+            return records, end
+        records.pop()
+        return records, starts[-1]
+
+
+class Log4jParser(LogParser):
+    """2024-01-19T19:41:56,123 INFO [main] com.example.Class - Message"""
+
+    name = 'log4j'
+    START = re.compile(rb'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d,\d\d\d')
+    # One match per record, continuation lines (stack traces) included. The
+    # timestamp is captured whole and as second + millis so no slicing is
+    # needed per record; ASCII classes keep sre off the Unicode tables and
+    # possessive repeats (no field can give characters back) skip backtracking.
+    RECORD_PATTERN = (
+        r'^((\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d),(\d\d\d))[ \t]++(\w++)[ \t]++\[([^\]\n]++)\][ \t]++'
+        r'([^ \t\r\n\f\v-]++)[ \t]*+-[ \t]*+([^\n]*+(?:\n(?!\d{4}-\d\d-\d\dT)[^\n]*+)*+)')
+    if sys.version_info < (3, 11):
+        # Possessive repeats arrived in 3.11; plain ones match the same, only slower
+        RECORD_PATTERN = RECORD_PATTERN.replace('++', '+').replace('*+', '*')
+    RECORD = re.compile(RECORD_PATTERN, re.M | re.A)
+
+    def _last_record_start(self, data, end):
+        """Byte offset of the last line in data[:end] that starts a record"""
+        pos = end - 1
+        while pos > 0:
+            newline = data.rfind(b'\n', 0, pos)
+            if self.START.match(data, newline + 1):
+                return newline + 1
+            pos = newline
+        return None
+
+    def next_record_start(self, data, position, max_lines=1000):
+        start = data.find(b'\n', position - 1) + 1 if position else 0
+        if position and not start:
+            return None
+        for _ in range(max_lines):
+            if self.START.match(data, start):
+                return start
+            start = data.find(b'\n', start) + 1
+            if not start:
+                return None
+        return None
+
+    def parse_chunk(self, data, final=False):
+        end = data.rfind(b'\n') + 1
+        if final and end < len(data):
+            end = len(data)
+
+        cut = end
+        if not final:
+            cut = self._last_record_start(data, end)
+            if cut is None:
+                # Nothing but continuation lines of an already flushed record
+                return [], end
+
+        # Decode once and let a single findall walk the whole chunk
+        rows = self.RECORD.findall(data[:cut].decode('utf-8', errors='replace'))
+        seconds = self.decoder.seconds_iso
+        decode_second = self.decoder.decode_second
+        aliases, millis = LEVEL_ALIASES, MILLIS
+        records = [{
+            'timestamp': ts,
+            'level': aliases.get(level, level),
+            'thread': thread,
+            'component': component,
+            'message': message.rstrip(),
+            'epoch_ms': (seconds[second] if second in seconds else decode_second(second)) + millis[ms]
+        } for ts, second, ms, level, thread, component, message in rows]
+        return records, cut
+
+
+class JsonLinesParser(LogParser):
+    """One JSON object per line (logstash, structlog, bunyan, zap...)"""
+
+    name = 'json'
+    multiline = False
+    TIMESTAMP_KEYS = ('timestamp', '@timestamp', 'time', 'ts', 'date')
+    LEVEL_KEYS = ('level', 'severity', 'lvl', 'log.level', 'levelname')
+    THREAD_KEYS = ('thread', 'thread_name', 'threadName', 'pid')
+    COMPONENT_KEYS = ('logger', 'component', 'logger_name', 'name', 'module')
+    MESSAGE_KEYS = ('message', 'msg', 'event')
+
+    @staticmethod
+    def _first(obj, keys, default=None):
+        for key in keys:
+            value = obj.get(key)
+            if value is not None:
+                return value
+        return default
+
+    def _epoch_ms(self, value):
+        if isinstance(value, (int, float)):
+            # Seconds or milliseconds since the epoch
+            return int(value if value > 1e11 else value * 1000)
+        if isinstance(value, str) and len(value) >= 19:
+            raw = value.encode()
+            if value[4] == '-' and value[10] in 'T ' and len(value) <= 23:
+                return self.decoder.decode_iso(raw)
+            try:
+                return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+            except ValueError:
+                pass
+        return int(time.time() * 1000)
+
+    def parse_line(self, line):
+        if not line.startswith(b'{'):
+            return None
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(obj, dict):
+            return None
+        level = self._first(obj, self.LEVEL_KEYS, 'INFO')
+        epoch_ms = self._epoch_ms(self._first(obj, self.TIMESTAMP_KEYS))
+        return {
+            'timestamp': self.decoder.format(epoch_ms),
+            'level': self._level(str(level).encode()),
+            'thread': str(self._first(obj, self.THREAD_KEYS, '-')),
+            'component': str(self._first(obj, self.COMPONENT_KEYS, '-')),
+            'message': str(self._first(obj, self.MESSAGE_KEYS, '')),
+            'epoch_ms': epoch_ms
+        }
+
+
+class SyslogParser(LogParser):
+    """RFC 3164 (``<34>Oct 11 22:14:15 host su[12]: msg``) and RFC 5424 lines"""
+
+    name = 'syslog'
+    RFC3164 = re.compile(
+        rb'(?:<(\d{1,3})>)?([A-Z][a-z]{2}) ([ \d]\d) (\d{2}):(\d{2}):(\d{2}) (\S+) '
+        rb'([^:\[\s]+)(?:\[(\d+)\])?:? ?(.*)')
+    RFC5424 = re.compile(
+        rb'<(\d{1,3})>1 (\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?)(\S*) (\S+) (\S+) (\S+) (\S+) '
+        rb'(-|(?:\[.*?\])+) ?(.*)')
+
+    def parse_line(self, line):
+        match = self.RFC3164.match(line)
+        if match:
+            pri, month, day, hour, minute, second, host, tag, pid, message = match.groups()
+            # RFC 3164 has no year: assume the most recent matching date
+            year = time.localtime().tm_year
+            epoch_ms = self.decoder.minute_epoch(year, MONTHS.get(month, 1), int(day), int(hour), int(minute))
+            if epoch_ms > (time.time() + 86400) * 1000:
+                epoch_ms = self.decoder.minute_epoch(year - 1, MONTHS.get(month, 1), int(day), int(hour), int(minute))
+            epoch_ms += int(second) * 1000
+            return self._record(pri, epoch_ms, pid or host, tag, message)
+
+        match = self.RFC5424.match(line)
+        if match:
+            pri, ts, zone, host, app, procid, msgid, data, message = match.groups()
+            if not zone:
+                epoch_ms = self.decoder.decode_iso(ts.ljust(23, b'0'))
+            else:
+                parsed = datetime.fromisoformat((ts + zone).decode())
+                epoch_ms = int(parsed.timestamp() * 1000)
+            return self._record(pri, epoch_ms, procid, app, message)
+        return None
+
+    def _record(self, pri, epoch_ms, thread, component, message):
+        severity = int(pri) & 7 if pri else 6
+        return {
+            'timestamp': self.decoder.format(epoch_ms),
+            'level': SYSLOG_SEVERITIES[severity],
+            'thread': self._str(thread),
+            'component': self._str(component),
+            'message': message.decode('utf-8', errors='replace').strip(),
+            'epoch_ms': epoch_ms
+        }
+
+
+class AccessLogParser(LogParser):
+    """nginx/Apache common and combined access log lines.
+
+    The status code maps to the level (5xx ERROR, 4xx WARN, else INFO), the
+    request method to the component and the client address to the thread.
+    """
+
+    name = 'access'
+    multiline = False
+    LINE = re.compile(
+        rb'(\S+) \S+ \S+ \[(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2})( [+-]\d{4})?\] '
+        rb'"(\S+)(?: ([^"]*?))?(?: HTTP/[\d.]+)?" (\d{3}) (\S+)(.*)')
+
+    def parse_line(self, line):
+        match = self.LINE.match(line)
+        if not match:
+            return None
+        (client, day, month, year, hour, minute, second, zone,
+         method, path, status, size, rest) = match.groups()
+        epoch_ms = self.decoder.minute_epoch(int(year), MONTHS.get(month, 1), int(day), int(hour), int(minute))
+        epoch_ms += int(second) * 1000
+        code = int(status)
+        message = f"{method.decode()} {(path or b'').decode('utf-8', errors='replace')} {code} {size.decode()}"
+        if rest.strip():
+            message += ' ' + rest.decode('utf-8', errors='replace').strip()
+        return {
+            'timestamp': self.decoder.format(epoch_ms),
+            'level': 'ERROR' if code >= 500 else 'WARN' if code >= 400 else 'INFO',
+            'thread': self._str(client),
+            'component': self._str(method),
+            'message': message,
+            'epoch_ms': epoch_ms
+        }
+
+
+class RegexParser(LogParser):
+    """User-supplied regex with named groups.
+
+    Recognised groups are ``timestamp``, ``level``, ``thread``, ``component``
+    and ``message``; ``timestamp_format`` is a strptime format and defaults to
+    the log4j layout. Lines that do not match continue the previous record.
+    """
+
+    name = 'regex'
+
+    def __init__(self, pattern, timestamp_format=None):
+        super().__init__()
+        if isinstance(pattern, str):
+            pattern = pattern.encode()
+        self.pattern = re.compile(pattern)
+        if 'message' not in self.pattern.groupindex:
+            raise ValueError("Custom pattern needs at least a (?P<message>...) group")
+        self.timestamp_format = timestamp_format
+        self._timestamps = {}
+
+    def _epoch_ms(self, raw):
+        if raw is None:
+            return int(time.time() * 1000)
+        if self.timestamp_format is None:
+            return self.decoder.decode_iso(raw)
+        epoch_ms = self._timestamps.get(raw)
+        if epoch_ms is None:
+            if len(self._timestamps) >= 4096:
+                self._timestamps.clear()
+            parsed = datetime.strptime(raw.decode(), self.timestamp_format)
+            epoch_ms = self._timestamps[raw] = int(parsed.timestamp() * 1000)
+        return epoch_ms
+
+    def parse_line(self, line):
+        match = self.pattern.match(line)
+        if not match:
+            return None
+        groups = match.groupdict()
+        try:
+            epoch_ms = self._epoch_ms(groups.get('timestamp'))
+        except ValueError:
+            return None
+        return {
+            'timestamp': self.decoder.format(epoch_ms),
+            'level': self._level(groups.get('level')),
+            'thread': self._str(groups.get('thread') or b'-'),
+            'component': self._str(groups.get('component') or b'-'),
+            'message': groups['message'].decode('utf-8', errors='replace').strip(),
+            'epoch_ms': epoch_ms
+        }
+
+
+PARSERS = {
+    'log4j': Log4jParser,
+    'json': JsonLinesParser,
+    'syslog': SyslogParser,
+    'nginx': AccessLogParser,
+    'apache': AccessLogParser,
+    'regex': RegexParser,
+}
+
+
+def get_parser(log_format='log4j', pattern=None, timestamp_format=None):
+    """Build the parser for a LogSource's configured format"""
+    parser_class = PARSERS.get(log_format or 'log4j')
+    if parser_class is None:
+        raise ValueError(f"Unknown log format '{log_format}'. Choose one of: {', '.join(PARSERS)}")
+    if parser_class is RegexParser:
+        if not pattern:
+            raise ValueError("The 'regex' log format needs a pattern")
+        return RegexParser(pattern, timestamp_format)
+    return parser_class()
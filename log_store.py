@@ -0,0 +1,238 @@
+import threading
+from array import array
+
+from log_parser import timestamp_decoder
+
+
+class StringTable:
+    """Interns repeated strings (levels, components, threads) as small ints"""
+
+    def __init__(self):
+        self._ids = {}
+        self._strings = []
+
+    def __len__(self):
+        return len(self._strings)
+
+    def intern(self, value):
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def lookup(self, string_id):
+        return self._strings[string_id]
+
+    def to_list(self):
+        return list(self._strings)
+
+
+class LogStore:
+    """Bounded per-source ring buffer holding records in columnar form.
+
+    Timestamps live in an int64 ``array`` as epoch milliseconds, level,
+    component and thread as interned ids, and messages as UTF-8 bytes in one
+    append-only arena. Records are addressed by a monotonically increasing
+    sequence number; once ``max_records`` or ``max_bytes`` of message data is
+    exceeded the oldest records are evicted. Reads build dicts lazily, one
+    record at a time.
+    """
+
+    def __init__(self, max_records=100000, max_bytes=32 * 1024 * 1024, defaults=None):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.defaults = defaults or {}
+
+        # Columns grow until max_records, then act as a ring indexed by seq - seq_base
+        self.epochs = array('q')
+        self.levels = array('i')
+        self.components = array('i')
+        self.threads = array('i')
+        self.offsets = array('q')  # absolute arena offset of each message
+        self.strings = StringTable()
+        self.lock = threading.RLock()
+
+        self.arena = bytearray()
+        self.arena_base = 0  # absolute offset of arena[0]
+        self.first_seq = 0
+        self.next_seq = 0
+        self.seq_base = 0  # seq stored in slot 0; load() continues numbering from a checkpoint
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def __iter__(self):
+        return self.iter_records()
+
+    @property
+    def message_bytes(self):
+        return self.arena_end - self._message_start(self.first_seq) if len(self) else 0
+
+    @property
+    def arena_end(self):
+        return self.arena_base + len(self.arena)
+
+    def memory_usage(self):
+        """Approximate bytes held by this store"""
+        columns = sum(col.itemsize * len(col) for col in
+                      (self.epochs, self.levels, self.components, self.threads, self.offsets))
+        return columns + len(self.arena) + 64 * len(self.strings)
+
+    def append(self, record):
+        """Store a parsed record dict and return its sequence number"""
+        message = record['message'].encode('utf-8')
+        if len(message) > self.max_bytes:
+            message = message[:self.max_bytes]
+
+        with self.lock:
+            if len(self) >= self.max_records:
+                self._evict(1)
+
+            seq = self.next_seq
+            intern = self.strings.intern
+            values = (
+                (self.epochs, record['epoch_ms']),
+                (self.levels, intern(record['level'])),
+                (self.components, intern(record.get('component') or 'Unknown')),
+                (self.threads, intern(record.get('thread') or '')),
+                (self.offsets, self.arena_end)
+            )
+            if len(self.epochs) < self.max_records:
+                for column, value in values:
+                    column.append(value)
+            else:
+                slot = (seq - self.seq_base) % self.max_records
+                for column, value in values:
+                    column[slot] = value
+            self.arena += message
+            self.next_seq = seq + 1
+
+            while self.message_bytes > self.max_bytes and len(self) > 1:
+                self._evict(1)
+            if len(self.strings) > 4 * self.max_records:
+                self._rebuild_strings()
+            return seq
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def _message_start(self, seq):
+        return self.offsets[(seq - self.seq_base) % self.max_records]
+
+    def _message_end(self, seq):
+        if seq + 1 < self.next_seq:
+            return self.offsets[(seq + 1 - self.seq_base) % self.max_records]
+        return self.arena_end
+
+    def _evict(self, count):
+        self.first_seq = min(self.next_seq, self.first_seq + count)
+        # The arena is FIFO like the ring, so evicted messages form its prefix
+        start = self._message_start(self.first_seq) if len(self) else self.arena_end
+        dead = start - self.arena_base
+        if dead > len(self.arena) // 2 or dead > 1024 * 1024:
+            del self.arena[:dead]
+            self.arena_base = start
+
+    def _rebuild_strings(self):
+        """Drop interned strings no live record references any more"""
+        old = self.strings
+        self.strings = StringTable()
+        intern = self.strings.intern
+        for seq in range(self.first_seq, self.next_seq):
+            slot = (seq - self.seq_base) % self.max_records
+            self.levels[slot] = intern(old.lookup(self.levels[slot]))
+            self.components[slot] = intern(old.lookup(self.components[slot]))
+            self.threads[slot] = intern(old.lookup(self.threads[slot]))
+
+    def export(self):
+        """Live records, oldest first, as (header, [column bytes]) for a checkpoint"""
+        with self.lock:
+            count = len(self)
+            if not count:
+                return {'count': 0}, []
+            start = (self.first_seq - self.seq_base) % self.max_records
+
+            def ordered(column):
+                return (column[start:] + column[:start])[:count]
+
+            offsets = ordered(self.offsets)
+            first = offsets[0]
+            messages = bytes(self.arena[first - self.arena_base:])
+            offsets = array('q', (offset - first for offset in offsets))
+            columns = [ordered(self.epochs), ordered(self.levels), ordered(self.components),
+                       ordered(self.threads), offsets]
+            header = {'count': count, 'first_seq': self.first_seq, 'strings': self.strings.to_list()}
+        return header, [column.tobytes() for column in columns] + [messages]
+
+    def load(self, header, parts):
+        """Replace the contents with an ``export()``, keeping its sequence numbers"""
+        count = header['count']
+        if not count:
+            return
+        epochs, levels, components, threads, offsets = (
+            array(code, part) for code, part in zip('qiiiq', parts))
+        messages = parts[5]
+        # Keep the newest records if the limits shrank since the export
+        drop = max(0, count - self.max_records)
+        with self.lock:
+            self.epochs = epochs[drop:]
+            self.levels = levels[drop:]
+            self.components = components[drop:]
+            self.threads = threads[drop:]
+            first = offsets[drop]
+            self.offsets = array('q', (offset - first for offset in offsets[drop:]))
+            self.arena = bytearray(messages[first:])
+            self.arena_base = 0
+            self.strings = StringTable()
+            for value in header['strings']:
+                self.strings.intern(value)
+            # Cursors and ETags handed out before a restart keep pointing at the same records
+            self.first_seq = self.seq_base = header.get('first_seq', 0) + drop
+            self.next_seq = self.first_seq + count - drop
+            while self.message_bytes > self.max_bytes and len(self) > 1:
+                self._evict(1)
+
+    def get(self, seq):
+        """Record dict for a sequence number, or None once evicted"""
+        with self.lock:
+            if seq < self.first_seq or seq >= self.next_seq:
+                return None
+            slot = (seq - self.seq_base) % self.max_records
+            start = self.offsets[slot] - self.arena_base
+            end = self._message_end(seq) - self.arena_base
+            lookup = self.strings.lookup
+            record = {
+                'timestamp': timestamp_decoder.format(self.epochs[slot]),
+                'level': lookup(self.levels[slot]),
+                'thread': lookup(self.threads[slot]),
+                'component': lookup(self.components[slot]),
+                'message': self.arena[start:end].decode('utf-8', errors='replace'),
+                'epoch_ms': self.epochs[slot],
+                'seq': seq
+            }
+        if self.defaults:
+            record.update(self.defaults)
+        return record
+
+    def iter_records(self, start_seq=None, reverse=False):
+        """Yield record dicts oldest first (or newest first with reverse)"""
+        if reverse:
+            seq = self.next_seq - 1 if start_seq is None else min(start_seq, self.next_seq - 1)
+            while seq >= self.first_seq:
+                record = self.get(seq)
+                if record is None:
+                    break
+                yield record
+                seq -= 1
+        else:
+            seq = self.first_seq if start_seq is None else max(start_seq, self.first_seq)
+            while seq < self.next_seq:
+                record = self.get(seq)
+                if record is None:
+                    # Evicted while we were iterating; skip ahead
+                    seq = self.first_seq
+                    continue
+                yield record
+                seq += 1
@@ -0,0 +1,397 @@
+import glob
+import os
+import shlex
+import stat
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd transport falls back to gzip without it
+    zstandard = None
+
+from log_index import SparseIndex
+
+# Transport modes a LogSource can pick with ``compression``
+COMPRESSION_MODES = ('none', 'gzip', 'zstd', 'ssh')
+
+# Remote commands that compress the ranged read before it crosses the wire
+REMOTE_COMPRESSORS = {
+    'gzip': 'gzip -1 -c',
+    'zstd': 'zstd -1 -c -q'
+}
+
+
+class FileCursor:
+    """Read position inside one monitored file"""
+
+    def __init__(self, path, inode, offset=0):
+        self.path = path
+        self.inode = inode
+        self.offset = offset  # first byte not yet turned into records
+        self.size = offset    # file size at the last stat
+        self.grew = False     # size changed between the last two polls
+        self.line = 0 if offset == 0 else None  # line number at offset, if known
+        self.pending_lines = 0  # newlines in the bytes the next advance() covers
+        self.filtered_records = 0  # records in those bytes a remote filter dropped
+        self.filtered_lines = 0
+        self.index = SparseIndex()
+        self.replay_until = None  # records before this offset were already published by a previous owner
+
+    def reset(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.size = 0
+        self.grew = False
+        self.line = 0
+        self.pending_lines = 0
+        self.filtered_records = 0
+        self.filtered_lines = 0
+        self.index = SparseIndex()
+        self.replay_until = None
+
+    @property
+    def replaying(self):
+        return self.replay_until is not None and self.offset < self.replay_until
+
+    def advance(self, consumed):
+        self.offset += consumed
+        if self.line is not None:
+            self.line += self.pending_lines
+        self.pending_lines = 0
+        self.filtered_records = 0
+        self.filtered_lines = 0
+
+
+class TransferStats:
+    """Bytes received over the wire vs. bytes of log text they decoded to"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.wire_bytes = 0
+        self.raw_bytes = 0
+        self.seconds = 0.0
+
+    def add(self, wire_bytes, raw_bytes, seconds):
+        with self.lock:
+            self.reads += 1
+            self.wire_bytes += wire_bytes
+            self.raw_bytes += raw_bytes
+            self.seconds += seconds
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'reads': self.reads,
+                'wire_bytes': self.wire_bytes,
+                'raw_bytes': self.raw_bytes,
+                'compression_ratio': round(self.raw_bytes / self.wire_bytes, 2) if self.wire_bytes else None,
+                'raw_bytes_per_second': round(self.raw_bytes / self.seconds) if self.seconds else None
+            }
+
+
+def decompressor(codec):
+    """Incremental decoder with a zlib-style decompress() for a remote codec"""
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)  # 31: gzip container
+
+
+class SSHFileTransport:
+    """Stats and ranged reads against a LogSource's host over pooled channels.
+
+    With ``compression`` 'gzip' or 'zstd' ranged reads are compressed on the
+    host and decoded here as the compressed stream arrives; if the host lacks
+    the tool it falls back to gzip, then to plain text. 'ssh' instead uses a
+    compressed SSH session, whose wire bytes are measured on the session and
+    so include other channels active on it at the same time.
+    """
+
+    def __init__(self, source, compression='none'):
+        self.source = source
+        self.compression = compression or 'none'
+        self.codec = None
+        self.codec_checked = False
+        self.filter_supported = True  # cleared if the host cannot run remote filters
+        self.stats = TransferStats()
+
+    def remote_codec(self):
+        """The requested codec if the host has it, else gzip, else None (checked once)"""
+        if self.codec_checked or self.compression not in REMOTE_COMPRESSORS:
+            return self.codec
+        with self.source.exec_command("for c in zstd gzip; do command -v $c; done", timeout=30) as result:
+            available = {os.path.basename(line) for line in result.stdout.read().decode().split()}
+        preferred = [self.compression, 'gzip'] if self.compression == 'zstd' else ['gzip']
+        for codec in preferred:
+            if codec in available and (codec != 'zstd' or zstandard is not None):
+                self.codec = codec
+                break
+        if self.codec != self.compression:
+            print(f"{self.compression} is not available for {self.source.host}, "
+                  f"using {self.codec or 'uncompressed reads'}")
+        self.codec_checked = True
+        return self.codec
+
+    def stat(self, pattern):
+        """Return (path, inode, size) for every regular file matching the glob"""
+        cmd = f"for f in {pattern}; do [ -f \"$f\" ] && stat -c '%i %s %n' \"$f\"; done 2>/dev/null"
+        with self.source.exec_command(cmd, timeout=30) as result:
+            output = result.stdout.read().decode('utf-8', errors='replace')
+
+        files = []
+        for line in output.splitlines():
+            parts = line.split(' ', 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                files.append((parts[2], int(parts[0]), int(parts[1])))
+        return files
+
+    def read_range(self, path, offset, length):
+        return self._read(f"tail -c +{offset + 1} {shlex.quote(path)} | head -c {length}")
+
+    def read_filtered(self, path, offset, length, script, final):
+        """Ranged read run through an IngestFilter's awk ``script`` on the host.
+
+        Returns (kept records, bytes covered, lines covered, records dropped,
+        lines dropped); bytes covered stop before a held-back last record.
+        """
+        data = self._read(f"{{ tail -c +{offset + 1} {shlex.quote(path)} | head -c {length}; echo; }} "
+                          f"| LC_ALL=C awk -v final={int(final)} {shlex.quote(script)}")
+        body, _, trailer = data[:-1].rpartition(b'\n')
+        counts = trailer[1:].split()
+        if not trailer.startswith(b'\x1e') or len(counts) != 4:
+            self.filter_supported = False
+            print(f"Remote filtering failed on {self.source.host}, filtering locally instead")
+            raise RuntimeError(f"Remote filter failed on {self.source.host}")
+        consumed, lines, dropped, dropped_lines = map(int, counts)
+        return body + b'\n' if body else b'', consumed, lines, dropped, dropped_lines
+
+    def _read(self, cmd):
+        codec = self.remote_codec()
+        if codec:
+            cmd += f" | {REMOTE_COMPRESSORS[codec]}"
+
+        started = time.time()
+        with self.source.exec_command(cmd, timeout=30) as result:
+            session_bytes = result.wire_bytes
+            if codec:
+                # Decode each piece as it arrives instead of holding the compressed stream
+                decoder = decompressor(codec)
+                data = bytearray()
+                wire_bytes = 0
+                for chunk in result.iter_stdout():
+                    wire_bytes += len(chunk)
+                    data += decoder.decompress(chunk)
+                if codec == 'gzip':
+                    data += decoder.flush()
+                data = bytes(data)
+            else:
+                data = result.stdout.read()
+                wire_bytes = len(data)
+            if self.compression == 'ssh':
+                wire_bytes = result.wire_bytes - session_bytes
+        self.stats.add(wire_bytes, len(data), time.time() - started)
+        return data
+
+    def stream(self, files, start, length, chunk_size=64 * 1024):
+        """Yield ``length`` bytes from ``start`` of the (path, size) files concatenated"""
+        parts = []
+        for path, size in files:
+            if start >= size:
+                start -= size
+                continue
+            # tail -c seeks straight to the offset; head keeps a growing file to its stat size
+            parts.append(f"tail -c +{start + 1} {shlex.quote(path)} | head -c {size - start}")
+            start = 0
+        if not parts or length <= 0:
+            return iter(())
+        cmd = f"{{ {'; '.join(parts)}; }} 2>/dev/null | head -c {length}"
+        return self.source.exec_command(cmd, timeout=30).iter_stdout(chunk_size)
+
+
+class LocalFileTransport:
+    """Same interface as SSHFileTransport for files on this machine"""
+
+    def __init__(self):
+        self.stats = TransferStats()
+
+    def stat(self, pattern):
+        files = []
+        for path in sorted(glob.glob(pattern)):
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(info.st_mode):
+                files.append((path, info.st_ino, info.st_size))
+        return files
+
+    def read_range(self, path, offset, length):
+        started = time.time()
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        self.stats.add(len(data), len(data), time.time() - started)
+        return data
+
+    def stream(self, files, start, length, chunk_size=64 * 1024):
+        for path, size in files:
+            if length <= 0:
+                break
+            if start >= size:
+                start -= size
+                continue
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = min(size - start, length)
+                start = 0
+                while remaining > 0:
+                    data = f.read(min(chunk_size, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    length -= len(data)
+                    yield data
+
+
+class IncrementalTailer:
+    """Fetches only the bytes appended to a log glob since the last poll.
+
+    Each matched file is tracked by (inode, byte offset). A changed inode at
+    the same path means the file was rotated, a size below the offset means
+    it was truncated; both restart from the beginning of the new content.
+    Files that appear after the first poll are read from the start, files
+    present at the first poll are followed from their current end.
+    """
+
+    def __init__(self, transport, log_path, max_read_bytes=4 * 1024 * 1024):
+        self.transport = transport
+        self.log_path = log_path
+        self.max_read_bytes = max_read_bytes
+        self.cursors = {}
+        self.primed = False
+        self.remote_filter = None  # awk script from IngestFilter.remote_script, if any
+
+    def reset(self):
+        """Forget all positions; the next poll follows files from their end again"""
+        self.cursors = {}
+        self.primed = False
+
+    @property
+    def pending(self):
+        """True when some bytes were read but not yet turned into records"""
+        return any(c.offset < c.size for c in self.cursors.values())
+
+    @property
+    def backlogged(self):
+        """True when a file still has bytes beyond what one read could fetch"""
+        return any(c.size - c.offset > self.max_read_bytes for c in self.cursors.values())
+
+    def _due(self):
+        """Stat the glob and yield (cursor, length) for every file with unread bytes"""
+        files = self.transport.stat(self.log_path)
+        by_inode = {c.inode: c for c in self.cursors.values()}
+        cursors = {}
+
+        for path, inode, size in files:
+            cursor = self.cursors.get(path)
+            if cursor is None or cursor.inode != inode:
+                # New path, or the path now points at a different (rotated-in)
+                # file. If we already follow this inode it was only renamed.
+                cursor = by_inode.pop(inode, None)
+                if cursor is None:
+                    cursor = FileCursor(path, inode, size if not self.primed else 0)
+                cursor.path = path
+            else:
+                by_inode.pop(inode, None)
+
+            if size < cursor.offset:
+                # Truncated in place (e.g. copytruncate)
+                cursor.reset(inode)
+
+            cursor.grew = size != cursor.size
+            cursor.size = size
+            cursors[path] = cursor
+
+        self.cursors = cursors
+        self.primed = True
+
+        for cursor in list(cursors.values()):
+            if cursor.offset < cursor.size:
+                length = min(cursor.size - cursor.offset, self.max_read_bytes)
+                if cursor.replaying:
+                    # Stop at the end of what was published, so those records can be told apart
+                    length = min(length, cursor.replay_until - cursor.offset)
+                yield cursor, length
+
+    @staticmethod
+    def _final(cursor, length):
+        """True when the last record in ``length`` bytes from the cursor is complete"""
+        end = cursor.offset + length
+        # A previous owner only advanced to record boundaries
+        return (end >= cursor.size and not cursor.grew) or end == cursor.replay_until
+
+    def poll(self):
+        """Yield (cursor, data, final) for every file with unread bytes.
+
+        ``final`` is set when the file stopped growing since the previous
+        poll, or ``data`` ends where a previous owner's published records
+        end, meaning the last record in ``data`` is complete. The caller
+        advances the cursor past the bytes it turned into records.
+        """
+        for cursor, length in self._due():
+            data = self.transport.read_range(cursor.path, cursor.offset, length)
+            if not data:
+                continue
+            yield cursor, data, self._final(cursor, len(data))
+
+    def poll_records(self, parse_chunk, sample_chunk=None):
+        """Yield (cursor, records, consumed) for every file with new records.
+
+        ``parse_chunk(data, final)`` is a parser's batch API: it returns the
+        records found in ``data`` and how many bytes they cover.
+        ``sample_chunk`` has the same API and parses the single lines the
+        time index samples; it defaults to ``parse_chunk``.
+        """
+        script = self.remote_filter
+        if script and getattr(self.transport, 'filter_supported', False):
+            yield from self._poll_filtered(parse_chunk, script)
+            return
+        for cursor, data, final in self.poll():
+            records, consumed = parse_chunk(data, final)
+            if not consumed and len(data) >= self.max_read_bytes:
+                # A single record larger than one read: flush what we have
+                records, consumed = parse_chunk(data, True)
+            if consumed:
+                cursor.index.add_chunk(data[:consumed], cursor.offset, cursor.line, sample_chunk or parse_chunk)
+                cursor.pending_lines = data.count(b'\n', 0, consumed)
+            yield cursor, records, consumed
+
+    def _poll_filtered(self, parse_chunk, script):
+        """poll_records with records dropped on the host by a remote filter.
+
+        The time index is not sampled: offsets in the filtered output no
+        longer match the file.
+        """
+        for cursor, length in self._due():
+            read = self.transport.read_filtered(cursor.path, cursor.offset, length, script,
+                                                self._final(cursor, length))
+            if not read[1] and length >= self.max_read_bytes:
+                # A single record larger than one read: flush what we have
+                read = self.transport.read_filtered(cursor.path, cursor.offset, length, script, True)
+            data, consumed, cursor.pending_lines, cursor.filtered_records, cursor.filtered_lines = read
+            if not consumed:
+                continue
+            records, _ = parse_chunk(data, True)
+            yield cursor, records, consumed
+
+    def cursor_for(self, epoch_ms):
+        """The followed file whose indexed records begin latest at or before ``epoch_ms``"""
+        best = None
+        for cursor in list(self.cursors.values()):
+            first = cursor.index.first_epoch
+            if first is not None and first <= epoch_ms and (best is None or first > best.index.first_epoch):
+                best = cursor
+        return best
+
@@ -0,0 +1,267 @@
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+WILDCARD = '<*>'
+
+# Variable parts of a message, masked before clustering: IPs (with port),
+# UUIDs, hex literals, long hex ids and free-standing numbers
+MASK = re.compile(
+    r'\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?'
+    r'|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+    r'|0[xX][0-9a-fA-F]+'
+    r'|\b(?=[a-fA-F]*\d)[0-9a-fA-F]{12,}\b'
+    r'|(?<![\w.])[-+]?\d+(?:\.\d+)?'
+)
+
+# How a template turns up in insights['patterns']
+NEW_TEMPLATE_SECONDS = 300   # created this recently (after warm-up) counts as new
+BURST_WINDOW = 60            # seconds per rate window
+BURST_MIN_COUNT = 20         # records in a window before a burst is considered
+BURST_FACTOR = 5             # times the previous window's count
+
+EXAMPLE_FIELDS = ('timestamp', 'level', 'thread', 'component', 'message', 'source_id')
+MAX_EXAMPLES = 3
+
+
+class Template:
+    """A cluster of messages that differ only in their WILDCARD positions"""
+
+    __slots__ = ('id', 'tokens', 'count', 'first_seen', 'last_seen', 'levels', 'examples',
+                 'created_at', 'baseline', 'window', 'window_count', 'previous_count', 'leaf',
+                 'last_used')
+
+    def __init__(self, template_id, tokens, now, baseline, leaf):
+        self.id = template_id
+        self.tokens = tokens
+        self.leaf = leaf  # the tree's list holding this template; None once evicted
+        self.last_used = 0
+        self.count = 0
+        self.first_seen = None  # record epoch_ms
+        self.last_seen = None
+        self.levels = {}
+        self.examples = deque(maxlen=MAX_EXAMPLES)
+        self.created_at = now
+        self.baseline = baseline  # created during warm-up, never reported as new
+        self.window = int(now // BURST_WINDOW)
+        self.window_count = 0
+        self.previous_count = 0
+
+    @property
+    def text(self):
+        return ' '.join(self.tokens)
+
+    def add(self, record, now):
+        self.count += 1
+        epoch_ms = record.get('epoch_ms')
+        if epoch_ms is not None:
+            if self.first_seen is None or epoch_ms < self.first_seen:
+                self.first_seen = epoch_ms
+            if self.last_seen is None or epoch_ms > self.last_seen:
+                self.last_seen = epoch_ms
+        level = record.get('level')
+        self.levels[level] = self.levels.get(level, 0) + 1
+        if len(self.examples) < self.examples.maxlen:
+            self.examples.append({field: record.get(field) for field in EXAMPLE_FIELDS})
+
+        window = int(now // BURST_WINDOW)
+        if window != self.window:
+            self.previous_count = self.window_count if window == self.window + 1 else 0
+            self.window = window
+            self.window_count = 0
+        self.window_count += 1
+
+    def merge(self, tokens):
+        """Turn positions where ``tokens`` differs into wildcards"""
+        if any(ours != theirs and ours != WILDCARD for ours, theirs in zip(self.tokens, tokens)):
+            self.tokens = [ours if ours == theirs else WILDCARD for ours, theirs in zip(self.tokens, tokens)]
+
+    def similarity(self, tokens):
+        if not tokens:
+            return 1.0
+        # A wildcard only matches a masked token, so broad templates do not
+        # swallow every message of the same length
+        same = 0
+        for ours, theirs in zip(self.tokens, tokens):
+            if ours == theirs:
+                same += 1
+        return same / len(tokens)
+
+    def bursting(self, now):
+        """Records in the current window if well above the previous one, else 0"""
+        window = int(now // BURST_WINDOW)
+        if int(self.created_at // BURST_WINDOW) >= window - 1:
+            return 0  # no full window to compare with yet
+        if window == self.window:
+            current, previous = self.window_count, self.previous_count
+        elif window == self.window + 1:
+            current, previous = 0, self.window_count
+        else:
+            return 0
+        if current >= BURST_MIN_COUNT and current >= BURST_FACTOR * (previous + 1):
+            return current
+        return 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'template': self.text,
+            'count': self.count,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'levels': dict(self.levels),
+            'examples': list(self.examples)
+        }
+
+
+class TemplateMiner:
+    """Streaming Drain-style template miner.
+
+    Messages are masked, split into tokens and routed through a fixed-depth
+    prefix tree (token count, then the first ``depth`` tokens) to a short
+    list of templates; the most similar one above ``threshold`` absorbs the
+    message, otherwise it starts a new template. Masked messages seen before
+    skip the tree through a cache. At most ``max_templates`` are kept, and
+    ``max_leaf`` per leaf so a match never compares against more than that;
+    the least recently matched are evicted first.
+    """
+
+    def __init__(self, depth=2, threshold=0.5, max_children=100, max_leaf=32, max_templates=5000,
+                 warmup=10000, cache_size=100000):
+        self.depth = depth
+        self.threshold = threshold
+        self.max_children = max_children
+        self.max_leaf = max_leaf
+        self.max_templates = max_templates
+        self.warmup = warmup
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.root = {}
+        self.templates = OrderedDict()  # id -> Template, least recently matched first
+        self.cache = {}                 # masked message -> Template
+        self.next_id = 1
+        self.records = 0
+        self.evictions = 0
+
+    def add_records(self, records, now=None):
+        """Assign each record's message to a template"""
+        if not records:
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            for record in records:
+                self._add(record, now)
+
+    def _add(self, record, now):
+        self.records += 1
+        masked = MASK.sub(WILDCARD, record.get('message') or '')
+        template = self.cache.get(masked)
+        if template is None or template.leaf is None:
+            template = self._match(masked.split(), now)
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[masked] = template
+        self.templates.move_to_end(template.id)
+        template.last_used = self.records
+        template.add(record, now)
+
+    def _match(self, tokens, now):
+        leaf = self._leaf(tokens)
+        best, best_similarity = None, -1.0
+        for candidate in leaf:
+            similarity = candidate.similarity(tokens)
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None and best_similarity >= self.threshold:
+            best.merge(tokens)
+            return best
+
+        if len(leaf) >= self.max_leaf:
+            self._evict(min(leaf, key=lambda t: t.last_used))
+        template = Template(self.next_id, tokens, now, self.records <= self.warmup, leaf)
+        self.next_id += 1
+        leaf.append(template)
+        self.templates[template.id] = template
+        while len(self.templates) > self.max_templates:
+            self._evict(next(iter(self.templates.values())))
+        return template
+
+    def _leaf(self, tokens):
+        """Template list for ``tokens``, creating tree nodes on the way"""
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth]:
+            if any(c.isdigit() for c in token):
+                token = WILDCARD
+            child = node.get(token)
+            if child is None:
+                if len(node) >= self.max_children:
+                    token = WILDCARD
+                    child = node.get(token)
+                if child is None:
+                    child = node[token] = {}
+            node = child
+        return node.setdefault(None, [])
+
+    def _evict(self, template):
+        del self.templates[template.id]
+        template.leaf.remove(template)
+        template.leaf = None
+        self.evictions += 1
+
+    def patterns(self, now=None, limit=5):
+        """Insight entries for new and suddenly frequent templates"""
+        now = time.time() if now is None else now
+        found = []
+        with self.lock:
+            for template in self.templates.values():
+                burst = template.bursting(now)
+                problems = template.levels.get('ERROR', 0) + template.levels.get('WARN', 0)
+                if burst:
+                    found.append((burst, {
+                        'type': 'template_burst',
+                        'message': f"'{template.text}' jumped to {burst} logs in the last "
+                                   f"{BURST_WINDOW}s (was {template.previous_count})",
+                        'severity': 'high' if problems else 'medium',
+                        'template_id': template.id
+                    }))
+                elif not template.baseline and now - template.created_at <= NEW_TEMPLATE_SECONDS:
+                    found.append((template.count, {
+                        'type': 'new_template',
+                        'message': f"New log pattern '{template.text}' ({template.count} logs)",
+                        'severity': 'medium' if problems else 'low',
+                        'template_id': template.id
+                    }))
+        found.sort(key=lambda item: item[0], reverse=True)
+        return [pattern for _, pattern in found[:limit]]
+
+    def top(self, limit=50):
+        """Most frequent templates as dicts"""
+        with self.lock:
+            templates = sorted(self.templates.values(), key=lambda t: t.count, reverse=True)[:limit]
+            return [template.to_dict() for template in templates]
+
+    def stats(self):
+        with self.lock:
+            return {'templates': len(self.templates), 'records': self.records, 'evictions': self.evictions}
+
+
+def merge_top(answers, limit=50):
+    """One ``top`` list from those of several miners, joining templates with the same text"""
+    merged = {}
+    for templates in answers:
+        for template in templates:
+            same = merged.get(template['template'])
+            if same is None:
+                merged[template['template']] = dict(template, levels=dict(template['levels']),
+                                                    examples=list(template['examples']))
+                continue
+            same['count'] += template['count']
+            seen = [value for value in (same['first_seen'], template['first_seen']) if value is not None]
+            same['first_seen'] = min(seen) if seen else None
+            seen = [value for value in (same['last_seen'], template['last_seen']) if value is not None]
+            same['last_seen'] = max(seen) if seen else None
+            for level, count in template['levels'].items():
+                same['levels'][level] = same['levels'].get(level, 0) + count
+            same['examples'] = (same['examples'] + template['examples'])[:MAX_EXAMPLES]
+    return sorted(merged.values(), key=lambda template: template['count'], reverse=True)[:limit]
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Samples the stacks of selected threads every ``interval`` seconds.
+
+    Only threads whose name starts with one of ``thread_prefixes`` are
+    sampled (the ingest workers by default), and idle pool workers are
+    skipped. Stacks are counted in the folded format flame graph tools
+    read: frames root first, joined by ';'. Costs nothing while stopped.
+    """
+
+    def __init__(self, thread_prefixes=('ingest',), interval=0.005, max_stacks=10000):
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stop_event = None
+
+    @property
+    def running(self):
+        return self.stop_event is not None and not self.stop_event.is_set()
+
+    def start(self, interval=None):
+        with self.lock:
+            if self.running:
+                return
+            if interval:
+                self.interval = interval
+            self.stop_event = threading.Event()
+            self.started_at = time.time()
+        threading.Thread(target=self._run, args=(self.stop_event,), name='profiler', daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            if self.stop_event is not None:
+                self.stop_event.set()
+
+    def reset(self):
+        with self.lock:
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time() if self.running else None
+
+    def _run(self, stop_event):
+        me = threading.get_ident()
+        while not stop_event.wait(self.interval):
+            targets = {thread.ident for thread in threading.enumerate()
+                       if thread.name.startswith(self.thread_prefixes) and thread.ident != me}
+            frames = sys._current_frames()
+            sampled = []
+            for ident in targets:
+                frame = frames.get(ident)
+                if frame is not None and not self._idle(frame):
+                    sampled.append(self._fold(frame))
+            with self.lock:
+                for stack in sampled:
+                    if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                        self.stacks[stack] += 1
+                self.samples += 1
+
+    @staticmethod
+    def _idle(frame):
+        # A pool worker blocked on its queue, waiting for the next poll
+        return frame.f_code.co_name == '_worker' and frame.f_code.co_filename.endswith(
+            os.path.join('concurrent', 'futures', 'thread.py'))
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def folded(self):
+        """'stack count' lines, most frequent first"""
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self, limit=20):
+        """Self time by innermost function across the sampled threads"""
+        with self.lock:
+            leaves = Counter()
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            total = sum(self.stacks.values())
+            return {
+                'running': self.running,
+                'interval': self.interval,
+                'samples': self.samples,
+                'seconds': round(time.time() - self.started_at, 1) if self.started_at else 0,
+                'top': [{'frame': frame, 'samples': count, 'share': round(count / total, 4)}
+                        for frame, count in leaves.most_common(limit)]
+            }
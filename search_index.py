@@ -0,0 +1,474 @@
+import heapq
+import re
+import threading
+from array import array
+
+# Message tokens: lowercase runs of letters, digits and underscores
+TOKEN = re.compile(r'[a-z0-9_]+')
+MAX_TOKEN_LENGTH = 64
+MAX_TOKENS_PER_RECORD = 512
+
+# Query fields that match a whole record attribute instead of message tokens
+FIELDS = {'level', 'component', 'thread', 'source'}
+
+SEGMENT_SIZE = 1 << 16      # records per segment, so local ids fit in 16 bits
+BITMAP_BYTES = SEGMENT_SIZE // 8
+DENSE_THRESHOLD = 4096      # postings above this are stored as a bitmap
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+
+def field_term(field, value):
+    return f"{field}={str(value).lower()}"
+
+
+class Segment:
+    """Up to SEGMENT_SIZE records in arrival order with their posting lists.
+
+    Postings are local record ids. While the segment fills they are uint16
+    arrays; when it is sealed, lists holding more than DENSE_THRESHOLD ids
+    become fixed-size bitmaps, as Roaring bitmaps do, so a term costs at most
+    2 bytes per record or 8KB per segment.
+    """
+
+    def __init__(self, segment_id):
+        self.id = segment_id
+        self.sources = array('I')  # index into SearchIndex.source_ids
+        self.seqs = array('q')     # LogStore sequence number
+        self.epochs = array('q')
+        self.min_epoch = None
+        self.max_epoch = None
+        self.max_seqs = {}  # source index -> newest seq in this segment
+        self.postings = {}
+        self.sealed = False
+        self.memory = 0
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def add(self, source_index, seq, epoch_ms, terms):
+        local = len(self.seqs)
+        self.sources.append(source_index)
+        self.seqs.append(seq)
+        self.epochs.append(epoch_ms)
+        if self.min_epoch is None or epoch_ms < self.min_epoch:
+            self.min_epoch = epoch_ms
+        if self.max_epoch is None or epoch_ms > self.max_epoch:
+            self.max_epoch = epoch_ms
+        self.max_seqs[source_index] = seq
+        postings = self.postings
+        for term in terms:
+            ids = postings.get(term)
+            if ids is None:
+                ids = postings[term] = array('H')
+            ids.append(local)
+
+    def seal(self):
+        memory = 20 * len(self.seqs)
+        for term, ids in self.postings.items():
+            if len(ids) > DENSE_THRESHOLD:
+                bitmap = bytearray(BITMAP_BYTES)
+                for local in ids:
+                    bitmap[local >> 3] |= 1 << (local & 7)
+                self.postings[term] = bytes(bitmap)
+                memory += BITMAP_BYTES
+            else:
+                memory += 2 * len(ids)
+            memory += 80 + len(term)  # dict slot, key and container headers
+        self.sealed = True
+        self.memory = memory
+
+    def size(self, term):
+        """Upper bound on the records holding ``term``"""
+        ids = self.postings.get(term)
+        if ids is None:
+            return 0
+        return SEGMENT_SIZE if isinstance(ids, bytes) else len(ids)
+
+    def bits(self, term):
+        """Posting list of ``term`` as an int bitmap (bit i set = local id i)"""
+        ids = self.postings.get(term)
+        if ids is None:
+            return 0
+        if isinstance(ids, bytes):
+            return int.from_bytes(ids, 'little')
+        if len(ids) <= 32:
+            bits = 0
+            for local in ids:
+                bits |= 1 << local
+            return bits
+        bitmap = bytearray(BITMAP_BYTES)
+        for local in ids:
+            bitmap[local >> 3] |= 1 << (local & 7)
+        return int.from_bytes(bitmap, 'little')
+
+
+class Query:
+    """Boolean query over message tokens and record fields.
+
+    Words are ANDed unless joined by OR; NOT or a leading '-' negates,
+    parentheses group, "double quotes" match a phrase and field:value
+    (level, component, thread, source) matches a record attribute exactly.
+    """
+
+    LEXER = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+
+    def __init__(self, text):
+        self.tokens = self._lex(text)
+        self.position = 0
+        self.has_phrases = False
+        self.tree = self._or() if self.tokens else ('all',)
+        if self.position < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.position][1]}' in query")
+
+    def _lex(self, text):
+        tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = self.LEXER.match(text, position)
+            if not match or match.end() == position:
+                raise ValueError("Unbalanced quotes in query")
+            position = match.end()
+            if match.group(1):
+                tokens.append(('(', '('))
+            elif match.group(2):
+                tokens.append((')', ')'))
+            elif match.group(3) is not None:
+                tokens.append(('phrase', match.group(3)))
+            else:
+                word = match.group(4)
+                tokens.append(('op', word) if word in ('AND', 'OR', 'NOT') else ('word', word))
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _or(self):
+        node = self._and()
+        while self._peek() == ('op', 'OR'):
+            self.position += 1
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while True:
+            kind, value = self._peek()
+            if kind == 'op' and value == 'AND':
+                self.position += 1
+            elif kind not in ('word', 'phrase', '(') and (kind, value) != ('op', 'NOT'):
+                return node
+            node = ('and', node, self._not())
+
+    def _not(self):
+        kind, value = self._peek()
+        if (kind, value) == ('op', 'NOT'):
+            self.position += 1
+            return ('not', self._not())
+        if kind == 'word' and value == '-':
+            # -"a phrase" or -(group)
+            self.position += 1
+            return ('not', self._primary())
+        if kind == 'word' and value.startswith('-'):
+            self.tokens[self.position] = ('word', value[1:])
+            return ('not', self._primary())
+        return self._primary()
+
+    def _primary(self):
+        kind, value = self._peek()
+        if kind is None:
+            raise ValueError("Query ends unexpectedly")
+        self.position += 1
+        if kind == '(':
+            node = self._or()
+            if self._peek()[0] != ')':
+                raise ValueError("Missing ')' in query")
+            self.position += 1
+            return node
+        if kind == 'phrase':
+            return self._phrase(tokenize(value))
+        if kind == 'word':
+            field, _, field_value = value.partition(':')
+            if field_value and field.lower() in FIELDS:
+                return ('term', field_term(field.lower(), field_value))
+            return self._phrase(tokenize(value))
+        raise ValueError(f"Unexpected '{value}' in query")
+
+    def _phrase(self, words):
+        if not words:
+            return ('all',)
+        node = ('term', words[0])
+        for word in words[1:]:
+            node = ('and', node, ('term', word))
+        if len(words) == 1:
+            return node
+        # Postings only prove the words co-occur; the order is checked on the record
+        self.has_phrases = True
+        return ('phrase', words, node)
+
+    def evaluate(self, segment, count):
+        return self._evaluate(self.tree, segment, (1 << count) - 1)
+
+    def _evaluate(self, node, segment, universe):
+        kind = node[0]
+        if kind == 'term':
+            return segment.bits(node[1]) & universe
+        if kind == 'and':
+            # Rarest side first: an empty result skips the other side entirely
+            first, second = node[1], node[2]
+            if self._estimate(second, segment) < self._estimate(first, segment):
+                first, second = second, first
+            left = self._evaluate(first, segment, universe)
+            return left and left & self._evaluate(second, segment, universe)
+        if kind == 'or':
+            return self._evaluate(node[1], segment, universe) | self._evaluate(node[2], segment, universe)
+        if kind == 'not':
+            if self._has_phrase(node[1]):
+                # Phrase bitmaps are supersets, so their complement is unusable; matches() decides
+                return universe
+            return universe & ~self._evaluate(node[1], segment, universe)
+        if kind == 'phrase':
+            return self._evaluate(node[2], segment, universe)
+        return universe
+
+    def _has_phrase(self, node):
+        if node[0] == 'phrase':
+            return True
+        return any(self._has_phrase(child) for child in node[1:] if isinstance(child, tuple))
+
+    def _estimate(self, node, segment):
+        kind = node[0]
+        if kind == 'term':
+            return segment.size(node[1])
+        if kind == 'and':
+            return min(self._estimate(node[1], segment), self._estimate(node[2], segment))
+        if kind == 'or':
+            return self._estimate(node[1], segment) + self._estimate(node[2], segment)
+        if kind == 'phrase':
+            return self._estimate(node[2], segment)
+        return SEGMENT_SIZE
+
+    def matches(self, record):
+        """Re-check a candidate against its message when the query has phrases"""
+        if not self.has_phrases:
+            return True
+        words = tokenize(record.get('message', ''))
+        terms = set(words)
+        terms.add(field_term('level', record.get('level')))
+        terms.add(field_term('component', record.get('component') or 'Unknown'))
+        terms.add(field_term('thread', record.get('thread') or ''))
+        terms.add(field_term('source', record.get('source_id')))
+        return self._matches(self.tree, words, terms)
+
+    def _matches(self, node, words, terms):
+        kind = node[0]
+        if kind == 'term':
+            return node[1] in terms
+        if kind == 'and':
+            return self._matches(node[1], words, terms) and self._matches(node[2], words, terms)
+        if kind == 'or':
+            return self._matches(node[1], words, terms) or self._matches(node[2], words, terms)
+        if kind == 'not':
+            return not self._matches(node[1], words, terms)
+        if kind == 'phrase':
+            phrase = node[1]
+            size = len(phrase)
+            return any(words[i:i + size] == phrase for i in range(len(words) - size + 1))
+        return True
+
+
+class SearchIndex:
+    """In-process inverted index over ingested records, in time segments.
+
+    Records are indexed by message token, level, component, thread and
+    source, and point back at their LogStore by (source, seq):
+    ``fetch(source_id, seq)`` returns the stored record or None, and
+    ``first_seq(source_id)`` the oldest seq still stored, or None for a
+    removed source. Segments are searched newest first and a page stops as
+    soon as it is full, so common terms return quickly and rare ones only
+    touch their small postings. Segments whose records have all left their
+    stores are dropped, and once sealed segments exceed ``max_bytes`` the
+    oldest are evicted.
+    """
+
+    def __init__(self, fetch, first_seq, max_bytes=256 * 1024 * 1024):
+        self.fetch = fetch
+        self.first_seq = first_seq
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.segments = []
+        self.next_segment_id = 0
+        self.source_ids = []
+        self.source_indexes = {}
+        self.memory = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return sum(len(segment) for segment in list(self.segments))
+
+    def add(self, source_id, records, seqs):
+        """Index a batch of one source's records stored at the given seqs"""
+        with self.lock:
+            source_index = self.source_indexes.get(source_id)
+            if source_index is None:
+                source_index = self.source_indexes[source_id] = len(self.source_ids)
+                self.source_ids.append(source_id)
+            source = field_term('source', source_id)
+
+            for record, seq in zip(records, seqs):
+                segment = self.segments[-1] if self.segments else None
+                if segment is None or len(segment) >= SEGMENT_SIZE:
+                    segment = self._new_segment()
+                terms = set(tokenize(record['message'])[:MAX_TOKENS_PER_RECORD])
+                terms.add(field_term('level', record['level']))
+                terms.add(field_term('component', record.get('component') or 'Unknown'))
+                terms.add(field_term('thread', record.get('thread') or ''))
+                terms.add(source)
+                segment.add(source_index, seq, record['epoch_ms'], terms)
+
+    def _new_segment(self):
+        """Seal the current segment, evict if over budget and start another; caller holds ``lock``"""
+        if self.segments:
+            current = self.segments[-1]
+            current.seal()
+            self.memory += current.memory
+        while len(self.segments) > 1 and (self.memory > self.max_bytes or self._is_dead(self.segments[0])):
+            oldest = self.segments[0]
+            self.segments = self.segments[1:]
+            self.memory -= oldest.memory
+            self.evicted += len(oldest)
+        segment = Segment(self.next_segment_id)
+        self.next_segment_id += 1
+        self.segments = self.segments + [segment]
+        return segment
+
+    def _is_dead(self, segment):
+        """True when every record of ``segment`` was evicted from its store"""
+        for source_index, max_seq in list(segment.max_seqs.items()):
+            first = self.first_seq(self.source_ids[source_index])
+            if first is not None and max_seq >= first:
+                return False
+        return True
+
+    def search(self, query, source_ids=None, start_ms=None, end_ms=None, limit=100, cursor=None):
+        """Newest-first page of records matching ``query``.
+
+        ``cursor`` is the next cursor of the previous page. Returns
+        (records, next cursor or None, segments scanned).
+        """
+        records, _, next_cursor, scanned = self.search_page(query, source_ids, start_ms, end_ms, limit, cursor)
+        return records, next_cursor, scanned
+
+    def search_page(self, query, source_ids=None, start_ms=None, end_ms=None, limit=100, cursor=None):
+        """Like ``search``, plus the cursor that continues right after each record.
+
+        Returns (records, cursors, next cursor or None, segments scanned).
+        """
+        query = query if isinstance(query, Query) else Query(query or '')
+        if source_ids:
+            sources = None
+            for source_id in source_ids:
+                term = ('term', field_term('source', source_id))
+                sources = term if sources is None else ('or', sources, term)
+            query.tree = ('and', sources, query.tree)
+
+        before_segment, before_local = None, None
+        if cursor:
+            try:
+                before_segment, before_local = (int(part) for part in cursor.split('.'))
+            except ValueError:
+                raise ValueError("Invalid cursor")
+
+        results, cursors = [], []
+        scanned = 0
+        for segment in reversed(list(self.segments)):
+            if before_segment is not None and segment.id > before_segment:
+                continue
+            if segment.min_epoch is None or self._is_dead(segment):
+                continue
+            if (start_ms is not None and segment.max_epoch < start_ms) or \
+                    (end_ms is not None and segment.min_epoch > end_ms):
+                continue
+
+            scanned += 1
+            if segment.sealed:
+                count = len(segment)
+                bits = query.evaluate(segment, count)
+            else:
+                with self.lock:
+                    count = len(segment)
+                    bits = query.evaluate(segment, count)
+            if before_segment == segment.id:
+                bits &= (1 << before_local) - 1
+
+            while bits:
+                local = bits.bit_length() - 1
+                bits ^= 1 << local
+                epoch_ms = segment.epochs[local]
+                if (start_ms is not None and epoch_ms < start_ms) or (end_ms is not None and epoch_ms > end_ms):
+                    continue
+                record = self.fetch(self.source_ids[segment.sources[local]], segment.seqs[local])
+                if record is None or not query.matches(record):
+                    continue
+                if len(results) == limit:
+                    # One more match exists; the next page starts at it
+                    return results, cursors, f"{segment.id}.{local + 1}", scanned
+                results.append(record)
+                cursors.append(f"{segment.id}.{local}")
+        return results, cursors, None, scanned
+
+    def stats(self):
+        with self.lock:
+            return {
+                'records': sum(len(segment) for segment in self.segments),
+                'segments': len(self.segments),
+                'memory_bytes': self.memory,
+                'max_bytes': self.max_bytes,
+                'evicted_records': self.evicted
+            }
+
+
+def merge_pages(pages, limit):
+    """One newest-first page from the ``search_page`` answers of several indexes.
+
+    ``pages`` maps a name to (cursor it was asked with, records, cursors,
+    next cursor). Returns (records, {name: cursor to continue from}), the
+    latter leaving out indexes with nothing more to return.
+    """
+    streams = [[(-record['epoch_ms'], name, i) for i, record in enumerate(page[1])]
+               for name, page in pages.items()]
+    taken = {}
+    records = []
+    # Each answer is consumed from its start, so it resumes right after what was taken
+    for _, name, i in heapq.merge(*streams):
+        if len(records) == limit:
+            break
+        records.append(pages[name][1][i])
+        taken[name] = i + 1
+    cursors = {}
+    for name, (cursor, page_records, page_cursors, next_cursor) in pages.items():
+        count = taken.get(name, 0)
+        if count < len(page_records):
+            cursors[name] = page_cursors[count - 1] if count else cursor
+        elif next_cursor:
+            cursors[name] = next_cursor
+    return records, cursors
+
+
+def join_cursors(cursors):
+    """One cursor string from ``merge_pages``' {name: cursor}, or None when all are done"""
+    return ','.join(f"{name}:{cursor}" for name, cursor in cursors.items()) or None
+
+
+def split_cursors(cursor):
+    """{name: cursor} back from ``join_cursors``"""
+    cursors = {}
+    for part in cursor.split(','):
+        name, colon, position = part.rpartition(':')
+        if not colon or not name:
+            raise ValueError("Invalid cursor")
+        cursors[name] = position
+    return cursors
@@ -0,0 +1,280 @@
+import random
+import socket
+import threading
+import time
+
+import paramiko
+
+
+class StdoutChunks:
+    """Iterator over a command's stdout that closes the command when exhausted.
+
+    Unlike a generator, ``close()`` releases the channel even if iteration
+    never started (e.g. a HEAD request or a client that went away early).
+    """
+
+    def __init__(self, command, chunk_size):
+        self.command = command
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.command._closed:
+            raise StopIteration
+        try:
+            data = self.command.channel.recv(self.chunk_size)
+        except Exception:
+            self.close()
+            raise
+        if not data:
+            self.close()
+            raise StopIteration
+        return data
+
+    def close(self):
+        self.command.close()
+
+
+class PooledCommand:
+    """A command running on a channel borrowed from a pooled SSH session.
+
+    Mirrors the (stdin, stdout, stderr) files returned by
+    ``SSHClient.exec_command``; closing it hands the channel slot back to
+    the pool instead of tearing down the connection.
+    """
+
+    def __init__(self, pool, session, channel):
+        self._pool = pool
+        self._session = session
+        self.channel = channel
+        self.stdin = channel.makefile_stdin('wb')
+        self.stdout = channel.makefile('r')
+        self.stderr = channel.makefile_stderr('r')
+        self._closed = False
+
+    @property
+    def wire_bytes(self):
+        """Bytes the underlying SSH session has received from the network so far"""
+        return self._session.sock.received
+
+    def iter_stdout(self, chunk_size=64 * 1024):
+        """Stdout as it arrives, at most ``chunk_size`` bytes at a time, then close"""
+        return StdoutChunks(self, chunk_size)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.channel.close()
+        except Exception:
+            pass
+        self._pool._release(self._session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _CountingSocket:
+    """Socket wrapper counting received bytes, as seen on the wire (after SSH compression)"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.received = 0
+
+    def recv(self, size, *args):
+        data = self._sock.recv(size, *args)
+        self.received += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class _Session:
+    def __init__(self, client, sock):
+        self.client = client
+        self.sock = sock
+        self.transport = client.get_transport()
+        self.channels = 0
+        self.max_channels = None
+        self.last_used = time.time()
+
+    def is_healthy(self):
+        return self.transport is not None and self.transport.is_active() and self.transport.is_authenticated()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SSHConnectionPool:
+    """Keeps authenticated SSH transports alive per (host, username).
+
+    Every caller gets its own channel multiplexed over a shared transport, so
+    many log sources on one host cost a single handshake. Sessions are
+    health-checked before reuse, kept warm with keepalives, and reconnects to
+    a failing host back off exponentially. Callers asking for SSH-level
+    compression get separate, compressed sessions.
+    """
+
+    def __init__(self, keepalive_interval=15, max_channels_per_session=8,
+                 connect_timeout=10, idle_timeout=300,
+                 backoff_initial=1.0, backoff_max=60.0, port=22):
+        self.port = port
+        self.keepalive_interval = keepalive_interval
+        # OpenSSH refuses more than MaxSessions (default 10) channels per connection
+        self.max_channels_per_session = max_channels_per_session
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._sessions = {}  # (host, username, compress) -> [_Session]
+        self._failures = {}  # (host, username, compress) -> (attempts, retry_at)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def exec_command(self, host, username, password, command, timeout=None, compress=False):
+        """Run ``command`` on a pooled channel and return a PooledCommand."""
+        key = (host, username, compress)
+        for _ in range(3):
+            session = self._acquire(key, password)
+            try:
+                channel = session.transport.open_session(timeout=self.connect_timeout)
+                if timeout is not None:
+                    channel.settimeout(timeout)
+                channel.exec_command(command)
+            except paramiko.ChannelException:
+                # The server capped channels per connection below our limit
+                with self._lock:
+                    session.channels -= 1
+                    session.max_channels = max(1, session.channels)
+                continue
+            except Exception:
+                self._discard(key, session)
+                continue
+            return PooledCommand(self, session, channel)
+        raise paramiko.SSHException(f"Unable to open a channel to {host}")
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _acquire(self, key, password):
+        with self._key_lock(key):
+            with self._lock:
+                session = self._reserve(key)
+                if session:
+                    return session
+                attempts, retry_at = self._failures.get(key, (0, 0))
+                wait = retry_at - time.time()
+            if wait > 0:
+                raise paramiko.SSHException(
+                    f"Reconnect to {key[0]} backing off for {wait:.1f}s after {attempts} failed attempts")
+
+            try:
+                session = self._connect(key, password)
+            except Exception:
+                delay = min(self.backoff_max, self.backoff_initial * 2 ** attempts)
+                delay *= random.uniform(0.8, 1.2)
+                with self._lock:
+                    self._failures[key] = (attempts + 1, time.time() + delay)
+                raise
+
+            with self._lock:
+                self._failures.pop(key, None)
+                session.channels = 1
+                self._sessions.setdefault(key, []).append(session)
+            return session
+
+    def _reserve(self, key):
+        """Take a channel slot on a healthy session; caller holds ``_lock``."""
+        now = time.time()
+        sessions = self._sessions.get(key, [])
+        for session in list(sessions):
+            if not session.is_healthy():
+                sessions.remove(session)
+                session.close()
+                continue
+            limit = session.max_channels or self.max_channels_per_session
+            if session.channels < limit:
+                session.channels += 1
+                session.last_used = now
+                return session
+        return None
+
+    def _connect(self, key, password):
+        host, username, compress = key
+        sock = _CountingSocket(socket.create_connection((host, self.port), timeout=self.connect_timeout))
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(host, username=username, password=password,
+                           timeout=self.connect_timeout, sock=sock, compress=compress)
+        except Exception:
+            sock.close()
+            raise
+        client.get_transport().set_keepalive(self.keepalive_interval)
+        return _Session(client, sock)
+
+    def _release(self, session):
+        with self._lock:
+            session.channels = max(0, session.channels - 1)
+            session.last_used = time.time()
+            self._reap_idle()
+
+    def _discard(self, key, session):
+        with self._lock:
+            sessions = self._sessions.get(key, [])
+            if session in sessions:
+                sessions.remove(session)
+        session.close()
+
+    def _reap_idle(self):
+        """Close sessions nobody has used for a while; caller holds ``_lock``."""
+        cutoff = time.time() - self.idle_timeout
+        for key, sessions in list(self._sessions.items()):
+            for session in list(sessions):
+                if session.channels == 0 and session.last_used < cutoff:
+                    sessions.remove(session)
+                    session.close()
+            if not sessions:
+                del self._sessions[key]
+
+    def close(self, host, username):
+        with self._lock:
+            sessions = []
+            for compress in (False, True):
+                sessions += self._sessions.pop((host, username, compress), [])
+                self._failures.pop((host, username, compress), None)
+        for session in sessions:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = [s for group in self._sessions.values() for s in group]
+            self._sessions.clear()
+            self._failures.clear()
+        for session in sessions:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                f"{username}@{host}" + (" (compressed)" if compress else ""): {
+                    'sessions': len(sessions),
+                    'channels': sum(s.channels for s in sessions),
+                    'bytes_received': sum(s.sock.received for s in sessions)
+                }
+                for (host, username, compress), sessions in self._sessions.items()
+            }
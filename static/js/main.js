@@ -3,6 +3,8 @@ const socket = io();
 
 // Constants
 const MAX_STORED_POINTS = 100;  // Maximum number of points to show on the chart
+const CHART_REFRESH_MS = 2000;  // How often the chart reloads its series from the server
+const MAX_SOURCE_LOGS = 10000;  // Maximum number of logs kept in the browser per source
 const logSourceForm = document.getElementById('logSourceForm');
 const logSourcesList = document.getElementById('logSourcesList');
 
@@ -36,6 +38,7 @@ let datasets = {
     DEBUG: []
 };
 let timeLabels = [];
+let chartSpan = 300;  // Seconds of activity shown on the chart
 
 // Update stats display
 function updateStats() {
@@ -102,33 +105,35 @@ function resetData() {
     displayLogs();
 }
 
-// Update chart with new log data
-function updateChart(log) {
-    if (!log || !log.timestamp) return;
-
-    const time = log.timestamp.split('T')[1].split(',')[0];
-    const level = log.level === 'WARN' ? 'WARN' : log.level;
-    
-    if (timeLabels.length === 0 || timeLabels[timeLabels.length - 1] !== time) {
-        timeLabels.push(time);
-        datasets.ERROR.push(0);
-        datasets.WARN.push(0);
-        datasets.INFO.push(0);
-        datasets.DEBUG.push(0);
-        
-        if (timeLabels.length > MAX_STORED_POINTS) {
-            timeLabels.shift();
-            datasets.ERROR.shift();
-            datasets.WARN.shift();
-            datasets.INFO.shift();
-            datasets.DEBUG.shift();
+// Load the chart's series from the server's rollups; the cost is per point, not per log
+let chartRequest = 0;
+async function loadTimeseries() {
+    const request = ++chartRequest;
+    const params = new URLSearchParams({ points: MAX_STORED_POINTS, span: chartSpan });
+    if (currentSourceId) {
+        params.set('source_id', currentSourceId);
+    }
+    try {
+        const response = await fetch(`/api/timeseries?${params}`);
+        if (!response.ok) {
+            throw new Error('Failed to load log activity');
         }
+        const result = await response.json();
+        if (request !== chartRequest) return;  // a newer request (e.g. another source) won
+
+        const daily = result.step_ms >= 60 * 60 * 1000;
+        timeLabels = result.timestamps.map(ms => {
+            const date = new Date(ms);
+            return daily ? `${date.getMonth() + 1}/${date.getDate()} ${date.toTimeString().slice(0, 5)}`
+                : date.toTimeString().slice(0, 8);
+        });
+        Object.keys(datasets).forEach(level => {
+            datasets[level] = result.series[level] || timeLabels.map(() => 0);
+        });
+        updateChartData();
+    } catch (error) {
+        console.error('Error loading log activity:', error);
     }
-    
-    const lastIndex = datasets[level].length - 1;
-    datasets[level][lastIndex]++;
-    
-    updateChartData();
 }
 
 // Update chart data
@@ -373,8 +378,8 @@ async function downloadLogLines(direction) {
 // Add event listeners for the download buttons
 document.getElementById('downloadPrevious').addEventListener('click', () => downloadLogLines('previous'));
 document.getElementById('downloadNext').addEventListener('click', () => downloadLogLines('next'));
-// Add new log entry
-function addLogEntry(log) {
+// Add new log entry; pass render=false and call scheduleRender() when adding many
+function addLogEntry(log, render = true) {
     if (!log || !log.source_id) return;
     
     // Initialize source data if needed
@@ -394,12 +399,46 @@ function addLogEntry(log) {
     if (!logs) return;  // Skip if source logs not found
     
     logs.unshift(log);
+    if (logs.length > MAX_SOURCE_LOGS) {
+        logs.length = MAX_SOURCE_LOGS;
+    }
     
     // Update UI only if this is the current source or no source is selected
     if (!currentSourceId || currentSourceId === log.source_id) {
+        if (render) {
+            updateStats();
+            displayLogs();
+        } else {
+            renderPending = true;
+        }
+    }
+}
+
+// Redraw stats, chart and table at most once per animation frame
+let renderPending = false;
+let renderScheduled = false;
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        if (!renderPending) return;
+        renderPending = false;
         updateStats();
-        updateChart(log);
         displayLogs();
+    });
+}
+
+// Ask the server to stream (or stop streaming) logs of these sources
+function subscribeSources(sourceIds) {
+    if (sourceIds.length) {
+        socket.emit('subscribe', { source_ids: sourceIds });
+    }
+}
+
+function unsubscribeSources(sourceIds) {
+    if (sourceIds.length) {
+        socket.emit('unsubscribe', { source_ids: sourceIds });
     }
 }
 
@@ -564,7 +603,7 @@ const logActivityChart = new Chart(ctx, {
                 },
                 ticks: {
                     color: 'rgba(255, 255, 255, 0.7)',
-                    stepSize: 1
+                    precision: 0
                 }
             }
         },
@@ -586,10 +625,37 @@ const logActivityChart = new Chart(ctx, {
 // Socket.IO event handlers
 socket.on('connect', () => {
     console.log('Connected to server');
+    // Subscriptions do not survive a reconnect
+    subscribeSources(Array.from(activeSources));
+});
+
+socket.on('log_batch', (frame, ack) => {
+    frame.records.forEach(log => addLogEntry(log, false));
+    scheduleRender();
+    // Acknowledge so the server sends the next batch
+    if (ack) ack();
 });
 
-socket.on('log_update', (log) => {
-    addLogEntry(log);
+socket.on('log_dropped', (summary) => {
+    // The server skipped batches we could not keep up with; keep the counts right
+    const stats = sourceStats.get(summary.source_id);
+    if (!stats) return;
+    Object.entries(summary.levels).forEach(([level, count]) => {
+        stats[level] = (stats[level] || 0) + count;
+    });
+    console.warn(`Skipped ${summary.count} logs from source ${summary.source_id}`);
+    renderPending = true;
+    scheduleRender();
+});
+
+// Rate alerts are pushed as they fire; show them without waiting for the insights poll
+socket.on('anomaly', (alert) => {
+    console.warn('Anomaly:', alert.message);
+    const anomaliesList = document.getElementById('anomaliesList');
+    anomaliesList.prepend(createInsightItem(alert));
+    while (anomaliesList.children.length > 10) {
+        anomaliesList.lastElementChild.remove();
+    }
 });
 
 // Update source selection UI
@@ -632,6 +698,7 @@ function addLogSourceToList(source) {
         updateSourceSelection();
         updateStats();
         displayLogs();
+        loadTimeseries();
     });
     
     // Add remove button handler
@@ -643,6 +710,7 @@ function addLogSourceToList(source) {
             });
             if (response.ok) {
                 sourceElement.remove();
+                unsubscribeSources([source.id]);
                 activeSources.delete(source.id);
                 sourceStats.delete(source.id);
                 sourceLogs.delete(source.id);
@@ -658,6 +726,7 @@ function addLogSourceToList(source) {
                     updateStats();
                     displayLogs();
                 }
+                loadTimeseries();
             }
         } catch (error) {
             console.error('Error removing log source:', error);
@@ -700,6 +769,7 @@ async function loadLogSources() {
             resetSourceData(source.id);
             addLogSourceToList(source);
         });
+        subscribeSources(Array.from(activeSources));
         
         // Reset data if no sources
         if (activeSources.size === 0) {
@@ -743,6 +813,7 @@ logSourceForm.addEventListener('submit', async (e) => {
             if (existingElement) {
                 existingElement.remove();
                 const oldSourceId = existingElement.dataset.sourceId;
+                unsubscribeSources([oldSourceId]);
                 activeSources.delete(oldSourceId);
                 sourceStats.delete(oldSourceId);
                 sourceLogs.delete(oldSourceId);
@@ -755,6 +826,7 @@ logSourceForm.addEventListener('submit', async (e) => {
             activeSources.add(source.id);
             resetSourceData(source.id);
             addLogSourceToList(source);
+            subscribeSources([source.id]);
             logSourceForm.reset();
             
             // Select the new source
@@ -764,9 +836,11 @@ logSourceForm.addEventListener('submit', async (e) => {
             // Load initial logs for the new source
             const logsResponse = await fetch(`/api/logs/${source.id}`);
             if (logsResponse.ok) {
-                const logs = await logsResponse.json();
-                logs.forEach(log => addLogEntry(log));
+                const { logs } = await logsResponse.json();
+                logs.forEach(log => addLogEntry(log, false));
+                scheduleRender();
             }
+            loadTimeseries();
         } else {
             const error = await response.json();
             alert(`Error adding log source: ${error.error}`);
@@ -803,27 +877,11 @@ function updateInsights() {
             
             // Update anomalies
             const anomaliesList = document.getElementById('anomaliesList');
-            anomaliesList.innerHTML = insights.anomalies.map(anomaly => `
-                <div class="insight-item ${anomaly.severity}">
-                    <div class="message">${anomaly.message}</div>
-                    <div class="meta">
-                        <span>Severity: ${anomaly.severity}</span>
-                        <span>${anomaly.type}</span>
-                    </div>
-                </div>
-            `).join('');
+            anomaliesList.replaceChildren(...insights.anomalies.map(createInsightItem));
             
             // Update patterns
             const patternsList = document.getElementById('patternsList');
-            patternsList.innerHTML = insights.patterns.map(pattern => `
-                <div class="insight-item ${pattern.severity}">
-                    <div class="message">${pattern.message}</div>
-                    <div class="meta">
-                        <span>Severity: ${pattern.severity}</span>
-                        <span>${pattern.type}</span>
-                    </div>
-                </div>
-            `).join('');
+            patternsList.replaceChildren(...insights.patterns.map(createInsightItem));
             
             // Update summary
             const summaryList = document.getElementById('summaryList');
@@ -852,6 +910,24 @@ function updateInsights() {
         .catch(error => console.error('Error fetching insights:', error));
 }
 
+// Insight entry built with textContent, since pattern and anomaly messages quote the logs
+function createInsightItem(entry) {
+    const item = document.createElement('div');
+    item.className = `insight-item ${entry.severity}`;
+    const message = document.createElement('div');
+    message.className = 'message';
+    message.textContent = entry.message;
+    const meta = document.createElement('div');
+    meta.className = 'meta';
+    const severity = document.createElement('span');
+    severity.textContent = `Severity: ${entry.severity}`;
+    const type = document.createElement('span');
+    type.textContent = entry.type;
+    meta.append(severity, type);
+    item.append(message, meta);
+    return item;
+}
+
 // Update insights every 30 seconds
 setInterval(updateInsights, 30000);
 
@@ -940,15 +1016,26 @@ document.addEventListener('DOMContentLoaded', async () => {
                 resetSourceData(source.id);
                 addLogSourceToList(source);
             });
+            subscribeSources(Array.from(activeSources));
         }
     } catch (error) {
         console.error('Error loading log sources:', error);
     }
     
+    // The chart survives reloads: its history lives on the server
+    loadTimeseries();
+    setInterval(loadTimeseries, CHART_REFRESH_MS);
+
     // Initialize event listeners
     setupEventListeners();
 });
 
+// Change the time range shown on the chart
+document.getElementById('chartRange').addEventListener('change', (e) => {
+    chartSpan = parseInt(e.target.value);
+    loadTimeseries();
+});
+
 // Update insights when tab is shown
 document.getElementById('insights-tab').addEventListener('shown.bs.tab', () => {
     updateInsights();
@@ -0,0 +1,296 @@
+import threading
+import time
+from array import array
+from collections import Counter
+
+# Rollup resolutions: (name, bucket width in ms, buckets kept)
+TIERS = (
+    ('1s', 1000, 3600),       # an hour
+    ('1m', 60000, 1440),      # a day
+    ('1h', 3600000, 720),     # thirty days
+)
+
+# Distinct (level, component) series per source; the rest count as OTHER
+MAX_COMPONENT_SERIES = 256
+OTHER = 'Other'
+
+
+def per_bucket(counts):
+    """{(epoch_ms, level, component): count} summed into buckets of the finest tier.
+
+    ``add_grouped`` folds them in the same as ``counts``, and they are fewer to send.
+    """
+    width = TIERS[0][1]
+    buckets = Counter()
+    for (epoch_ms, level, component), count in counts.items():
+        buckets[(epoch_ms - epoch_ms % width, level, component)] += count
+    return buckets
+
+
+class Ring:
+    """Counts for the last ``size`` buckets of one resolution in a fixed array.
+
+    ``head`` is the newest bucket written; slots are cleared lazily as it
+    moves forward, so a series that goes quiet costs nothing to keep.
+    """
+
+    __slots__ = ('size', 'counts', 'head')
+
+    def __init__(self, size):
+        self.size = size
+        self.counts = array('I', bytes(4 * size))
+        self.head = None
+
+    def add(self, bucket, count):
+        if self.head is None:
+            self.head = bucket
+        elif bucket > self.head:
+            self._clear(self.head + 1, bucket)
+            self.head = bucket
+        elif bucket <= self.head - self.size:
+            return  # older than anything kept
+        self.counts[bucket % self.size] += count
+
+    def _clear(self, first, last):
+        if last - first + 1 >= self.size:
+            self.counts = array('I', bytes(4 * self.size))
+            return
+        start, end = first % self.size, last % self.size
+        if start <= end:
+            self.counts[start:end + 1] = array('I', bytes(4 * (end - start + 1)))
+        else:
+            self.counts[start:] = array('I', bytes(4 * (self.size - start)))
+            self.counts[:end + 1] = array('I', bytes(4 * (end + 1)))
+
+    def window(self, first, last):
+        """Counts for buckets first..last inclusive, zero where nothing is kept"""
+        length = last - first + 1
+        if self.head is None or last <= self.head - self.size or first > self.head:
+            return array('I', bytes(4 * length))
+        lead = max(0, self.head - self.size + 1 - first)
+        trail = max(0, last - self.head)
+        start, end = (first + lead) % self.size, (last - trail) % self.size
+        if start <= end:
+            kept = self.counts[start:end + 1]
+        else:
+            kept = self.counts[start:] + self.counts[:end + 1]
+        if lead:
+            kept = array('I', bytes(4 * lead)) + kept
+        if trail:
+            kept += array('I', bytes(4 * trail))
+        return kept
+
+    def merge(self, other):
+        """Add another ring's counts (same size), bucket by bucket"""
+        if other.head is None:
+            return
+        first = other.head - self.size + 1
+        for offset, count in enumerate(other.window(first, other.head)):
+            if count:
+                self.add(first + offset, count)
+
+    def subtract(self, other):
+        """Remove another ring's counts (same size), bucket by bucket"""
+        if other.head is None or self.head is None:
+            return
+        first = max(other.head, self.head) - self.size + 1
+        theirs = other.window(first, other.head)
+        for offset, count in enumerate(theirs):
+            if count:
+                bucket = first + offset
+                if bucket > self.head - self.size:
+                    slot = bucket % self.size
+                    self.counts[slot] = max(0, self.counts[slot] - count)
+
+
+class Series:
+    """One Ring per entry in TIERS"""
+
+    __slots__ = ('rings',)
+
+    def __init__(self):
+        self.rings = [Ring(size) for _, _, size in TIERS]
+
+    def add(self, epoch_ms, count):
+        for ring, (_, width, _) in zip(self.rings, TIERS):
+            ring.add(epoch_ms // width, count)
+
+    def merge(self, other):
+        for ours, theirs in zip(self.rings, other.rings):
+            ours.merge(theirs)
+
+    def subtract(self, other):
+        for ours, theirs in zip(self.rings, other.rings):
+            ours.subtract(theirs)
+
+
+class TimeSeriesStore:
+    """Record counts over event time, rolled up per source, level and component.
+
+    Series are kept per (source, level), per (source, level, component) and
+    per level across all sources, so a chart reads a few fixed-size arrays
+    no matter how many records were ingested.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.levels = {}       # level -> Series, every source
+        self.sources = {}      # source_id -> {level: Series}
+        self.components = {}   # source_id -> {(level, component): Series}
+        self.newest_ms = None
+
+    def add_records(self, source_id, records):
+        """Fold a batch of parsed records (with epoch_ms) into the rollups"""
+        # Collapse the batch first: records in one poll share a few seconds
+        batch = Counter((record['epoch_ms'], record['level'], record.get('component') or 'Unknown')
+                        for record in records if record.get('epoch_ms') is not None)
+        self.add_grouped(source_id, batch)
+
+    def add_grouped(self, source_id, counts):
+        """Fold a batch already counted as {(epoch_ms, level, component): count}, e.g. by a parse worker"""
+        if not counts:
+            return
+        with self.lock:
+            by_level = self.sources.setdefault(source_id, {})
+            by_component = self.components.setdefault(source_id, {})
+            for (epoch_ms, level, component), count in counts.items():
+                key = (level, component)
+                if key not in by_component and len(by_component) >= MAX_COMPONENT_SERIES:
+                    key = (level, OTHER)
+                for series_map, series_key in ((self.levels, level), (by_level, level), (by_component, key)):
+                    series = series_map.get(series_key)
+                    if series is None:
+                        series = series_map[series_key] = Series()
+                    series.add(epoch_ms, count)
+            newest = max(epoch_ms for epoch_ms, _, _ in counts)
+            if self.newest_ms is None or newest > self.newest_ms:
+                self.newest_ms = newest
+
+    def export_source(self, source_id):
+        """A source's series as (header, [ring bytes]) for a checkpoint"""
+        series, parts = [], []
+        with self.lock:
+            for key, item in self.sources.get(source_id, {}).items():
+                series.append(['level', key, [ring.head for ring in item.rings]])
+                parts.extend(ring.counts.tobytes() for ring in item.rings)
+            for key, item in self.components.get(source_id, {}).items():
+                series.append(['component', list(key), [ring.head for ring in item.rings]])
+                parts.extend(ring.counts.tobytes() for ring in item.rings)
+        return {'series': series}, parts
+
+    def load_source(self, source_id, header, parts):
+        """Restore a source's series from ``export_source`` and add them to the all-source totals"""
+        parts = iter(parts)
+        with self.lock:
+            by_level = self.sources.setdefault(source_id, {})
+            by_component = self.components.setdefault(source_id, {})
+            for kind, key, heads in header['series']:
+                series = Series()
+                for ring, head in zip(series.rings, heads):
+                    counts = array('I', next(parts))
+                    if len(counts) == ring.size:  # dropped if TIERS changed since
+                        ring.head, ring.counts = head, counts
+                if kind == 'level':
+                    by_level[key] = series
+                    self.levels.setdefault(key, Series()).merge(series)
+                    head = series.rings[0].head
+                    if head is not None and (self.newest_ms is None or head * TIERS[0][1] > self.newest_ms):
+                        self.newest_ms = head * TIERS[0][1]
+                else:
+                    by_component[tuple(key)] = series
+
+    def remove_source(self, source_id):
+        """Forget a source and take its counts out of the all-source series"""
+        with self.lock:
+            self.components.pop(source_id, None)
+            for level, series in self.sources.pop(source_id, {}).items():
+                total = self.levels.get(level)
+                if total is not None:
+                    total.subtract(series)
+
+    def query(self, start_ms=None, end_ms=None, points=300, source_ids=None, levels=None,
+              component=None, group_by='level', span_ms=3600 * 1000):
+        """Downsampled counts for ``start_ms``..``end_ms`` in at most ``points`` points.
+
+        ``end_ms`` defaults to the newest record seen and ``start_ms`` to
+        ``span_ms`` before it, so charts follow the logs' own clock. Uses
+        the finest resolution that still holds ``start_ms`` and sums buckets
+        into points, so the cost depends on the range and point count,
+        never on the number of records. ``group_by`` is 'level' or
+        'component'.
+        """
+        if group_by not in ('level', 'component'):
+            raise ValueError("group_by must be 'level' or 'component'")
+        if points < 1:
+            raise ValueError('points must be positive')
+
+        with self.lock:
+            newest = self.newest_ms
+            if end_ms is None:
+                end_ms = newest if newest is not None else int(time.time() * 1000)
+            if start_ms is None:
+                start_ms = end_ms - span_ms
+            if start_ms > end_ms:
+                raise ValueError("'from' must not be after 'to'")
+
+            reference = max(end_ms, newest or end_ms)
+            for tier, (name, width, size) in enumerate(TIERS):
+                if start_ms // width > reference // width - size:
+                    break
+
+            # Nothing is kept outside the coarsest ring, so never walk past it
+            newest_bucket = reference // width
+            last = min(end_ms // width, newest_bucket)
+            first = min(max(start_ms // width, newest_bucket - size + 1), last)
+            step = -(-(last - first + 1) // points)
+            while True:
+                # Align to the step so live refreshes keep the same points
+                aligned = first - first % step
+                count = -(-(last - aligned + 1) // step)
+                if count <= points:
+                    break
+                step += 1
+            first = aligned
+            last = first + count * step - 1
+
+            groups = {}
+            for key, series in self._select(source_ids, levels, component, group_by):
+                window = series.rings[tier].window(first, last)
+                totals = groups.get(key)
+                if totals is None:
+                    totals = groups[key] = [0] * count
+                for point in range(count):
+                    totals[point] += sum(window[point * step:(point + 1) * step])
+
+        return {
+            'resolution': name,
+            'step_ms': step * width,
+            'from': first * width,
+            'to': (last + 1) * width,
+            'timestamps': [(first + point * step) * width for point in range(count)],
+            'series': groups
+        }
+
+    def _select(self, source_ids, levels, component, group_by):
+        """(group key, Series) pairs matching the filters; caller holds the lock"""
+        if group_by == 'level' and component is None:
+            if not source_ids:
+                pairs = self.levels.items()
+            else:
+                pairs = [item for source_id in source_ids for item in self.sources.get(source_id, {}).items()]
+            return [(level, series) for level, series in pairs if not levels or level in levels]
+
+        selected = []
+        for source_id in (source_ids or list(self.components)):
+            for (level, name), series in self.components.get(source_id, {}).items():
+                if (levels and level not in levels) or (component is not None and name != component):
+                    continue
+                selected.append((level if group_by == 'level' else name, series))
+        return selected
+
+    def stats(self):
+        with self.lock:
+            count = len(self.levels) + sum(len(s) for s in self.sources.values()) + \
+                sum(len(s) for s in self.components.values())
+        per_series = sum(size for _, _, size in TIERS) * 4
+        return {'series': count, 'memory_bytes': count * per_series}